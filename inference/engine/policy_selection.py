@@ -8,16 +8,20 @@ Supports LLM-generated models through Generalized Notation Notation (GNN) integr
 (avoiding confusion with Graph Neural Networks, sometimes referred to as GMN in this codebase).
 """
 
-import itertools
 import logging
+import math
+import weakref
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import List, Optional, Union, Dict, Any, Tuple
+from typing import List, Optional, Sequence, Union, Dict, Any, Tuple
 
 import torch
 import torch.nn.functional as F
 import numpy as np
 
+from ._efe_numba import NUMBA_AVAILABLE, discrete_efe_batch
 from .active_inference import InferenceAlgorithm, InferenceConfig, VariationalMessagePassing
 from .generative_model import (
     DiscreteGenerativeModel,
@@ -28,6 +32,9 @@ from .generative_model import (
 
 logger = logging.getLogger(__name__)
 
+# Target footprint of one chunk's gathered (S, S, chunk, L) transitions, roughly an L2 cache
+_POLICY_CHUNK_BYTES = 2 * 1024 * 1024
+
 
 @dataclass
 class PolicyConfig:
@@ -51,8 +58,12 @@ class PolicyConfig:
     use_habits: bool = False
     use_gpu: bool = True
     dtype: torch.dtype = torch.float32
+    compute_dtype: torch.dtype = torch.bfloat16  # GPU rollout precision (G only ranks policies)
+    accum_dtype: torch.dtype = torch.float32  # GPU accumulation precision for G
     eps: float = 1e-16
     use_sampling: bool = False
+    compile_kernels: bool = False  # torch.compile the specialized EFE rollout step
+    policy_chunk_size: Optional[int] = 1024  # Policies per rollout chunk; None sizes to cache
     num_samples: int = 100
     enable_pruning: bool = True
     pruning_threshold: float = 0.01
@@ -65,6 +76,76 @@ class PolicyConfig:
     gnn_metadata: Optional[Dict[str, Any]] = field(default_factory=dict)
 
 
+def _preferences_per_timestep(preferences: torch.Tensor, num_steps: int) -> torch.Tensor:
+    """Resolve preferences to one column per planning step, shape (num_obs, num_steps).
+    
+    Time-dependent preferences use column t while it exists and fall back to
+    column 0 past the end; static preferences are broadcast across all steps.
+    """
+    if preferences.dim() == 1:
+        return preferences.unsqueeze(1).expand(-1, num_steps)
+    if preferences.shape[1] >= num_steps:
+        return preferences[:, :num_steps]
+    steps = torch.arange(num_steps, device=preferences.device)
+    return preferences[:, steps.masked_fill(steps >= preferences.shape[1], 0)]
+
+
+def _policy_action_batch(policies: Union[Sequence["Policy"], torch.Tensor]) -> torch.Tensor:
+    """Stack equal-length policies into an action tensor of shape (batch, policy_length)."""
+    if isinstance(policies, torch.Tensor):
+        return policies if policies.dim() == 2 else policies.unsqueeze(1)
+    return torch.stack([policy.actions for policy in policies])
+
+
+def _gumbel_noise(logits: torch.Tensor) -> torch.Tensor:
+    """Standard Gumbel noise; argmax(logits + noise) samples from softmax(logits)."""
+    return -torch.empty_like(logits).exponential_().log()
+
+
+def _efe_step_full(
+    states: torch.Tensor,
+    A: torch.Tensor,
+    H_per_state: torch.Tensor,
+    pref_t: torch.Tensor,
+    epistemic_weight: float,
+    pragmatic_weight: float,
+    eps: float,
+) -> torch.Tensor:
+    """Weighted G contribution of one rollout step for a batch of policies."""
+    observations = states @ A.T
+    obs_entropy = -torch.sum(observations * torch.log(observations + eps), dim=1)
+    epistemic = obs_entropy - states @ H_per_state
+    return epistemic_weight * epistemic - pragmatic_weight * (observations @ pref_t)
+
+
+def _efe_step_epistemic(
+    states: torch.Tensor,
+    A: torch.Tensor,
+    H_per_state: torch.Tensor,
+    pref_t: torch.Tensor,
+    epistemic_weight: float,
+    pragmatic_weight: float,
+    eps: float,
+) -> torch.Tensor:
+    """Rollout step contribution when only the information gain term is active."""
+    observations = states @ A.T
+    obs_entropy = -torch.sum(observations * torch.log(observations + eps), dim=1)
+    return epistemic_weight * (obs_entropy - states @ H_per_state)
+
+
+def _efe_step_pragmatic(
+    states: torch.Tensor,
+    A: torch.Tensor,
+    H_per_state: torch.Tensor,
+    pref_t: torch.Tensor,
+    epistemic_weight: float,
+    pragmatic_weight: float,
+    eps: float,
+) -> torch.Tensor:
+    """Rollout step contribution when only the preference term is active."""
+    return -pragmatic_weight * ((states @ A.T) @ pref_t)
+
+
 class Policy:
     """Represents a sequence of actions (policy) following PyMDP conventions."""
 
@@ -139,7 +220,7 @@ class PolicySelector(ABC):
     @abstractmethod
     def compute_expected_free_energy(
         self,
-        policy: Policy,
+        policy: Union[Policy, torch.Tensor],
         beliefs: torch.Tensor,
         generative_model: GenerativeModel,
         preferences: Optional[torch.Tensor] = None,
@@ -147,6 +228,60 @@ class PolicySelector(ABC):
         """Compute expected free energy for a policy."""
         pass
 
+    def compute_expected_free_energy_batched(
+        self,
+        policies: Union[Sequence[Policy], torch.Tensor],
+        beliefs: torch.Tensor,
+        generative_model: GenerativeModel,
+        preferences: Optional[torch.Tensor] = None,
+    ) -> torch.Tensor:
+        """Compute expected free energy for a batch of policies.
+        
+        Args:
+            policies: Equal-length policies, or their actions as a (batch, length) tensor
+            beliefs: Beliefs per policy, shape (batch, num_states), or one shared
+                (num_states,) vector
+            generative_model: Generative model
+            preferences: Prior preferences (uses model's if None)
+        
+        Returns:
+            G values, shape (batch,)
+        """
+        actions = _policy_action_batch(policies)
+        if beliefs.dim() == 1:
+            beliefs = beliefs.expand(actions.shape[0], -1)
+        G = [
+            self.compute_expected_free_energy(row, row_beliefs, generative_model, preferences)[0]
+            for row, row_beliefs in zip(actions, beliefs)
+        ]
+        if not G:
+            return torch.empty(0, device=self.device, dtype=self.config.dtype)
+        return torch.stack(G)
+
+    def select_policy_batched(
+        self,
+        beliefs: torch.Tensor,
+        generative_model: GenerativeModel,
+        preferences: Optional[torch.Tensor] = None,
+    ) -> torch.Tensor:
+        """Probabilities of the next action for a batch of beliefs.
+        
+        Args:
+            beliefs: Beliefs, shape (batch, num_states)
+            generative_model: Generative model
+            preferences: Prior preferences (uses model's if None)
+        
+        Returns:
+            Next-action probabilities, shape (batch, num_actions)
+        """
+        probs = torch.zeros(
+            beliefs.shape[0], generative_model.dims.num_actions, device=self.device
+        )
+        for i, row_beliefs in enumerate(beliefs):
+            policy, _ = self.select_policy(row_beliefs, generative_model, preferences)
+            probs[i, int(policy[0]) if len(policy) > 0 else 0] = 1.0
+        return probs
+
 
 class DiscreteExpectedFreeEnergy(PolicySelector):
     """Expected free energy calculation following PyMDP's formulation.
@@ -176,23 +311,74 @@ class DiscreteExpectedFreeEnergy(PolicySelector):
         self.use_states_info_gain = config.epistemic_weight > 0.0
         self.use_param_info_gain = config.use_param_info_gain
         self.precision_parameter = config.exploration_constant
+        
+        # Cached (model A, A._version, H_per_state); A is constant across an episode
+        self._entropy_cache: Optional[Tuple[torch.Tensor, int, torch.Tensor]] = None
+        
+        # Exhaustive policy enumerations, keyed on num_actions
+        self._policy_cache: Dict[int, torch.Tensor] = {}
+        
+        # float32 rollouts on GPU may use TF32 tensor cores; only the ordering of G matters
+        if self.device.type == "cuda" and config.compute_dtype == torch.float32:
+            torch.backends.cuda.matmul.allow_tf32 = True
+        
+        # Specialize the rollout step on the active terms once, not on every timestep
+        if self.use_states_info_gain and self.use_utility:
+            efe_step = _efe_step_full
+        elif self.use_states_info_gain:
+            efe_step = _efe_step_epistemic
+        elif self.use_utility:
+            efe_step = _efe_step_pragmatic
+        else:
+            efe_step = None
+        if efe_step is not None and config.compile_kernels:
+            efe_step = torch.compile(efe_step, dynamic=True)
+        self._efe_step = efe_step
+        
+        # Tiny CPU models are dominated by PyTorch dispatch; use the Numba kernel there
+        self._use_numba_kernel = (
+            efe_step is not None
+            and NUMBA_AVAILABLE
+            and self.device.type == "cpu"
+            and config.dtype in (torch.float32, torch.float64)
+        )
 
     def enumerate_policies(self, num_actions: int) -> List[Policy]:
         """Enumerate all possible policies following PyMDP conventions."""
+        return [
+            self._make_policy(actions)
+            for actions in self._enumerate_policy_actions(num_actions).clone()
+        ]
+    
+    def _enumerate_policy_actions(self, num_actions: int) -> torch.Tensor:
+        """Policy actions as an int tensor of shape (num_policies, policy_length).
+        
+        Exhaustive enumerations only depend on num_actions and are cached on the
+        selector; random subsets (config.num_policies) are redrawn on every call.
+        """
         if self.config.num_policies is not None:
             # Sample random policies
-            policies = []
-            for _ in range(self.config.num_policies):
-                actions = torch.randint(0, num_actions, (self.config.policy_length,))
-                policies.append(Policy(actions, self.config.planning_horizon))
-            return policies
-        elif self.config.policy_length == 1:
+            return torch.randint(
+                0,
+                num_actions,
+                (self.config.num_policies, self.config.policy_length),
+                device=self.device,
+            )
+        
+        actions = self._policy_cache.get(num_actions)
+        if actions is None:
+            # All combinations, in itertools.product order
+            axes = [torch.arange(num_actions, device=self.device)] * self.config.policy_length
+            actions = torch.cartesian_prod(*axes).reshape(-1, self.config.policy_length)
+            self._policy_cache[num_actions] = actions
+        return actions
+    
+    def _make_policy(self, actions: torch.Tensor) -> Policy:
+        """Wrap one row of policy actions as a Policy."""
+        if self.config.num_policies is None and self.config.policy_length == 1:
             # Single-step policies (most common in PyMDP)
-            return [Policy([a]) for a in range(num_actions)]
-        else:
-            # Multi-step policies: all combinations
-            all_combos = itertools.product(range(num_actions), repeat=self.config.policy_length)
-            return [Policy(list(combo), self.config.planning_horizon) for combo in all_combos]
+            return Policy(actions)
+        return Policy(actions, self.config.planning_horizon)
 
     def select_policy(
         self,
@@ -214,18 +400,26 @@ class DiscreteExpectedFreeEnergy(PolicySelector):
         if preferences is None:
             preferences = generative_model.get_preferences()
         
-        # Enumerate all policies
-        policies = self.enumerate_policies(generative_model.dims.num_actions)
+        # Enumerate all policies as a (num_policies, policy_length) action tensor
+        policy_actions = self._enumerate_policy_actions(generative_model.dims.num_actions)
         
-        # Calculate expected free energy for each policy
-        G_values = []
-        for policy in policies:
-            G, _, _ = self.compute_expected_free_energy(
-                policy, beliefs, generative_model, preferences
-            )
-            G_values.append(G)
+        # Calculate expected free energy for all policies at once
+        A, B, C, _ = self._get_pymdp_matrices(generative_model, preferences)
+        current_beliefs = beliefs.to(self.device).type(self.config.dtype)
+        num_steps = min(self.config.policy_length, self.config.planning_horizon)
+        actions = policy_actions[:, :num_steps]
+        pref_per_t = _preferences_per_timestep(C, num_steps)
+        H_per_state = self._state_entropy(generative_model, A)
         
-        G_tensor = torch.stack(G_values)
+        G_tensor = None
+        if self._use_numba_kernel:
+            G_tensor = self._compute_G_numba(
+                actions, current_beliefs, A, B, H_per_state, pref_per_t
+            )
+        if G_tensor is None:
+            G_tensor = self._compute_G(
+                actions, current_beliefs, A, B, H_per_state, pref_per_t
+            )
         
         # Add habit strength if configured
         if self.config.habit_strength > 0:
@@ -233,31 +427,78 @@ class DiscreteExpectedFreeEnergy(PolicySelector):
             habit_prior = torch.zeros_like(G_tensor)
             G_tensor = G_tensor - self.config.habit_strength * habit_prior
         
-        # Calculate policy posterior: Q(π) ∝ exp(-βG(π))
-        policy_posteriors = F.softmax(-G_tensor * self.precision_parameter, dim=0)
-        
-        # Policy pruning
-        if self.config.enable_pruning:
-            mask = policy_posteriors > self.config.pruning_threshold
-            if mask.sum() > 0:
-                policy_posteriors = policy_posteriors * mask
-                policy_posteriors = policy_posteriors / policy_posteriors.sum()
+        # Policy posterior logits: Q(π) ∝ exp(-βG(π))
+        policy_logits = self._prune_logits(-G_tensor * self.precision_parameter)
         
         # Policy selection
         if self.config.use_sampling:
-            # Stochastic selection
-            policy_idx = int(torch.multinomial(policy_posteriors, 1).item())
+            # Stochastic selection via Gumbel-max over the (pruned) logits
+            policy_idx = int(torch.argmax(policy_logits + _gumbel_noise(policy_logits)).item())
         else:
             # Deterministic selection (highest posterior)
-            policy_idx = int(torch.argmax(policy_posteriors).item())
+            policy_idx = int(torch.argmax(policy_logits).item())
         
-        selected_policy = policies[policy_idx]
+        selected_policy = self._make_policy(policy_actions[policy_idx].clone())
+        policy_posteriors = F.softmax(policy_logits, dim=0)
         
         return selected_policy, policy_posteriors
 
+    def select_policy_batched(
+        self,
+        beliefs: torch.Tensor,
+        generative_model: GenerativeModel,
+        preferences: Optional[torch.Tensor] = None,
+    ) -> torch.Tensor:
+        """Marginal Q(π) over the first action of each policy, for a batch of beliefs.
+        
+        Args:
+            beliefs: Current posterior beliefs, shape (batch, num_states)
+            generative_model: Generative model with PyMDP matrices
+            preferences: Optional preferences (uses model's C matrix if None)
+        
+        Returns:
+            Next-action probabilities, shape (batch, num_actions)
+        """
+        if preferences is None:
+            preferences = generative_model.get_preferences()
+        
+        num_actions = generative_model.dims.num_actions
+        policy_actions = self._enumerate_policy_actions(num_actions)
+        num_steps = min(self.config.policy_length, self.config.planning_horizon)
+        num_beliefs, num_policies = beliefs.shape[0], policy_actions.shape[0]
+        
+        # Every (beliefs, policy) pair as one row of a single batched rollout
+        G = self.compute_expected_free_energy_batched(
+            policy_actions[:, :num_steps].repeat(num_beliefs, 1),
+            beliefs.repeat_interleave(num_policies, dim=0),
+            generative_model,
+            preferences,
+        ).reshape(num_beliefs, num_policies)
+        
+        policy_posteriors = F.softmax(self._prune_logits(-G * self.precision_parameter), dim=-1)
+        action_probs = torch.zeros(
+            num_beliefs, num_actions, device=self.device, dtype=policy_posteriors.dtype
+        )
+        return action_probs.index_add_(1, policy_actions[:, 0], policy_posteriors)
+    
+    def _prune_logits(self, policy_logits: torch.Tensor) -> torch.Tensor:
+        """Mask policies whose posterior falls below the pruning threshold.
+        
+        Q(π) > threshold  <=>  logit > ln(threshold) + logsumexp(logits), evaluated
+        along the last dimension; a row where nothing survives is left unpruned.
+        """
+        if not (self.config.enable_pruning and self.config.pruning_threshold > 0):
+            return policy_logits
+        log_threshold = math.log(self.config.pruning_threshold)
+        keep = policy_logits > log_threshold + torch.logsumexp(
+            policy_logits, dim=-1, keepdim=True
+        )
+        keep |= ~keep.any(dim=-1, keepdim=True)
+        return policy_logits.masked_fill(~keep, float("-inf"))
+
     def compute_expected_free_energy(
         self,
-        policy: Policy,
+        policy: Union[Policy, torch.Tensor],
         beliefs: torch.Tensor,
         generative_model: GenerativeModel,
         preferences: Optional[torch.Tensor] = None,
@@ -272,7 +513,7 @@ class DiscreteExpectedFreeEnergy(PolicySelector):
         - pragmatic_value = -E_Q[ln P(o|C)] (negative log preferences)
         
         Args:
-            policy: Policy π as sequence of actions
+            policy: Policy π as sequence of actions (Policy or raw action tensor)
             beliefs: Current beliefs Q(s) over states
             generative_model: Model with PyMDP matrices A, B, C, D
             preferences: Prior preferences C (uses model's if None)
@@ -292,13 +533,21 @@ class DiscreteExpectedFreeEnergy(PolicySelector):
         
         # Get PyMDP matrices
         A, B, C, D = self._get_pymdp_matrices(generative_model, preferences)
+        H_per_state = None
+        if self.use_states_info_gain:
+            H_per_state = self._state_entropy(generative_model, A)
+        
+        actions = policy.actions if isinstance(policy, Policy) else policy
+        num_steps = min(len(actions), self.config.planning_horizon)
+        pref_per_t = _preferences_per_timestep(C, num_steps)
+        
+        # Plain Python ints index B without a 0-D tensor dispatch on every step
+        action_list = actions.tolist()
         
         # Forward pass through policy
-        for t in range(min(len(policy), self.config.planning_horizon)):
-            action = policy[t]
-            
+        for t in range(num_steps):
             # State prediction: Q(s_{t+1}|π) = Q(s_t) @ B[:, :, action]
-            predicted_states = torch.matmul(current_beliefs, B[:, :, action])
+            predicted_states = torch.matmul(current_beliefs, B[:, :, action_list[t]])
             
             # Observation prediction: Q(o_{t+1}|π) = A @ Q(s_{t+1}|π)
             predicted_observations = torch.matmul(A, predicted_states)
@@ -306,14 +555,14 @@ class DiscreteExpectedFreeEnergy(PolicySelector):
             # Epistemic value (information gain)
             if self.use_states_info_gain:
                 epistemic_value = self._calculate_epistemic_value(
-                    predicted_states, predicted_observations, A, t
+                    predicted_states, predicted_observations, H_per_state, t
                 )
                 total_epistemic += epistemic_value
             
             # Pragmatic value (preference satisfaction)
             if self.use_utility:
                 pragmatic_value = self._calculate_pragmatic_value(
-                    predicted_observations, C, t
+                    predicted_observations, pref_per_t[:, t]
                 )
                 total_pragmatic += pragmatic_value
             
@@ -328,6 +577,205 @@ class DiscreteExpectedFreeEnergy(PolicySelector):
         
         return G, total_epistemic, total_pragmatic
     
+    def compute_expected_free_energy_batched(
+        self,
+        policies: Union[Sequence[Policy], torch.Tensor],
+        beliefs: torch.Tensor,
+        generative_model: GenerativeModel,
+        preferences: Optional[torch.Tensor] = None,
+    ) -> torch.Tensor:
+        """Compute G(π) for a batch of policies, each rolled out from its own beliefs.
+        
+        Every row follows the same formulation as compute_expected_free_energy, but
+        the whole batch advances with one torch.bmm per timestep.
+        
+        Args:
+            policies: Equal-length policies, or their actions as a (batch, length) tensor
+            beliefs: Beliefs per policy, shape (batch, num_states), or one shared
+                (num_states,) vector
+            generative_model: Model with PyMDP matrices A, B, C, D
+            preferences: Prior preferences C (uses model's if None)
+        
+        Returns:
+            G values, shape (batch,)
+        """
+        actions = _policy_action_batch(policies).to(self.device)
+        num_policies = actions.shape[0]
+        num_steps = min(actions.shape[1], self.config.planning_horizon)
+        
+        G = torch.zeros(num_policies, device=self.device, dtype=self.config.dtype)
+        if self._efe_step is None or num_policies == 0:
+            return G
+        
+        A, B, C, _ = self._get_pymdp_matrices(generative_model, preferences)
+        H_per_state = self._state_entropy(generative_model, A)
+        pref_per_t = _preferences_per_timestep(C, num_steps)
+        
+        states = beliefs.to(self.device).type(self.config.dtype)
+        if states.dim() == 1:
+            states = states.expand(num_policies, -1)
+        
+        # B_a[a] = B[:, :, a], so a row of actions gathers a (batch, S, S) stack
+        B_a = B.permute(2, 0, 1)
+        
+        # Coalesced batches from the planners can be large; bound the gathered stack
+        chunk_size = self.config.policy_chunk_size
+        if chunk_size is None:
+            bytes_per_row = B.shape[0] * B.shape[1] * B.element_size()
+            chunk_size = max(1, _POLICY_CHUNK_BYTES // bytes_per_row)
+        
+        for start in range(0, num_policies, chunk_size):
+            end = min(start + chunk_size, num_policies)
+            chunk_states = states[start:end]
+            for t in range(num_steps):
+                # Q(s_{t+1}|π) = Q(s_t|π) @ B[:, :, a_t] for every row at once
+                chunk_states = torch.bmm(
+                    chunk_states.unsqueeze(1), B_a[actions[start:end, t]]
+                ).squeeze(1)
+                G[start:end] += self._efe_step(
+                    chunk_states,
+                    A,
+                    H_per_state,
+                    pref_per_t[:, t],
+                    self.config.epistemic_weight,
+                    self.config.pragmatic_weight,
+                    self.eps,
+                )
+        
+        return G
+    
+    def _compute_G(
+        self,
+        actions: torch.Tensor,
+        beliefs: torch.Tensor,
+        A: torch.Tensor,
+        B: torch.Tensor,
+        H_per_state: torch.Tensor,
+        pref_per_t: torch.Tensor,
+    ) -> torch.Tensor:
+        """Evaluate G(π) for a batch of policies in one pass over the horizon.
+        
+        Args:
+            actions: Policy actions, shape (num_policies, num_steps)
+            beliefs: Current beliefs Q(s), shape (num_states,)
+            A: Observation model, shape (num_obs, num_states)
+            B: Transition model, shape (num_states, num_states, num_actions)
+            H_per_state: Observation entropy H[A[:, s]] per state, shape (num_states,)
+            pref_per_t: Preferences per step, shape (num_obs, num_steps)
+        
+        Returns:
+            G values, shape (num_policies,)
+        """
+        num_policies, num_steps = actions.shape
+        
+        accum_dtype = self.config.dtype
+        if self.device.type == "cuda":
+            accum_dtype = self.config.accum_dtype
+        if self._efe_step is None:
+            # Both terms are disabled
+            return torch.zeros(num_policies, device=self.device, dtype=accum_dtype)
+        
+        if self.device.type == "cuda":
+            # Reduced precision halves the bytes moved by the gathers; G is accumulated wide
+            compute_dtype = self.config.compute_dtype
+            A = A.to(compute_dtype)
+            B = B.to(compute_dtype)
+            beliefs = beliefs.to(compute_dtype)
+            pref_per_t = pref_per_t.to(compute_dtype)
+            H_per_state = H_per_state.to(compute_dtype)
+        
+        G = torch.empty(num_policies, device=self.device, dtype=accum_dtype)
+        
+        # Very large policy sets are rolled out in chunks so the gathered B stays bounded
+        chunk_size = self.config.policy_chunk_size
+        if chunk_size is None:
+            bytes_per_policy = B.shape[0] * B.shape[1] * num_steps * B.element_size()
+            chunk_size = max(1, _POLICY_CHUNK_BYTES // bytes_per_policy)
+        
+        for start in range(0, num_policies, chunk_size):
+            end = min(start + chunk_size, num_policies)
+            self._rollout_G(
+                actions[start:end], beliefs, A, B, H_per_state, pref_per_t, out=G[start:end]
+            )
+        
+        return G
+    
+    def _rollout_G(
+        self,
+        actions: torch.Tensor,
+        beliefs: torch.Tensor,
+        A: torch.Tensor,
+        B: torch.Tensor,
+        H_per_state: torch.Tensor,
+        pref_per_t: torch.Tensor,
+        out: torch.Tensor,
+    ) -> None:
+        """Roll out one chunk of policies, accumulating G into ``out``."""
+        num_policies, num_steps = actions.shape
+        
+        # Single gather of every transition the chunk needs: (S, S, P, L)
+        B_t = B[:, :, actions]
+        
+        if num_steps == 1:
+            states = torch.einsum("i,ijp->pj", beliefs, B_t[..., 0])
+        else:
+            states = beliefs.expand(num_policies, -1)
+        
+        out.zero_()
+        for t in range(num_steps):
+            if num_steps > 1:
+                # Q(s_{t+1}|π) = Q(s_t|π) @ B[:, :, a_t] for every policy at once
+                states = torch.einsum("pi,ijp->pj", states, B_t[..., t])
+            out += self._efe_step(
+                states,
+                A,
+                H_per_state,
+                pref_per_t[:, t],
+                self.config.epistemic_weight,
+                self.config.pragmatic_weight,
+                self.eps,
+            ).to(out.dtype)
+    
+    def _compute_G_numba(
+        self,
+        actions: torch.Tensor,
+        beliefs: torch.Tensor,
+        A: torch.Tensor,
+        B: torch.Tensor,
+        H_per_state: torch.Tensor,
+        pref_per_t: torch.Tensor,
+    ) -> Optional[torch.Tensor]:
+        """Evaluate G(π) for a batch of policies with the Numba CPU kernel.
+        
+        Returns None when the inputs fall outside what the kernel supports, in
+        which case the caller uses the PyTorch path.
+        """
+        # The kernel does no bounds checking, so anything malformed takes the PyTorch path
+        if beliefs.dim() != 1:
+            return None
+        num_states = beliefs.shape[0]
+        if (
+            A.shape[1] != num_states
+            or B.shape[:2] != (num_states, num_states)
+            or pref_per_t.shape[0] != A.shape[0]
+            or actions.min() < 0
+            or actions.max() >= B.shape[2]
+        ):
+            return None
+        
+        G = discrete_efe_batch(
+            A.detach().numpy(),
+            B.detach().numpy(),
+            beliefs.detach().numpy(),
+            actions.numpy(),
+            pref_per_t.detach().numpy(),
+            H_per_state.detach().numpy(),
+            self.config.epistemic_weight if self.use_states_info_gain else 0.0,
+            self.config.pragmatic_weight if self.use_utility else 0.0,
+            self.eps,
+        )
+        return torch.from_numpy(G)
+    
     def _get_pymdp_matrices(
         self, 
         generative_model: GenerativeModel, 
@@ -384,57 +832,57 @@ class DiscreteExpectedFreeEnergy(PolicySelector):
         
         return A, B, C, D
     
+    def _state_entropy(self, generative_model: GenerativeModel, A: torch.Tensor) -> torch.Tensor:
+        """Return the per-state observation entropy H[A[:, s]], cached per model.
+        
+        A is the device/dtype copy from _get_pymdp_matrices, which is a fresh tensor
+        whenever a conversion happens, so the cache is keyed on the model's own A.
+        Holding a reference to it means a recycled id() can never alias a different
+        tensor; in-place edits are detected through its _version.
+        """
+        source = getattr(generative_model, "A", None)
+        cacheable = isinstance(source, torch.Tensor) and not source.is_inference()
+        if cacheable:
+            cache = self._entropy_cache
+            if cache is not None and cache[0] is source and cache[1] == source._version:
+                return cache[2]
+        
+        H_per_state = -(A * torch.log(A + self.eps)).sum(0)
+        if cacheable:
+            self._entropy_cache = (source, source._version, H_per_state)
+        return H_per_state
+    
     def _calculate_epistemic_value(
         self,
         predicted_states: torch.Tensor,
         predicted_observations: torch.Tensor,
-        A: torch.Tensor,
+        H_per_state: torch.Tensor,
         timestep: int
     ) -> torch.Tensor:
         """Calculate epistemic value (information gain) following PyMDP.
         
         Implements: E[KL[Q(s|o,π)||Q(s|π)]]
-        """
-        epistemic_value = torch.tensor(0.0, device=self.device, dtype=self.config.dtype)
         
-        # For each possible observation
-        for obs_idx in range(A.shape[0]):
-            obs_prob = predicted_observations[obs_idx]
-            
-            if obs_prob > self.eps:
-                # Posterior after observing obs_idx: Q(s|o,π) ∝ A[obs_idx, :] * Q(s|π)
-                likelihood = A[obs_idx, :]
-                posterior = likelihood * predicted_states
-                posterior = posterior / (posterior.sum() + self.eps)
-                
-                # KL divergence: KL[Q(s|o,π)||Q(s|π)]
-                kl_div = torch.sum(
-                    posterior * torch.log(
-                        (posterior + self.eps) / (predicted_states + self.eps)
-                    )
-                )
-                
-                # Weight by observation probability
-                epistemic_value += obs_prob * kl_div
+        Evaluated in its mutual-information form H[Q(o|π)] - E_Q(s|π)[H[P(o|s)]],
+        so only the predicted observation entropy needs a fresh log; H_per_state
+        comes from _state_entropy.
+        """
+        obs_entropy = -torch.sum(
+            predicted_observations * torch.log(predicted_observations + self.eps)
+        )
+        expected_ambiguity = torch.sum(predicted_states * H_per_state)
         
-        return epistemic_value
+        return obs_entropy - expected_ambiguity
     
     def _calculate_pragmatic_value(
         self,
         predicted_observations: torch.Tensor,
-        C: torch.Tensor,
-        timestep: int
+        preferences_t: torch.Tensor,
     ) -> torch.Tensor:
         """Calculate pragmatic value (preference satisfaction) following PyMDP.
         
         Implements: -E_Q[ln P(o|C)]
         """
-        # Get preferences for this timestep
-        if C.dim() > 1 and timestep < C.shape[1]:
-            preferences_t = C[:, timestep]
-        else:
-            preferences_t = C[:, 0] if C.dim() > 1 else C
-        
         # Expected log preference: E_Q[ln P(o|C)] = ∑_o Q(o|π) * ln P(o|C)
         expected_log_preference = torch.sum(predicted_observations * preferences_t)
         
@@ -456,21 +904,43 @@ class ContinuousExpectedFreeEnergy(PolicySelector):
         super().__init__(config)
         self.inference = inference_algorithm
         self.eps = config.eps
+        self.use_utility = config.pragmatic_weight > 0.0
+        self.use_states_info_gain = config.epistemic_weight > 0.0
+        
+        # Pre-drawn candidate policies, keyed on (action_dim, num_policies)
+        self._policy_pool: Dict[Tuple[int, int], torch.Tensor] = {}
+        self._policy_pool_factor = 8
 
     def sample_policies(self, action_dim: int, num_policies: int) -> List[Policy]:
         """Sample continuous action policies."""
-        policies = []
-        for _ in range(num_policies):
+        return [
+            Policy(actions, self.config.planning_horizon)
+            for actions in self._sample_policy_actions(action_dim, num_policies)
+        ]
+    
+    def _sample_policy_actions(self, action_dim: int, num_policies: int) -> torch.Tensor:
+        """Sample policy actions as a tensor of shape (num_policies, policy_length, action_dim).
+        
+        Candidates come from a pool drawn once per (action_dim, num_policies) and
+        subsampled on each call, which amortizes the randn cost across steps.
+        """
+        pool = self._policy_pool.get((action_dim, num_policies))
+        if pool is None:
+            pool_size = self._policy_pool_factor * num_policies
+            
             # Sample continuous actions and discretize if needed
-            actions = torch.randn(self.config.policy_length, action_dim) * 0.5
+            actions = torch.randn(
+                pool_size, self.config.policy_length, action_dim, device=self.device
+            ) * 0.5
             actions = torch.clamp(actions, -1.0, 1.0)
             
             # Convert to discrete indices for compatibility
-            discrete_actions = torch.round((actions + 1.0) * (action_dim - 1) / 2.0).long()
-            discrete_actions = torch.clamp(discrete_actions, 0, action_dim - 1)
-            
-            policies.append(Policy(discrete_actions, self.config.planning_horizon))
-        return policies
+            pool = torch.round((actions + 1.0) * (action_dim - 1) / 2.0).long()
+            pool = torch.clamp(pool, 0, action_dim - 1)
+            self._policy_pool[(action_dim, num_policies)] = pool
+        
+        chosen = torch.randperm(pool.shape[0], device=self.device)[:num_policies]
+        return pool[chosen]
 
     def select_policy(
         self,
@@ -480,26 +950,28 @@ class ContinuousExpectedFreeEnergy(PolicySelector):
     ) -> Tuple[Policy, torch.Tensor]:
         """Select policy for continuous states using sampling."""
         num_policies = self.config.num_policies or 100
-        policies = self.sample_policies(generative_model.dims.num_actions, num_policies)
-        
-        G_values = []
-        for policy in policies:
-            G = self.compute_expected_free_energy(policy, beliefs, generative_model, preferences)
-            G_values.append(G)
+        policy_actions = self._sample_policy_actions(
+            generative_model.dims.num_actions, num_policies
+        )
         
-        G_tensor = torch.stack(G_values)
+        G_tensor = torch.empty(num_policies, device=self.device, dtype=self.config.dtype)
+        for i, actions in enumerate(policy_actions):
+            G_tensor[i], _, _ = self.compute_expected_free_energy(
+                actions, beliefs, generative_model, preferences
+            )
         
         if self.config.use_sampling:
-            probs = F.softmax(-G_tensor / self.config.exploration_constant, dim=0)
-            policy_idx = int(torch.multinomial(probs, 1).item())
+            logits = -G_tensor / self.config.exploration_constant
+            policy_idx = int(torch.argmax(logits + _gumbel_noise(logits)).item())
         else:
             policy_idx = int(torch.argmin(G_tensor).item())
         
-        return policies[policy_idx], G_tensor
+        selected_policy = Policy(policy_actions[policy_idx], self.config.planning_horizon)
+        return selected_policy, G_tensor
 
     def compute_expected_free_energy(
         self,
-        policy: Policy,
+        policy: Union[Policy, torch.Tensor],
         beliefs: Union[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]],
         generative_model: GenerativeModel,
         preferences: Optional[torch.Tensor] = None,
@@ -519,17 +991,22 @@ class ContinuousExpectedFreeEnergy(PolicySelector):
         epistemic_total = torch.tensor(0.0, device=self.device)
         pragmatic_total = torch.tensor(0.0, device=self.device)
         num_samples = self.config.num_samples
+        actions = policy.actions if isinstance(policy, Policy) else policy
+        num_steps = min(len(actions), self.config.planning_horizon)
+        use_pragmatic = self.use_utility and preferences is not None
+        if use_pragmatic:
+            pref_per_t = _preferences_per_timestep(preferences.to(self.device), num_steps)
+        
+        # Continuous actions on device once, instead of a host scalar per sample and step
+        policy_actions = actions.to(self.device, dtype=torch.float32)
         
         for _ in range(num_samples):
             # Sample current state
             std = torch.sqrt(var)
             current_state = mean + std * torch.randn_like(mean)
             
-            for t in range(min(len(policy), self.config.planning_horizon)):
-                action_idx = policy[t]
-                
-                # Convert discrete action to continuous
-                action = torch.tensor(action_idx, dtype=torch.float32, device=self.device)
+            for t in range(num_steps):
+                action = policy_actions[t]
                 
                 # Forward dynamics
                 if hasattr(generative_model, "transition_model"):
@@ -543,31 +1020,29 @@ class ContinuousExpectedFreeEnergy(PolicySelector):
                     next_mean = current_state + action * 0.1
                     next_var = var * 1.01
                 
-                # Observation model
-                if hasattr(generative_model, "observation_model"):
-                    obs_mean, obs_var = generative_model.observation_model(next_mean.unsqueeze(0))
-                    obs_mean = obs_mean.squeeze(0)
-                    obs_var = obs_var.squeeze(0)
-                else:
-                    obs_mean = next_mean
-                    obs_var = next_var
-                
                 # Epistemic value (information gain)
-                if self.config.epistemic_weight > 0:
+                if self.use_states_info_gain:
                     info_gain = 0.5 * torch.sum(torch.log(var / (next_var + self.eps)))
                     epistemic_value = self.config.epistemic_weight * info_gain
                     epistemic_total += epistemic_value
                     G -= epistemic_value
                 
-                # Pragmatic value
-                if self.config.pragmatic_weight > 0 and preferences is not None:
-                    if preferences.dim() > 1 and t < preferences.shape[1]:
-                        pref_t = preferences[:, t]
+                # Pragmatic value; the observation model is only needed here
+                if use_pragmatic:
+                    if hasattr(generative_model, "observation_model"):
+                        obs_mean, obs_var = generative_model.observation_model(
+                            next_mean.unsqueeze(0)
+                        )
+                        obs_mean = obs_mean.squeeze(0)
+                        obs_var = obs_var.squeeze(0)
                     else:
-                        pref_t = preferences
+                        obs_mean = next_mean
+                        obs_var = next_var
                     
                     # Squared error cost
-                    prag_value = -torch.sum((obs_mean - pref_t) ** 2 / (obs_var + self.eps))
+                    prag_value = -torch.sum(
+                        (obs_mean - pref_per_t[:, t]) ** 2 / (obs_var + self.eps)
+                    )
                     pragmatic_value = self.config.pragmatic_weight * prag_value
                     pragmatic_total += pragmatic_value
                     G -= pragmatic_value
@@ -593,6 +1068,44 @@ class HierarchicalPolicySelector(PolicySelector):
         self.level_selectors = level_selectors
         self.level_horizons = level_horizons
         self.num_levels = len(level_selectors)
+        
+        # Levels select independently; PyTorch releases the GIL, so threads overlap
+        # them. The worker threads and CUDA streams are created on first use.
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._level_streams: Optional[List[Any]] = None
+    
+    def _level_groups(self) -> List[List[int]]:
+        """
+        Levels grouped by selector object. A selector shared by several levels
+        mutates its caches while selecting, so its levels run one after another.
+        """
+        groups: Dict[int, List[int]] = {}
+        for level, selector in enumerate(self.level_selectors):
+            groups.setdefault(id(selector), []).append(level)
+        return list(groups.values())
+    
+    def _get_executor(self, workers: int) -> ThreadPoolExecutor:
+        """Thread pool selecting level groups concurrently, shut down by close()"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="policy-level"
+            )
+            # Threads are released with the selector if close() is never called
+            weakref.finalize(self, self._executor.shutdown, wait=False)
+        return self._executor
+    
+    def close(self) -> None:
+        """Shut down the worker threads and release the CUDA streams"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._level_streams = None
+    
+    def __enter__(self) -> "HierarchicalPolicySelector":
+        return self
+    
+    def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
+        self.close()
 
     def get_level_horizons(self) -> List[int]:
         """Get planning horizons for each level."""
@@ -619,27 +1132,43 @@ class HierarchicalPolicySelector(PolicySelector):
         generative_models: List[GenerativeModel],
         preferences: Optional[List[torch.Tensor]] = None,
     ) -> Tuple[List[Policy], List[torch.Tensor]]:
-        """Select policies at each hierarchical level."""
-        policies = []
-        all_probs = []
+        """Select policies at each hierarchical level.
         
-        for level in range(self.num_levels):
-            if level > 0:
-                # Use higher-level policy as context
-                higher_level_policy = policies[level - 1]
-            else:
-                higher_level_policy = None
-            
-            level_beliefs = beliefs[level]
-            level_model = generative_models[level]
+        No level conditions on another level's policy, so levels are selected
+        concurrently (on separate CUDA streams when running on GPU).
+        """
+        groups = self._level_groups()
+        concurrent = len(groups) > 1
+        if concurrent and self.device.type == "cuda" and self._level_streams is None:
+            self._level_streams = [torch.cuda.Stream() for _ in range(self.num_levels)]
+        
+        def select_level(level: int) -> Tuple[Policy, torch.Tensor]:
             level_prefs = preferences[level] if preferences else None
+            selector = self.level_selectors[level]
+            if not concurrent or self._level_streams is None:
+                return selector.select_policy(beliefs[level], generative_models[level], level_prefs)
             
-            policy, probs = self.level_selectors[level].select_policy(
-                level_beliefs, level_model, level_prefs
-            )
-            
-            policies.append(policy)
-            all_probs.append(probs)
+            stream = self._level_streams[level]
+            with torch.cuda.stream(stream):
+                result = selector.select_policy(
+                    beliefs[level], generative_models[level], level_prefs
+                )
+            stream.synchronize()
+            return result
+        
+        def select_group(levels: List[int]) -> List[Tuple[Policy, torch.Tensor]]:
+            return [select_level(level) for level in levels]
+        
+        if concurrent:
+            group_results = list(self._get_executor(len(groups)).map(select_group, groups))
+        else:
+            group_results = [select_group(levels) for levels in groups]
+        
+        results: Dict[int, Tuple[Policy, torch.Tensor]] = {}
+        for levels, level_results in zip(groups, group_results):
+            results.update(zip(levels, level_results))
+        policies = [results[level][0] for level in range(self.num_levels)]
+        all_probs = [results[level][1] for level in range(self.num_levels)]
         
         return policies, all_probs
 
@@ -688,6 +1217,12 @@ class SophisticatedInference(PolicySelector):
         self.inference = inference_algorithm
         self.base_selector = base_selector
         self.sophistication_depth = config.meta_cognitive_depth
+        
+        # Memoized base selections for one select_policy call, keyed on a belief fingerprint
+        self._select_cache: "OrderedDict[Tuple[Any, ...], Tuple[Policy, torch.Tensor]]" = (
+            OrderedDict()
+        )
+        self._select_cache_size = 32
 
     def select_policy(
         self,
@@ -696,10 +1231,11 @@ class SophisticatedInference(PolicySelector):
         preferences: Optional[torch.Tensor] = None,
     ) -> Tuple[Policy, torch.Tensor]:
         """Select policy using sophisticated inference with counterfactual reasoning."""
+        # Model parameters may be learned between calls, so memoization is per call
+        self._select_cache.clear()
+        
         # Start with base policy selection
-        base_policy, base_probs = self.base_selector.select_policy(
-            beliefs, generative_model, preferences
-        )
+        base_policy, base_probs = self._cached_select(beliefs, generative_model, preferences)
         
         if self.sophistication_depth > 0:
             # Apply sophisticated refinement
@@ -710,6 +1246,37 @@ class SophisticatedInference(PolicySelector):
         else:
             return base_policy, base_probs
 
+    def _cached_select(
+        self,
+        beliefs: torch.Tensor,
+        generative_model: GenerativeModel,
+        preferences: Optional[torch.Tensor] = None,
+    ) -> Tuple[Policy, torch.Tensor]:
+        """Run base_selector.select_policy, reusing results for repeated beliefs.
+        
+        Successive refinement steps often reach numerically identical beliefs, so
+        beliefs rounded to 6 decimals key an LRU of the last few selections.
+        Stochastic base selectors, which sample actions or draw a random policy
+        subset (config.num_policies) per call, are never memoized.
+        """
+        base_config = self.base_selector.config
+        stochastic = base_config.use_sampling or base_config.num_policies is not None
+        if stochastic or not isinstance(beliefs, torch.Tensor):
+            return self.base_selector.select_policy(beliefs, generative_model, preferences)
+        
+        fingerprint = torch.round(beliefs.detach(), decimals=6).cpu().numpy()
+        key = (fingerprint.tobytes(), fingerprint.shape, id(generative_model), id(preferences))
+        cached = self._select_cache.get(key)
+        if cached is not None:
+            self._select_cache.move_to_end(key)
+            return cached
+        
+        result = self.base_selector.select_policy(beliefs, generative_model, preferences)
+        self._select_cache[key] = result
+        if len(self._select_cache) > self._select_cache_size:
+            self._select_cache.popitem(last=False)
+        return result
+    
     def _sophisticated_refinement(
         self,
         initial_policy: Policy,
@@ -740,7 +1307,7 @@ class SophisticatedInference(PolicySelector):
             # If within sophistication depth, consider future policy selection
             if t < self.sophistication_depth:
                 # What would we do from this future state?
-                future_policy, _ = self.base_selector.select_policy(
+                future_policy, _ = self._cached_select(
                     updated_beliefs, generative_model, preferences
                 )
                 refined_action = future_policy[0]
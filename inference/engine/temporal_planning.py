@@ -2,23 +2,66 @@
 Module for FreeAgentics Active Inference implementation.
 """
 
+import functools
 import heapq
+import itertools
 import logging
+import math
+import time
 from abc import ABC, abstractmethod
-from collections import defaultdict
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, List, Optional, Tuple
+from typing import Any, List, Optional, Tuple, Union
 
 import numpy as np
 import torch
 
+from ._mcts_numba import NUMBA_AVAILABLE, add_pending, backpropagate, best_child_ucb
 from .active_inference import InferenceAlgorithm
 from .generative_model import DiscreteGenerativeModel, GenerativeModel
 from .policy_selection import Policy, PolicySelector
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
+def _single_action_policy(action: int) -> Policy:
+    """Shared one-step Policy for ``action``; planners only ever read it"""
+    return Policy([action])
+
+
+def _belief_digest(beliefs: torch.Tensor) -> int:
+    """64-bit digest of a belief vector's float32 contents.
+
+    Uses xxh3 straight over the tensor buffer when xxhash is installed, and
+    Python's hash of the raw bytes otherwise.
+    """
+    buffer = beliefs.detach().to("cpu", torch.float32).contiguous().numpy()
+    if xxhash is not None:
+        return xxhash.xxh3_64_intdigest(buffer)
+    return hash(buffer.tobytes())
+
+
+INF = float("inf")
+
+
+def _propagate_beliefs(
+    B_a: torch.Tensor, actions: torch.Tensor, beliefs: torch.Tensor
+) -> torch.Tensor:
+    """next[i] = B[:, :, actions[i]] @ beliefs[i] for a batch of rows"""
+    return torch.bmm(B_a[actions], beliefs.unsqueeze(-1)).squeeze(-1)
+
+
+def _successor_beliefs(B_a: torch.Tensor, beliefs: torch.Tensor) -> torch.Tensor:
+    """next[w, a] = B[:, :, a] @ beliefs[w] for every row and action"""
+    return torch.matmul(B_a, beliefs.T.unsqueeze(0)).permute(2, 0, 1)
+
+
 @dataclass
 class PlanningConfig:
     """Configuration for temporal planning"""
@@ -39,6 +82,13 @@ class PlanningConfig:
     eps: float = 1e-16
     max_nodes: int = 10000
     enable_caching: bool = True
+    mcts_batch_size: int = 8  # Leaves collected per MCTS round and evaluated together
+    virtual_loss: float = 1.0  # UCB penalty per pending evaluation below a node
+    random_seed: Optional[int] = None  # Seed of the planner's random generator
+    reuse_tree: bool = True  # Keep the MCTS subtree below a matching child across plan() calls
+    compile_kernels: bool = False  # torch.compile the batched belief propagation steps
+    compute_dtype: torch.dtype = torch.bfloat16  # GPU belief/transition precision; CPU uses fp32
+    time_budget_s: Optional[float] = None  # A* returns its best complete policy after this long
 
 
 class TreeNode:
@@ -91,10 +141,140 @@ class TreeNode:
     def __hash__(self) -> int:
         """Hash for caching"""
         if self._hash is None:
-            self._hash = hash((self.state.numpy().tobytes(), self.action, self.depth))
+            self._hash = hash((_belief_digest(self.state), self.action, self.depth))
         return self._hash
 
 
+class TreeStore:
+    """Search tree in structure-of-arrays layout.
+
+    Node fields live in parallel arrays indexed by an integer node id, so the
+    UCB1 scan and backpropagation touch contiguous memory instead of walking
+    TreeNode objects. Children are kept CSR-style with a fixed stride of
+    ``num_actions``: ``children[n, :num_children[n]]`` in insertion order.
+    Node 0 is the root.
+    """
+
+    def __init__(self, capacity: int, root_state: torch.Tensor, num_actions: int) -> None:
+        self.capacity = capacity
+        self.states = torch.empty(
+            (capacity, root_state.shape[-1]), dtype=root_state.dtype, device=root_state.device
+        )
+        self.visits = np.zeros(capacity, dtype=np.int64)
+        self.pending = np.zeros(capacity, dtype=np.int64)
+        self.value = np.zeros(capacity, dtype=np.float64)
+        self.efe = np.full(capacity, np.inf, dtype=np.float64)
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.action = np.full(capacity, -1, dtype=np.int32)
+        self.depth = np.zeros(capacity, dtype=np.int32)
+        self.children = np.full((capacity, num_actions), -1, dtype=np.int32)
+        self.num_children = np.zeros(capacity, dtype=np.int32)
+        self.size = 0
+        self.add(root_state, parent=-1, action=-1)
+
+    def add(self, state: torch.Tensor, parent: int, action: int) -> int:
+        """Append a node below ``parent`` and return its id"""
+        node = self.size
+        self.states[node] = state
+        self.parent[node] = parent
+        self.action[node] = action
+        if parent >= 0:
+            self.depth[node] = self.depth[parent] + 1
+            self.children[parent, self.num_children[parent]] = node
+            self.num_children[parent] += 1
+        self.size += 1
+        return node
+
+    def subtree(self, node: int, capacity: int) -> "TreeStore":
+        """Copy of the subtree below ``node``, with ``node`` as the new root"""
+        tree = TreeStore(capacity, self.states[node], self.children.shape[1])
+        mapping = {node: 0}
+        queue = [node]
+        for old in queue:
+            new = mapping[old]
+            tree.visits[new] = self.visits[old]
+            tree.value[new] = self.value[old]
+            tree.efe[new] = self.efe[old]
+            for child in self.child_ids(old).tolist():
+                mapping[child] = tree.add(self.states[child], new, int(self.action[child]))
+                queue.append(child)
+        return tree
+
+    def child_ids(self, node: int) -> np.ndarray:
+        """Children of ``node`` in insertion order"""
+        return self.children[node, : self.num_children[node]]
+
+    def best_child(
+        self, node: int, exploration_constant: float = 1.0, virtual_loss: float = 0.0
+    ) -> int:
+        """Select best child using UCB1.
+
+        Evaluations still pending below a child count as visits and subtract
+        ``virtual_loss`` each, so a batch of selections spreads over distinct leaves.
+        """
+        ids = self.child_ids(node)
+        if NUMBA_AVAILABLE:
+            return int(
+                best_child_ucb(
+                    max(self.visits[node] + self.pending[node], 1),
+                    self.visits,
+                    self.pending,
+                    self.efe,
+                    ids,
+                    exploration_constant,
+                    virtual_loss,
+                )
+            )
+        pending = self.pending[ids]
+        visits = self.visits[ids] + pending
+        parent_visits = max(self.visits[node] + self.pending[node], 1)
+        # Branchless: score every child, then mask the unvisited ones to +inf
+        safe_visits = np.maximum(visits, 1)
+        exploration = exploration_constant * np.sqrt(np.log(parent_visits) / safe_visits)
+        ucb = np.where(visits == 0, np.inf, -self.efe[ids] - virtual_loss * pending + exploration)
+        return int(ids[np.argmax(ucb)])
+
+
+class EFECache:
+    """LRU memo of one-step expected free energies keyed on (beliefs, action).
+
+    Planners revisit the same belief states often (beam survivors share
+    prefixes, A* samples heuristic actions from states it later expands), so
+    repeated one-step evaluations are served from here.
+    """
+
+    def __init__(self, policy_selector: PolicySelector, maxsize: int) -> None:
+        self.policy_selector = policy_selector
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Tuple[int, int, int, int], float] = OrderedDict()
+
+    def get_or_compute(
+        self,
+        beliefs: torch.Tensor,
+        action: int,
+        generative_model: GenerativeModel,
+        preferences: Optional[torch.Tensor] = None,
+    ) -> float:
+        """Expected free energy of taking ``action`` from ``beliefs``"""
+        key = (_belief_digest(beliefs), action, id(generative_model), id(preferences))
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+            return value
+        G, _, _ = self.policy_selector.compute_expected_free_energy(
+            _single_action_policy(action), beliefs, generative_model, preferences
+        )
+        value = G.item()
+        self._entries[key] = value
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        """Drop all memoized values"""
+        self._entries.clear()
+
+
 class TemporalPlanner(ABC):
     """Abstract base class for temporal planning"""
 
@@ -110,6 +290,123 @@ class TemporalPlanner(ABC):
         self.device = torch.device(
             "cuda" if config.use_gpu and torch.cuda.is_available() else "cpu"
         )
+        self.rng = np.random.default_rng(config.random_seed)
+        self.efe_cache: Optional[EFECache] = None
+        if config.enable_caching:
+            self.efe_cache = EFECache(policy_selector, config.max_nodes)
+        # Beliefs are probability vectors, well within bf16 range; on GPU they are
+        # propagated at compute_dtype while G and the tree statistics stay in dtype
+        self._state_dtype = config.compute_dtype if self.device.type == "cuda" else torch.float32
+        # Discount powers gamma**t, grown on demand
+        self._gammas = torch.ones(0, dtype=config.dtype, device=self.device)
+        # Transition stack B_a[a] = B[:, :, a] of the model being planned over
+        self._B_a: Optional[torch.Tensor] = None
+        self._B_source: Optional[torch.Tensor] = None
+        # Pinned host buffer for CUDA uploads and the event of its last copy
+        self._pinned: Optional[torch.Tensor] = None
+        self._pinned_event: Optional["torch.cuda.Event"] = None
+        # Batched transition steps shared by the planners' inner loops
+        self._propagate = _propagate_beliefs
+        self._successors = _successor_beliefs
+        if config.compile_kernels:
+            self._propagate = torch.compile(_propagate_beliefs, dynamic=True)
+            self._successors = torch.compile(_successor_beliefs, dynamic=True)
+
+    def _prepare(self, generative_model: GenerativeModel) -> None:
+        """Lay the model's transitions out as a contiguous (num_actions, S, S) stack.
+
+        Called at the top of every plan(), so in-place model updates between calls
+        are picked up.
+        """
+        if isinstance(generative_model, DiscreteGenerativeModel):
+            B = generative_model.B
+            self._B_a = self._to_device(B.detach().permute(2, 0, 1).contiguous()).to(
+                self._state_dtype
+            )
+            self._B_source = B
+        else:
+            self._B_a = None
+            self._B_source = None
+
+    def _to_device(self, tensor: Union[torch.Tensor, np.ndarray]) -> torch.Tensor:
+        """Copy a host tensor or array to the planner's device.
+
+        On CUDA the copy goes through a persistent pinned buffer and is issued
+        with ``non_blocking=True``, so it overlaps with kernels already queued
+        instead of stalling the host. Elsewhere this is a plain ``.to``.
+        """
+        if isinstance(tensor, np.ndarray):
+            tensor = torch.from_numpy(tensor)
+        if self.device.type != "cuda" or tensor.device.type != "cpu":
+            return tensor.to(self.device)
+        nbytes = tensor.numel() * tensor.element_size()
+        if self._pinned_event is not None:
+            # The previous upload must have left the buffer before it is reused
+            self._pinned_event.synchronize()
+        if self._pinned is None or self._pinned.numel() < nbytes:
+            self._pinned = torch.empty(max(nbytes, 1 << 16), dtype=torch.uint8, pin_memory=True)
+            self._pinned_event = torch.cuda.Event()
+        staged = self._pinned[:nbytes].view(tensor.dtype).view(tensor.shape)
+        staged.copy_(tensor)
+        result = staged.to(self.device, non_blocking=True)
+        self._pinned_event.record()
+        return result
+
+    def _transitions(self, generative_model: GenerativeModel) -> Optional[torch.Tensor]:
+        """B_a[a] = B[:, :, a], or None when the model has no discrete transitions"""
+        if not isinstance(generative_model, DiscreteGenerativeModel):
+            return None
+        if self._B_source is not generative_model.B:
+            self._prepare(generative_model)
+        return self._B_a
+
+    def _discount_powers(self, num_steps: int) -> torch.Tensor:
+        """gamma**t for t < num_steps, shape (num_steps,)"""
+        if self._gammas.shape[0] < num_steps:
+            steps = torch.arange(num_steps, dtype=self.config.dtype, device=self.device)
+            self._gammas = self.config.discount_factor**steps
+        return self._gammas[:num_steps]
+
+    def _discounted_value(
+        self,
+        trajectory: List[TreeNode],
+        generative_model: GenerativeModel,
+        preferences: Optional[torch.Tensor] = None,
+    ) -> float:
+        """Discounted negative free energy of the actions along a trajectory.
+
+        All steps are scored in one batched EFE call and reduced with a single dot
+        product, so the result is synchronised once rather than once per step.
+        """
+        steps = [
+            (trajectory[i].state, trajectory[i + 1].action)
+            for i in range(len(trajectory) - 1)
+            if trajectory[i + 1].action is not None
+        ]
+        if not steps:
+            return 0.0
+        beliefs = torch.stack([state.float() for state, _ in steps])
+        actions = torch.tensor([action for _, action in steps])
+        G = self.policy_selector.compute_expected_free_energy_batched(
+            actions, beliefs, generative_model, preferences
+        )
+        gammas = self._discount_powers(len(steps))
+        return -torch.dot(gammas, G.to(gammas)).item()
+
+    def _step_efe(
+        self,
+        beliefs: torch.Tensor,
+        action: int,
+        generative_model: GenerativeModel,
+        preferences: Optional[torch.Tensor] = None,
+    ) -> float:
+        """Expected free energy of one action, memoized when caching is enabled"""
+        if self.efe_cache is not None:
+            return self.efe_cache.get_or_compute(beliefs, action, generative_model, preferences)
+        G, _, _ = self.policy_selector.compute_expected_free_energy(
+            _single_action_policy(action), beliefs, generative_model, preferences
+        )
+        return G.item()
 
     @abstractmethod
     def plan(
@@ -149,6 +446,9 @@ class MonteCarloTreeSearch(TemporalPlanner):
         super().__init__(config, policy_selector, inference_algorithm)
         self.node_count = 0
         self.node_cache = {}
+        self.tree: Optional[TreeStore] = None
+        # (generative_model, preferences) the persisted tree was searched under
+        self._tree_context: Optional[Tuple[GenerativeModel, Optional[torch.Tensor]]] = None
 
     def plan(
         self,
@@ -158,99 +458,174 @@ class MonteCarloTreeSearch(TemporalPlanner):
     ) -> tuple[Policy, float]:
         """
         Plan using MCTS.
+
+        Each round collects up to ``mcts_batch_size`` leaves under virtual loss and
+        evaluates their rollouts together before backpropagating.
         """
-        root = TreeNode(initial_beliefs, depth=0)
-        for _ in range(self.config.num_simulations):
+        self._prepare(generative_model)
+        initial_beliefs = self._to_device(initial_beliefs).to(self._state_dtype)
+        tree = self._reuse_tree(initial_beliefs, generative_model, preferences)
+        if tree is None:
+            tree = TreeStore(
+                self.config.max_nodes + 1, initial_beliefs, generative_model.dims.num_actions
+            )
+        self.tree = tree
+        self._tree_context = (generative_model, preferences)
+        # Reused nodes count against max_nodes
+        self.node_count = tree.size - 1
+        batch_size = max(1, self.config.mcts_batch_size)
+        simulations = 0
+        while simulations < self.config.num_simulations:
+            leaves = self._collect_leaves(
+                tree,
+                generative_model,
+                min(batch_size, self.config.num_simulations - simulations),
+            )
+            if not leaves:
+                break
+            values = self._simulate_batch(tree, leaves, generative_model, preferences)
+            for node, value in zip(leaves, values):
+                self._apply_virtual_loss(tree, node, -1)
+                self._backpropagate(tree, node, value)
+            simulations += len(leaves)
+        best_policy = self._extract_policy(tree)
+        expected_value = tree.value[0] / max(tree.visits[0], 1)
+        return (best_policy, float(expected_value))
+
+    def _reuse_tree(
+        self,
+        initial_beliefs: torch.Tensor,
+        generative_model: GenerativeModel,
+        preferences: Optional[torch.Tensor],
+    ) -> Optional[TreeStore]:
+        """Reroot the previous tree at the child matching ``initial_beliefs``, if any"""
+        previous = self.tree
+        if not self.config.reuse_tree or previous is None or self._tree_context is None:
+            return None
+        if previous.size > self.config.max_nodes + 1:
+            return None
+        model, previous_preferences = self._tree_context
+        if model is not generative_model or previous_preferences is not preferences:
+            return None
+        ids = previous.child_ids(0)
+        if ids.size == 0 or previous.states.shape[1] != initial_beliefs.shape[-1]:
+            return None
+        distances = (previous.states[ids] - initial_beliefs).abs().sum(dim=1)
+        best = int(torch.argmin(distances))
+        if distances[best].item() > self.config.eps * initial_beliefs.shape[-1]:
+            return None
+        return previous.subtree(int(ids[best]), self.config.max_nodes + 1)
+
+    def _collect_leaves(
+        self, tree: TreeStore, generative_model: GenerativeModel, batch_size: int
+    ) -> List[int]:
+        """Select and expand up to ``batch_size`` distinct leaves for one round"""
+        leaves: List[int] = []
+        while len(leaves) < batch_size:
             if self.node_count >= self.config.max_nodes:
                 break
-            node = self._select(root, generative_model)
-            if not node._is_terminal and node.depth < self.config.max_depth:
-                node = self._expand(node, generative_model)
-            value = self._simulate(node, generative_model, preferences)
-            self._backpropagate(node, value)
-        best_policy = self._extract_policy(root)
-        expected_value = root.value / max(root.visits, 1)
-        return (best_policy, expected_value)
-
-    def _select(self, node: TreeNode, generative_model: GenerativeModel) -> TreeNode:
+            node = self._select(tree, generative_model)
+            if tree.depth[node] < self.config.max_depth:
+                node = self._expand(tree, node, generative_model)
+            if tree.pending[node] > 0:
+                # Virtual loss could not steer away from a leaf already in this round
+                break
+            self._apply_virtual_loss(tree, node, 1)
+            leaves.append(node)
+        return leaves
+
+    def _apply_virtual_loss(self, tree: TreeStore, node: int, delta: int) -> None:
+        """Add ``delta`` pending evaluations along the path from node to the root"""
+        add_pending(tree.parent, tree.pending, node, delta)
+
+    def _select(self, tree: TreeStore, generative_model: GenerativeModel) -> int:
         """Select node to expand using tree policy"""
-        while not node.is_leaf():
-            if not node.is_fully_expanded(generative_model.dims.num_actions):
+        num_actions = generative_model.dims.num_actions
+        node = 0
+        while tree.num_children[node] > 0:
+            if tree.num_children[node] < num_actions:
                 return node
-            else:
-                best_child = node.best_child(self.config.exploration_constant)
-                if best_child is not None:
-                    node = best_child
-                else:
-                    return node
+            node = tree.best_child(node, self.config.exploration_constant, self.config.virtual_loss)
         return node
 
-    def _expand(self, node: TreeNode, generative_model: GenerativeModel) -> TreeNode:
+    def _expand(self, tree: TreeStore, node: int, generative_model: GenerativeModel) -> int:
         """Expand node by adding new child"""
-        tried_actions = {child.action for child in node.children}
+        tried_actions = set(tree.action[tree.child_ids(node)].tolist())
         untried_actions = [
             a for a in range(generative_model.dims.num_actions) if a not in tried_actions
         ]
         if not untried_actions:
             return node
-        action = np.random.choice(untried_actions)
-        if isinstance(generative_model, DiscreteGenerativeModel):
-            # Ensure consistent tensor dtype for matrix operations
-            node_state_float = (
-                node.state.float() if isinstance(node.state, torch.Tensor) else node.state
-            )
-            next_beliefs = generative_model.B[:, :, action] @ node_state_float
+        action = untried_actions[self.rng.integers(len(untried_actions))]
+        B_a = self._transitions(generative_model)
+        if B_a is not None:
+            next_beliefs = B_a[action] @ tree.states[node]
         else:
-            next_beliefs = node.state
-        child = TreeNode(next_beliefs, action, parent=node, depth=node.depth + 1)
-        node.add_child(child)
+            next_beliefs = tree.states[node]
+        child = tree.add(next_beliefs, node, action)
         self.node_count += 1
         return child
 
     def _simulate(
         self,
-        node: TreeNode,
+        tree: TreeStore,
+        node: int,
         generative_model: GenerativeModel,
         preferences: Optional[torch.Tensor] = None,
     ) -> float:
         """Simulate from node to estimate value"""
-        current_beliefs = node.state.clone()
-        # Ensure consistent tensor dtype (Float32) for matrix operations
-        if isinstance(current_beliefs, torch.Tensor):
-            current_beliefs = current_beliefs.float()
-
-        total_G = 0.0
-        discount = 1.0
-        for t in range(self.config.planning_horizon - node.depth):
-            if t >= self.config.max_depth - node.depth:
-                break
-            action = np.random.randint(0, generative_model.dims.num_actions)
-            policy = Policy([action])
-            G, _, _ = self.policy_selector.compute_expected_free_energy(
-                policy, current_beliefs, generative_model, preferences
-            )
-            total_G += discount * G.item()
-            discount *= self.config.discount_factor
-            if isinstance(generative_model, DiscreteGenerativeModel):
-                current_beliefs = generative_model.B[:, :, action] @ current_beliefs
-        return -total_G
+        return self._simulate_batch(tree, [node], generative_model, preferences)[0]
 
-    def _backpropagate(self, node: TreeNode, value: float) -> None:
+    def _simulate_batch(
+        self,
+        tree: TreeStore,
+        nodes: List[int],
+        generative_model: GenerativeModel,
+        preferences: Optional[torch.Tensor] = None,
+    ) -> List[float]:
+        """Simulate random rollouts from every node at once to estimate their values"""
+        current_beliefs = tree.states[nodes]
+        device = self.device
+        limit = min(self.config.planning_horizon, self.config.max_depth)
+        depth_left = np.maximum(0, limit - tree.depth[nodes])
+        num_steps = int(depth_left.max())
+        # Rollout actions are drawn on the host and uploaded in one transfer
+        steps = self._to_device(depth_left)
+        actions = self._to_device(
+            self.rng.integers(generative_model.dims.num_actions, size=(len(nodes), num_steps))
+        )
+        # One gather of B_a per step serves the whole batch
+        B_a = self._transitions(generative_model)
+
+        step_G = []
+        for t in range(num_steps):
+            step_G.append(
+                self.policy_selector.compute_expected_free_energy_batched(
+                    actions[:, t : t + 1], current_beliefs, generative_model, preferences
+                )
+            )
+            if B_a is not None:
+                current_beliefs = self._propagate(B_a, actions[:, t], current_beliefs)
+        if not step_G:
+            return [0.0] * len(nodes)
+        # (num_steps, batch); rollouts from deeper nodes stop earlier
+        G = torch.stack(step_G).to(self._gammas)
+        G = G * (torch.arange(num_steps, device=device).unsqueeze(1) < steps).to(G)
+        return (-(self._discount_powers(num_steps) @ G)).tolist()
+
+    def _backpropagate(self, tree: TreeStore, node: int, value: float) -> None:
         """Backpropagate value up the tree"""
-        current_node: Optional[TreeNode] = node
-        while current_node is not None:
-            current_node.visits += 1
-            current_node.value += value
-            current_node = current_node.parent
+        # Values are negated free energies; UCB1 exploits the running mean G
+        backpropagate(tree.parent, tree.visits, tree.value, tree.efe, node, value)
 
-    def _extract_policy(self, root: TreeNode) -> Policy:
+    def _extract_policy(self, tree: TreeStore) -> Policy:
         """Extract best policy from tree"""
         actions = []
-        node = root
-        while not node.is_leaf():
-            node = max(node.children, key=lambda n: n.visits)
-            if node.action is not None:
-                actions.append(node.action)
+        node = 0
+        while tree.num_children[node] > 0:
+            ids = tree.child_ids(node)
+            node = int(ids[np.argmax(tree.visits[ids])])
+            actions.append(int(tree.action[node]))
         return Policy(actions)
 
     def evaluate_trajectory(
@@ -260,18 +635,7 @@ class MonteCarloTreeSearch(TemporalPlanner):
         preferences: Optional[torch.Tensor] = None,
     ) -> float:
         """Evaluate a trajectory based on free energy"""
-        total_value = 0.0
-        discount = 1.0
-        for i in range(len(trajectory) - 1):
-            if trajectory[i + 1].action is not None:
-                action = trajectory[i + 1].action
-                policy = Policy([action])
-                G, _, _ = self.policy_selector.compute_expected_free_energy(
-                    policy, trajectory[i].state, generative_model, preferences
-                )
-                total_value += discount * -G.item()
-                discount *= self.config.discount_factor
-        return total_value
+        return self._discounted_value(trajectory, generative_model, preferences)
 
 
 class BeamSearchPlanner(TemporalPlanner):
@@ -299,34 +663,49 @@ class BeamSearchPlanner(TemporalPlanner):
         """
         Plan using beam search.
         """
-        beam: List[Tuple[float, List[int], torch.Tensor]] = [(0.0, [], initial_beliefs)]
+        self._prepare(generative_model)
+        B_a = self._transitions(generative_model)
+        # The beam as parallel tensors: costs (W,), actions (W, depth), beliefs (W, S)
+        device = self.device
+        beliefs = initial_beliefs.to(device, self._state_dtype).unsqueeze(0)
+        costs = torch.zeros(1, dtype=torch.float64, device=device)
+        actions = torch.zeros((1, 0), dtype=torch.long, device=device)
+        num_actions = generative_model.dims.num_actions
+        action_range = torch.arange(num_actions, device=device)
         for depth in range(min(self.config.planning_horizon, self.config.max_depth)):
-            new_beam: List[Tuple[float, List[int], torch.Tensor]] = []
-            for cost, actions, beliefs in beam:
-                for action in range(generative_model.dims.num_actions):
-                    policy = Policy([action])
-                    G, _, _ = self.policy_selector.compute_expected_free_energy(
-                        policy, beliefs, generative_model, preferences
-                    )
-                    new_cost = cost + self.config.discount_factor**depth * G.item()
-                    new_actions = actions + [action]
-                    if isinstance(generative_model, DiscreteGenerativeModel):
-                        # Ensure consistent tensor dtype for matrix operations
-                        beliefs_float = (
-                            beliefs.float() if isinstance(beliefs, torch.Tensor) else beliefs
-                        )
-                        next_beliefs = generative_model.B[:, :, action] @ beliefs_float
-                    else:
-                        next_beliefs = beliefs
-                    new_beam.append((new_cost, new_actions, next_beliefs))
-            new_beam.sort(key=lambda x: x[0])
-            beam = new_beam[: self.beam_width]
-
-        if not beam:
+            width = beliefs.shape[0]
+            # Every (beam entry, action) pair as one row, beam-major
+            G = self.policy_selector.compute_expected_free_energy_batched(
+                action_range.repeat(width),
+                beliefs.repeat_interleave(num_actions, dim=0),
+                generative_model,
+                preferences,
+            ).reshape(width, num_actions)
+            new_costs = costs.unsqueeze(1) + self.config.discount_factor**depth * G.to(costs)
+            if B_a is not None:
+                # next_beliefs[w, a] = B[:, :, a] @ beliefs[w]
+                next_beliefs = self._successors(B_a, beliefs)
+            else:
+                next_beliefs = beliefs.unsqueeze(1).expand(-1, num_actions, -1)
+            # A stable sort keeps the earliest candidate on ties, as the list-based beam did
+            order = torch.argsort(new_costs.flatten(), stable=True)
+            num_survivors = self.beam_width
+            if self.config.enable_pruning:
+                # Drop candidates costlier than min + threshold * |min|; in sorted order
+                # the kept candidates are a prefix
+                best = new_costs.min()
+                bound = best + self.config.pruning_threshold * best.abs()
+                num_survivors = min(num_survivors, int((new_costs <= bound).sum()))
+            survivors = order[:num_survivors]
+            beam_idx, action_idx = survivors // num_actions, survivors % num_actions
+            costs = new_costs[beam_idx, action_idx]
+            actions = torch.cat([actions[beam_idx], action_idx.unsqueeze(1)], dim=1)
+            beliefs = next_beliefs[beam_idx, action_idx]
+
+        if actions.shape[0] == 0:
             return Policy([]), float("-inf")
 
-        best_cost, best_actions, _ = beam[0]
-        return Policy(best_actions), -best_cost
+        return Policy(actions[0]), -costs[0].item()
 
     def evaluate_trajectory(
         self,
@@ -335,19 +714,7 @@ class BeamSearchPlanner(TemporalPlanner):
         preferences: Optional[torch.Tensor] = None,
     ) -> float:
         """Evaluate a trajectory for beam search"""
-        total_value = 0.0
-        discount = 1.0
-        for i in range(len(trajectory) - 1):
-            if trajectory[i + 1].action is not None:
-                action = trajectory[i + 1].action
-                assert action is not None  # Type hint for mypy
-                policy = Policy([action])
-                G, _, _ = self.policy_selector.compute_expected_free_energy(
-                    policy, trajectory[i].state, generative_model, preferences
-                )
-                total_value += discount * -G.item()
-                discount *= self.config.discount_factor
-        return total_value
+        return self._discounted_value(trajectory, generative_model, preferences)
 
 
 class AStarPlanner(TemporalPlanner):
@@ -374,48 +741,87 @@ class AStarPlanner(TemporalPlanner):
         """
         Plan using A* search.
         """
-        open_set: List[Tuple[float, float, List[int], torch.Tensor]] = [(0.0, 0.0, [], initial_beliefs)]
+        self._prepare(generative_model)
+        B_a = self._transitions(generative_model)
+        initial_beliefs = self._to_device(initial_beliefs)
+        if self.efe_cache is not None:
+            # The model may have been updated in place since the last call
+            self.efe_cache.clear()
+        # Entries are (f, g, tie_breaker, actions, beliefs); the monotonic tie-breaker
+        # settles equal scores in push order, so tensors are never compared
+        tie_breaker = itertools.count()
+        open_set: List[Tuple[float, float, int, Tuple[int, ...], torch.Tensor]] = [
+            (0.0, 0.0, next(tie_breaker), (), initial_beliefs)
+        ]
         closed_set: set[int] = set()
-        g_scores = defaultdict(lambda: float("inf"))
-        g_scores[self._hash_beliefs(initial_beliefs)] = 0.0
+        # Best known cost to each belief state; only written on improvement
+        g_scores: dict[int, float] = {self._hash_beliefs(initial_beliefs): 0.0}
+        # Best complete policy so far; its cost bounds every later expansion
+        self._incumbent_f = INF
+        self._incumbent_policy: Optional[Tuple[int, ...]] = None
+        horizon = self.config.planning_horizon
+        if horizon <= 0:
+            return Policy([]), 0.0
+        time_budget = self.config.time_budget_s
+        start = time.monotonic()
         while open_set and len(closed_set) < self.config.max_nodes:
-            f_score, g_score, actions, beliefs = heapq.heappop(open_set)
-            if len(actions) >= self.config.planning_horizon:
-                return (Policy(actions), -g_score)
+            if time_budget is not None and time.monotonic() - start > time_budget:
+                break
+            f_score, g_score, _, actions, beliefs = heapq.heappop(open_set)
+            if f_score >= self._incumbent_f:
+                # The heap is ordered by f, so nothing left can beat the incumbent
+                break
             state_hash = self._hash_beliefs(beliefs)
             if state_hash in closed_set:
                 continue
             closed_set.add(state_hash)
             for action in range(generative_model.dims.num_actions):
-                policy = Policy([action])
-                G, _, _ = self.policy_selector.compute_expected_free_energy(
-                    policy, beliefs, generative_model, preferences
-                )
-                step_cost = self.config.discount_factor ** len(actions) * G.item()
+                G = self._step_efe(beliefs, action, generative_model, preferences)
+                step_cost = self.config.discount_factor ** len(actions) * G
                 new_g_score = g_score + step_cost
-                if isinstance(generative_model, DiscreteGenerativeModel):
-                    next_beliefs = generative_model.B[:, :, action] @ beliefs
+                if len(actions) + 1 >= horizon:
+                    # Complete policies are not queued, they only tighten the bound
+                    if new_g_score < self._incumbent_f:
+                        self._incumbent_f = new_g_score
+                        self._incumbent_policy = actions + (action,)
+                    continue
+                if B_a is not None:
+                    next_beliefs = B_a[action] @ beliefs.to(self._state_dtype)
                 else:
                     next_beliefs = beliefs
-                if self._hash_beliefs(next_beliefs) not in closed_set:
-                    h_score = self._heuristic(
-                        next_beliefs, len(actions) + 1, generative_model, preferences
-                    )
-                    f_score_new = new_g_score + h_score
-                    heapq.heappush(
-                        open_set,
-                        (
-                            f_score_new,
-                            new_g_score,
-                            actions + [action],
-                            next_beliefs,
-                        ),
-                    )
+                next_hash = self._hash_beliefs(next_beliefs)
+                if next_hash in closed_set or new_g_score >= g_scores.get(next_hash, INF):
+                    continue
+                g_scores[next_hash] = new_g_score
+                h_score = self._heuristic(
+                    next_beliefs, len(actions) + 1, generative_model, preferences
+                )
+                f_score_new = new_g_score + h_score
+                if f_score_new >= self._incumbent_f:
+                    continue
+                heapq.heappush(
+                    open_set,
+                    (
+                        f_score_new,
+                        new_g_score,
+                        next(tie_breaker),
+                        actions + (action,),
+                        next_beliefs,
+                    ),
+                )
+        if self._incumbent_policy is not None:
+            return Policy(list(self._incumbent_policy)), -self._incumbent_f
         return Policy([]), float("-inf")
 
     def _hash_beliefs(self, beliefs: torch.Tensor) -> int:
-        """Hash beliefs for caching"""
-        return hash(beliefs.numpy().tobytes())
+        """Hash beliefs for caching.
+
+        Reduced-precision beliefs are quantized to 1/255 steps first, so rounding
+        jitter between equivalent paths does not split them in the closed set.
+        """
+        if beliefs.dtype != torch.float32 and beliefs.dtype != torch.float64:
+            beliefs = torch.round(beliefs.float().clamp(0.0, 1.0) * 255).to(torch.uint8)
+        return _belief_digest(beliefs)
 
     def _heuristic(
         self,
@@ -428,15 +834,14 @@ class AStarPlanner(TemporalPlanner):
         remaining_steps = self.config.planning_horizon - depth
         if remaining_steps <= 0:
             return 0.0
-        sample_G = []
-        for _ in range(min(3, generative_model.dims.num_actions)):
-            action = np.random.randint(0, generative_model.dims.num_actions)
-            policy = Policy([action])
-            G, _, _ = self.policy_selector.compute_expected_free_energy(
-                policy, beliefs, generative_model, preferences
-            )
-            sample_G.append(G.item())
-        return float(np.mean(sample_G)) if sample_G else 0.0
+        num_actions = generative_model.dims.num_actions
+        if num_actions == 0:
+            return 0.0
+        # Mean one-step G over every action, scored in a single batched call
+        G = self.policy_selector.compute_expected_free_energy_batched(
+            torch.arange(num_actions), beliefs, generative_model, preferences
+        )
+        return G.mean().item()
 
     def evaluate_trajectory(
         self,
@@ -445,19 +850,7 @@ class AStarPlanner(TemporalPlanner):
         preferences: Optional[torch.Tensor] = None,
     ) -> float:
         """Evaluate a trajectory for A*"""
-        total_value = 0.0
-        discount = 1.0
-        for i in range(len(trajectory) - 1):
-            if trajectory[i + 1].action is not None:
-                action = trajectory[i + 1].action
-                assert action is not None  # Type hint for mypy
-                policy = Policy([action])
-                G, _, _ = self.policy_selector.compute_expected_free_energy(
-                    policy, trajectory[i].state, generative_model, preferences
-                )
-                total_value += discount * -G.item()
-                discount *= self.config.discount_factor
-        return total_value
+        return self._discounted_value(trajectory, generative_model, preferences)
 
 
 class TrajectorySampling(TemporalPlanner):
@@ -483,20 +876,18 @@ class TrajectorySampling(TemporalPlanner):
     ) -> tuple[Policy, float]:
         """
         Plan using trajectory sampling.
-        """
-        best_trajectory = []
-        best_value = float("-inf")
 
-        for _ in range(self.config.num_trajectories):
-            trajectory, value = self._sample_trajectory(
-                initial_beliefs, generative_model, preferences
-            )
-            if value > best_value:
-                best_value = value
-                best_trajectory = trajectory
+        All trajectories advance together; the best sampled one becomes the policy.
+        """
+        if self.config.num_trajectories <= 0:
+            return Policy([]), float("-inf")
 
-        actions = [node.action for node in best_trajectory[1:] if node.action is not None]
-        return Policy(actions), best_value
+        self._prepare(generative_model)
+        actions, values = self._sample_trajectories_batched(
+            initial_beliefs, generative_model, preferences, self.config.num_trajectories
+        )
+        best = int(torch.argmax(values))
+        return Policy(actions[best]), values[best].item()
 
     def _sample_trajectory(
         self,
@@ -505,33 +896,58 @@ class TrajectorySampling(TemporalPlanner):
         preferences: Optional[torch.Tensor] = None,
     ) -> tuple[list[TreeNode], float]:
         """Sample a single trajectory"""
+        actions, values = self._sample_trajectories_batched(
+            initial_beliefs, generative_model, preferences, 1
+        )
         trajectory = [TreeNode(initial_beliefs, depth=0)]
-        current_beliefs = initial_beliefs.clone()
-        total_value = 0.0
-        discount = 1.0
-        for depth in range(min(self.config.planning_horizon, self.config.max_depth)):
-            temp_policy, _ = self.policy_selector.select_policy(
-                current_beliefs, generative_model, preferences
+        B_a = self._transitions(generative_model)
+        current_beliefs = self._to_device(initial_beliefs).to(self._state_dtype)
+        for depth, action in enumerate(actions[0].tolist()):
+            if B_a is not None:
+                current_beliefs = B_a[action] @ current_beliefs
+            trajectory.append(TreeNode(current_beliefs, action, trajectory[-1], depth + 1))
+        return (trajectory, values[0].item())
+
+    def _sample_trajectories_batched(
+        self,
+        initial_beliefs: torch.Tensor,
+        generative_model: GenerativeModel,
+        preferences: Optional[torch.Tensor],
+        num_trajectories: int,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Sample trajectories in lockstep from the policy posterior.
+
+        Returns:
+            actions: Sampled actions, shape (num_trajectories, horizon)
+            values: Discounted negative free energy per trajectory, shape (num_trajectories,)
+        """
+        device = self.device
+        horizon = min(self.config.planning_horizon, self.config.max_depth)
+        beliefs = (
+            initial_beliefs.to(device, self._state_dtype).unsqueeze(0).repeat(num_trajectories, 1)
+        )
+        values = torch.zeros(num_trajectories, dtype=self.config.dtype, device=device)
+        actions_log = torch.empty((num_trajectories, horizon), dtype=torch.long, device=device)
+        B_a = self._transitions(generative_model)
+
+        step_G = []
+        for depth in range(horizon):
+            probs = self.policy_selector.select_policy_batched(
+                beliefs, generative_model, preferences
             )
-            if len(temp_policy.actions) > 0:
-                action_item = temp_policy.actions[0].item()
-                action = int(action_item)  # Ensure it's an int
-            else:
-                action = int(np.random.randint(0, generative_model.dims.num_actions))
-            policy = Policy([action])
-            G, _, _ = self.policy_selector.compute_expected_free_energy(
-                policy, current_beliefs, generative_model, preferences
+            actions = torch.multinomial(probs, 1).squeeze(-1).to(device)
+            step_G.append(
+                self.policy_selector.compute_expected_free_energy_batched(
+                    actions, beliefs, generative_model, preferences
+                )
             )
-            total_value += discount * -G.item()
-            discount *= self.config.discount_factor
-            if isinstance(generative_model, DiscreteGenerativeModel):
-                next_beliefs = generative_model.B[:, :, action] @ current_beliefs
-            else:
-                next_beliefs = current_beliefs
-
-            trajectory.append(TreeNode(next_beliefs, action, trajectory[-1], depth + 1))
-            current_beliefs = next_beliefs
-        return (trajectory, total_value)
+            actions_log[:, depth] = actions
+            if B_a is not None:
+                beliefs = self._propagate(B_a, actions, beliefs)
+        if step_G:
+            # (horizon, num_trajectories) reduced against gamma**t in one product
+            values = -(self._discount_powers(horizon) @ torch.stack(step_G).to(self._gammas))
+        return actions_log, values
 
     def evaluate_trajectory(
         self,
@@ -540,19 +956,7 @@ class TrajectorySampling(TemporalPlanner):
         preferences: Optional[torch.Tensor] = None,
     ) -> float:
         """Evaluate a trajectory based on free energy"""
-        total_value = 0.0
-        discount = 1.0
-        for i in range(len(trajectory) - 1):
-            if trajectory[i + 1].action is not None:
-                action = trajectory[i + 1].action
-                assert action is not None  # Type hint for mypy
-                policy = Policy([action])
-                G, _, _ = self.policy_selector.compute_expected_free_energy(
-                    policy, trajectory[i].state, generative_model, preferences
-                )
-                total_value += discount * -G.item()
-                discount *= self.config.discount_factor
-        return total_value
+        return self._discounted_value(trajectory, generative_model, preferences)
 
 
 class AdaptiveHorizonPlanner(TemporalPlanner):
@@ -572,6 +976,7 @@ class AdaptiveHorizonPlanner(TemporalPlanner):
         super().__init__(config, policy_selector, inference_algorithm)
         self.base_planner = base_planner
         self.uncertainty_threshold = 0.7  # Default, can be tuned
+        self._log_num_states: dict[int, float] = {}
 
     def plan(
         self,
@@ -595,8 +1000,16 @@ class AdaptiveHorizonPlanner(TemporalPlanner):
         return policy, value
 
     def _measure_uncertainty(self, beliefs: torch.Tensor) -> float:
-        """Measure uncertainty using entropy"""
-        return -torch.sum(beliefs * torch.log(beliefs + self.config.eps)).item()
+        """Measure uncertainty as belief entropy normalised to [0, 1] by ln(num_states)"""
+        num_states = beliefs.shape[-1]
+        if num_states <= 1:
+            return 0.0
+        log_n = self._log_num_states.get(num_states)
+        if log_n is None:
+            log_n = math.log(num_states)
+            self._log_num_states[num_states] = log_n
+        # entr(p) = -p ln p with 0 ln 0 = 0, so no eps is needed inside the log
+        return torch.special.entr(beliefs).sum().item() / log_n
 
     def evaluate_trajectory(
         self,
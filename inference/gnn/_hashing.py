@@ -0,0 +1,33 @@
+"""
+Seeded random draws shared by the node and edge feature extractors.
+
+Features generated from hashes (embeddings of categorical values, of edges
+without a stored embedding) must not depend on, or disturb, NumPy's global
+random state, so they are drawn from a counter-based generator instead.
+"""
+
+import numpy as np
+
+UINT64_MASK = (1 << 64) - 1
+
+
+def hashed_normal(seeds: np.ndarray, dim: int) -> np.ndarray:
+    """
+    Standard normal draws of shape (len(seeds), dim), fixed by each row's seed.
+    Counter-based: the splitmix64 stream of every seed gives the uniform bits and
+    Box-Muller turns pairs of them into normals, so all rows are drawn at once
+    without touching NumPy's global random state.
+    """
+    num_uniforms = dim + dim % 2
+    with np.errstate(over="ignore"):
+        z = seeds[:, None] + np.arange(1, num_uniforms + 1, dtype=np.uint64) * np.uint64(
+            0x9E3779B97F4A7C15
+        )
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z ^= z >> np.uint64(31)
+    # 53 random bits as a uniform in (0, 1], so the logarithm below is finite
+    uniforms = ((z >> np.uint64(11)) + np.uint64(1)) * 2.0**-53
+    radius = np.sqrt(-2.0 * np.log(uniforms[:, 0::2]))
+    angle = 2.0 * np.pi * uniforms[:, 1::2]
+    return np.concatenate([radius * np.cos(angle), radius * np.sin(angle)], axis=1)[:, :dim]
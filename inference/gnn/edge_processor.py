@@ -2,11 +2,12 @@
 Module for FreeAgentics Active Inference implementation.
 """
 
+import functools
 import logging
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import scipy.sparse as sp  # type: ignore[import-untyped]
@@ -14,6 +15,8 @@ import torch
 from sklearn.preprocessing import MinMaxScaler  # type: ignore[import-untyped]
 from sklearn.preprocessing import StandardScaler  # type: ignore[import-untyped]
 
+from ._hashing import UINT64_MASK, hashed_normal
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
@@ -23,6 +26,28 @@ It handles various edge relationships, directed/undirected processing, and weigh
 """
 
 
+@functools.lru_cache(maxsize=1 << 16)
+def _timestamp_features(timestamp: Union[int, float, str]) -> Tuple[float, ...]:
+    """
+    Hour, weekday, day, month, year, weekend flag and scaled epoch of a timestamp,
+    in local time. Parsing dominates, so results are memoized across batches.
+    """
+    if isinstance(timestamp, str):
+        dt = datetime.fromisoformat(timestamp)
+        timestamp = dt.timestamp()
+    else:
+        dt = datetime.fromtimestamp(timestamp)
+    return (
+        dt.hour / 24.0,
+        dt.weekday() / 6.0,
+        dt.day / 31.0,
+        dt.month / 12.0,
+        (dt.year - 2000) / 100.0,
+        float(dt.weekday() >= 5),
+        timestamp / 1e10,
+    )
+
+
 class EdgeType(Enum):
     """Types of edges in the graph"""
 
@@ -53,6 +78,10 @@ class EdgeConfig:
     self_loops: bool = False
     max_edges_per_node: Optional[int] = None
     edge_sampling_strategy: Optional[str] = None  # "random", "importance", "topk"
+    dtype: torch.dtype = torch.float32  # edge_attr/edge_weight precision, e.g. torch.bfloat16
+    # int32 edge_index when num_nodes < 2**31; consumers must accept int32 indices
+    # (torch_geometric expects int64)
+    compact_index: bool = False
 
 
 @dataclass
@@ -67,6 +96,53 @@ class Edge:
     metadata: Dict[str, Any] = field(default_factory=dict)
 
 
+class LazyScalar:
+    """A 0-dim tensor that is read back to the host only when its value is used"""
+
+    __slots__ = ("tensor",)
+
+    def __init__(self, tensor: torch.Tensor) -> None:
+        self.tensor = tensor
+
+    def item(self) -> Union[bool, int, float]:
+        return self.tensor.item()
+
+    def __bool__(self) -> bool:
+        return bool(self.item())
+
+    def __int__(self) -> int:
+        return int(self.item())
+
+    def __float__(self) -> float:
+        return float(self.item())
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, LazyScalar):
+            other = other.item()
+        return self.item() == other
+
+    def __hash__(self) -> int:
+        return hash(self.item())
+
+    def __repr__(self) -> str:
+        return repr(self.item())
+
+
+@dataclass
+class EdgeBuffer:
+    """Structure-of-arrays view of a list of edges, built once per batch"""
+
+    sources: np.ndarray  # Shape: [num_edges], int64
+    targets: np.ndarray  # Shape: [num_edges], int64
+    weights: np.ndarray  # Shape: [num_edges], float64
+    # Per-edge feature dicts; after edge type conversion an Edge's own source and
+    # target may differ from the row's, so node ids are read from the arrays
+    edges: List[Edge] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return self.sources.shape[0]
+
+
 @dataclass
 class EdgeBatch:
     """Batch of edges for efficient processing"""
@@ -99,6 +175,9 @@ class EdgeProcessor:
         self.config = config
         self.scalers: Dict[str, Any] = {}
         self.edge_type_mapping: Dict[str, int] = {}
+        self.category_mapping: Dict[str, int] = {}
+        # Node ids 0..n-1 per index dtype, grown by doubling and sliced for self-loops
+        self._aranges: Dict[torch.dtype, torch.Tensor] = {}
         self._initialize_processors()
 
     def _initialize_processors(self) -> None:
@@ -125,20 +204,28 @@ class EdgeProcessor:
         if not edges:
             return self._create_empty_batch(num_nodes)
         # Convert edges based on edge type
-        processed_edges = self._convert_edge_type(edges)
+        buffer = self._convert_edge_type(self.ingest(edges))
+        # Every extractor allocates its edge rows and the self-loop rows together
+        num_self_loops = num_nodes if self.config.self_loops else 0
         # Extract edge indices
-        edge_index = self._extract_edge_index(processed_edges)
+        edge_index = self._extract_edge_index(buffer, num_self_loops, self._index_dtype(num_nodes))
         # Extract edge features
-        edge_attr = self._extract_edge_features(processed_edges)
+        edge_attr = self._extract_edge_features(buffer, num_self_loops)
         # Extract edge weights
-        edge_weight = self._extract_edge_weights(processed_edges)
+        edge_weight = self._extract_edge_weights(buffer, num_self_loops)
         # Handle edge sampling if configured
         if self.config.max_edges_per_node:
             edge_index, edge_attr, edge_weight = self._sample_edges(
                 edge_index, edge_attr, edge_weight, num_nodes
             )
+            has_self_loops = self._has_self_loops(edge_index)
+        else:
+            # Answered from the host-side buffer, without touching edge_index
+            has_self_loops = num_self_loops > 0 or bool(
+                np.any(buffer.sources == buffer.targets)
+            )
         # Create edge type tensor if needed
-        edge_type = self._extract_edge_types(processed_edges) if edges else None
+        edge_type = self._extract_edge_types(buffer, num_self_loops) if edges else None
         return EdgeBatch(
             edge_index=edge_index,
             edge_attr=edge_attr,
@@ -147,227 +234,260 @@ class EdgeProcessor:
             metadata={
                 "num_edges": edge_index.shape[1],
                 "num_nodes": num_nodes,
-                "has_self_loops": self._has_self_loops(edge_index),
+                "has_self_loops": has_self_loops,
+                # Deduplicated undirected pairs stay unique unless self-loops are added
+                "has_duplicates": not (
+                    self.config.edge_type == EdgeType.UNDIRECTED and num_self_loops == 0
+                ),
             },
         )
 
-    def _convert_edge_type(self, edges: List[Edge]) -> List[Edge]:
+    def _convert_edge_type(self, buffer: EdgeBuffer) -> EdgeBuffer:
         """Convert edges based on configured edge type"""
         if self.config.edge_type == EdgeType.UNDIRECTED:
-            return self._make_undirected(edges)
+            return self._make_undirected(buffer)
         elif self.config.edge_type == EdgeType.BIDIRECTIONAL:
-            return self._make_bidirectional(edges)
-        return edges
+            return self._make_bidirectional(buffer)
+        return buffer
 
-    def _make_undirected(self, edges: List[Edge]) -> List[Edge]:
+    def _make_undirected(self, buffer: EdgeBuffer) -> EdgeBuffer:
         """Convert directed edges to undirected"""
-        undirected_edges = []
-        seen_pairs = set()
-        for edge in edges:
-            pair = (min(edge.source, edge.target), max(edge.source, edge.target))
-            if pair not in seen_pairs:
-                seen_pairs.add(pair)
-                # Create undirected edge
-                new_edge = Edge(
-                    source=pair[0],
-                    target=pair[1],
-                    features=edge.features.copy(),
-                    weight=edge.weight,
-                    edge_type=edge.edge_type,
-                    metadata=edge.metadata.copy(),
-                )
-                undirected_edges.append(new_edge)
-        return undirected_edges
-
-    def _make_bidirectional(self, edges: List[Edge]) -> List[Edge]:
+        low = np.minimum(buffer.sources, buffer.targets)
+        high = np.maximum(buffer.sources, buffer.targets)
+        # One int64 key per unordered pair (node ids below 2**32); keep the first
+        # occurrence of each key, in input order
+        _, first = np.unique((low << 32) | high, return_index=True)
+        first.sort()
+        return EdgeBuffer(
+            sources=low[first],
+            targets=high[first],
+            weights=buffer.weights[first],
+            edges=[buffer.edges[i] for i in first],
+        )
+
+    def _make_bidirectional(self, buffer: EdgeBuffer) -> EdgeBuffer:
         """Convert edges to bidirectional (add reverse edges)"""
-        bidirectional_edges = []
-        for edge in edges:
-            # Add original edge
-            bidirectional_edges.append(edge)
-            # Add reverse edge if not self-loop
-            if edge.source != edge.target:
-                reverse_edge = Edge(
-                    source=edge.target,
-                    target=edge.source,
-                    features=edge.features.copy(),
-                    weight=edge.weight,
-                    edge_type=edge.edge_type,
-                    metadata=edge.metadata.copy(),
-                )
-                bidirectional_edges.append(reverse_edge)
-        return bidirectional_edges
-
-    def _extract_edge_index(self, edges: List[Edge]) -> torch.Tensor:
-        """Extract edge indices as tensor"""
-        sources = [edge.source for edge in edges]
-        targets = [edge.target for edge in edges]
-        edge_index = torch.tensor([sources, targets], dtype=torch.long)
-        # Add self-loops if configured
-        if self.config.self_loops:
-            num_nodes = max(max(sources), max(targets)) + 1
-            self_loop_index = torch.arange(num_nodes, dtype=torch.long)
-            self_loops = torch.stack([self_loop_index, self_loop_index])
-            edge_index = torch.cat([edge_index, self_loops], dim=1)
+        # Each edge is followed by its reverse, except for self-loops
+        copies = np.where(buffer.sources != buffer.targets, 2, 1)
+        rows = np.repeat(np.arange(len(buffer)), copies)
+        reverse = np.ones(len(rows), dtype=bool)
+        reverse[np.cumsum(copies) - copies] = False
+        sources = buffer.sources[rows]
+        targets = buffer.targets[rows]
+        return EdgeBuffer(
+            sources=np.where(reverse, targets, sources),
+            targets=np.where(reverse, sources, targets),
+            weights=buffer.weights[rows],
+            edges=[buffer.edges[i] for i in rows],
+        )
+
+    def ingest(self, edges: List[Edge]) -> EdgeBuffer:
+        """
+        Gather the numeric fields of a list of edges into contiguous arrays.
+        Args:
+            edges: List of Edge objects
+        Returns:
+            EdgeBuffer shared by all extractors of one batch
+        """
+        # One pass over the edges fills a record array; its columns are then split out
+        records = np.fromiter(
+            ((edge.source, edge.target, edge.weight) for edge in edges),
+            dtype=[("source", np.int64), ("target", np.int64), ("weight", np.float64)],
+            count=len(edges),
+        )
+        return EdgeBuffer(
+            sources=np.ascontiguousarray(records["source"]),
+            targets=np.ascontiguousarray(records["target"]),
+            weights=np.ascontiguousarray(records["weight"]),
+            edges=edges,
+        )
+
+    def _index_dtype(self, num_nodes: int) -> torch.dtype:
+        """dtype of edge_index: int32 when compact_index allows it, else int64"""
+        if self.config.compact_index and num_nodes < 2**31:
+            return torch.int32
+        return torch.long
+
+    def _arange(self, n: int, dtype: torch.dtype) -> torch.Tensor:
+        """First ``n`` node ids as a read-only view of a cached arange"""
+        cached = self._aranges.get(dtype)
+        if cached is None or cached.shape[0] < n:
+            size = n if cached is None else max(n, 2 * cached.shape[0])
+            cached = self._aranges[dtype] = torch.arange(size, dtype=dtype)
+        return cached[:n]
+
+    def _extract_edge_index(
+        self, buffer: EdgeBuffer, num_self_loops: int = 0, dtype: torch.dtype = torch.long
+    ) -> torch.Tensor:
+        """Extract edge indices as tensor, followed by ``num_self_loops`` self-loops"""
+        num_edges = len(buffer)
+        edge_index = torch.empty((2, num_edges + num_self_loops), dtype=dtype)
+        edge_index[0, :num_edges] = torch.from_numpy(buffer.sources)
+        edge_index[1, :num_edges] = torch.from_numpy(buffer.targets)
+        edge_index[:, num_edges:] = self._arange(num_self_loops, dtype)
         return edge_index
 
-    def _extract_edge_features(self, edges: List[Edge]) -> Optional[torch.Tensor]:
-        """Extract and normalize edge features"""
-        if not self.config.feature_types:
+    def _extract_edge_features(
+        self, buffer: EdgeBuffer, num_self_loops: int = 0
+    ) -> Optional[torch.Tensor]:
+        """Extract and normalize edge features; self-loop rows are zero"""
+        # Extractors are resolved once per feature set, not per batch
+        pipeline = _feature_pipeline(tuple(self.config.feature_types))
+        if not pipeline:
             return None
+        if len(pipeline) == 1 and num_self_loops == 0:
+            # A single block without padding rows is already the final edge_attr
+            features = pipeline[0](self, buffer)
+            return None if features is None else features.to(self.config.dtype)
         feature_arrays = []
-        for feature_type in self.config.feature_types:
-            features: Optional[torch.Tensor] = None
-            if feature_type == EdgeFeatureType.WEIGHT:
-                features = self._extract_weight_features(edges)
-            elif feature_type == EdgeFeatureType.DISTANCE:
-                features = self._extract_distance_features(edges)
-            elif feature_type == EdgeFeatureType.SIMILARITY:
-                features = self._extract_similarity_features(edges)
-            elif feature_type == EdgeFeatureType.CATEGORICAL:
-                features = self._extract_categorical_features(edges)
-            elif feature_type == EdgeFeatureType.TEMPORAL:
-                features = self._extract_temporal_features(edges)
-            elif feature_type == EdgeFeatureType.EMBEDDING:
-                features = self._extract_embedding_features(edges)
-            else:
-                features = self._extract_custom_features(edges, feature_type.value)
+        for extract in pipeline:
+            features = extract(self, buffer)
             if features is not None:
                 feature_arrays.append(features)
         if not feature_arrays:
             return None
-        # Concatenate all features
-        edge_attr = torch.cat(feature_arrays, dim=1)
-        # Add features for self-loops if needed
-        if self.config.self_loops:
-            num_self_loops = edge_attr.shape[0] - len(edges)
-            if num_self_loops > 0:
-                self_loop_features = torch.zeros(num_self_loops, edge_attr.shape[1])
-                edge_attr = torch.cat([edge_attr, self_loop_features], dim=0)
+        # Write every feature block into its column slice of one buffer
+        num_edges = len(buffer)
+        widths = [features.shape[1] for features in feature_arrays]
+        # Features are computed in float32 and only rounded to config.dtype here
+        edge_attr = torch.empty((num_edges + num_self_loops, sum(widths)), dtype=self.config.dtype)
+        offset = 0
+        for features, width in zip(feature_arrays, widths):
+            edge_attr[:num_edges, offset : offset + width] = features
+            offset += width
+        edge_attr[num_edges:].zero_()
         return edge_attr
 
-    def _extract_weight_features(self, edges: List[Edge]) -> torch.Tensor:
+    def _extract_weight_features(self, buffer: EdgeBuffer) -> torch.Tensor:
         """Extract edge weight features"""
-        weights = np.array([edge.weight for edge in edges]).reshape(-1, 1)
+        weights = buffer.weights.reshape(-1, 1)
         if self.config.normalize_weights:
-            if "weight" not in self.scalers:
-                self.scalers["weight"] = StandardScaler()
-            weights = self.scalers["weight"].fit_transform(weights)
-        return torch.tensor(weights, dtype=torch.float32)
+            weights = self._normalize("weight", weights, StandardScaler)
+        return torch.from_numpy(weights.astype(np.float32))
 
-    def _extract_distance_features(self, edges: List[Edge]) -> Optional[torch.Tensor]:
+    def _normalize(self, name: str, values: np.ndarray, scaler_type: type) -> np.ndarray:
+        """
+        Normalize a feature column with the scaler fitted on its first batch.
+        Later batches reuse the fitted statistics, so the normalization is the same
+        across calls; the affine map is applied in NumPy, skipping sklearn's
+        per-call validation.
+        """
+        scaler = self.scalers.get(name)
+        if scaler is None:
+            scaler = self.scalers[name] = scaler_type()
+        if not hasattr(scaler, "scale_"):
+            scaler.fit(values)
+        if isinstance(scaler, MinMaxScaler):
+            return values * scaler.scale_ + scaler.min_
+        return (values - scaler.mean_) / scaler.scale_
+
+    def _extract_distance_features(self, buffer: EdgeBuffer) -> Optional[torch.Tensor]:
         """Extract distance-based features"""
-        distances: List[float] = []
-        for edge in edges:
+        edges = buffer.edges
+        distances = np.zeros(len(edges))
+        # Distances derived from node positions are computed in one vectorized norm
+        position_rows: List[int] = []
+        source_positions: List[Any] = []
+        target_positions: List[Any] = []
+        for i, edge in enumerate(edges):
             if "distance" in edge.features:
-                distances.append(edge.features["distance"])
+                distances[i] = edge.features["distance"]
             elif "positions" in edge.metadata:
-                # Calculate distance from positions
-                pos_source = edge.metadata["positions"][edge.source]
-                pos_target = edge.metadata["positions"][edge.target]
-                distance = np.linalg.norm(np.array(pos_source) - np.array(pos_target))
-                distances.append(distance)
-            else:
-                distances.append(0.0)
-        distances_array = np.array(distances).reshape(-1, 1)
+                positions = edge.metadata["positions"]
+                position_rows.append(i)
+                source_positions.append(positions[buffer.sources[i]])
+                target_positions.append(positions[buffer.targets[i]])
+        if position_rows:
+            offsets = np.asarray(source_positions, dtype=np.float64) - np.asarray(
+                target_positions, dtype=np.float64
+            )
+            distances[position_rows] = np.linalg.norm(offsets, axis=1)
+        distances_array = distances.reshape(-1, 1)
         # Normalize distances to [0, 1] to ensure non-negative values
-        if "distance" not in self.scalers:
-            self.scalers["distance"] = MinMaxScaler()
-        distances_normalized = self.scalers["distance"].fit_transform(distances_array)
-        return torch.tensor(distances_normalized, dtype=torch.float32)
+        distances_normalized = self._normalize("distance", distances_array, MinMaxScaler)
+        return torch.from_numpy(distances_normalized.astype(np.float32))
 
-    def _extract_similarity_features(self, edges: List[Edge]) -> Optional[torch.Tensor]:
+    def _extract_similarity_features(self, buffer: EdgeBuffer) -> Optional[torch.Tensor]:
         """Extract similarity-based features"""
-        similarities: List[float] = []
-        for edge in edges:
-            if "similarity" in edge.features:
-                similarities.append(edge.features["similarity"])
-            else:
-                # Default similarity based on weight
-                similarities.append(edge.weight)
-        similarities_array = np.array(similarities).reshape(-1, 1)
+        edges = buffer.edges
+        # Default similarity based on weight
+        similarities = np.fromiter(
+            (edge.features.get("similarity", edge.weight) for edge in edges),
+            dtype=np.float32,
+            count=len(edges),
+        ).reshape(-1, 1)
         # Ensure similarities are in [0, 1]
-        similarities_clipped = np.clip(similarities_array, 0, 1)
-        return torch.tensor(similarities_clipped, dtype=torch.float32)
+        np.clip(similarities, 0, 1, out=similarities)
+        return torch.from_numpy(similarities)
 
-    def _extract_categorical_features(self, edges: List[Edge]) -> Optional[torch.Tensor]:
+    def _extract_categorical_features(self, buffer: EdgeBuffer) -> Optional[torch.Tensor]:
         """Extract categorical edge features"""
+        edges = buffer.edges
         if not any("category" in edge.features for edge in edges):
             return None
         # Collect all categories
-        categories = []
-        for edge in edges:
-            category = edge.features.get("category", "unknown")
-            categories.append(str(category))
-        # Create category mapping
-        unique_categories = sorted(set(categories))
-        category_to_idx = {cat: idx for idx, cat in enumerate(unique_categories)}
+        categories = np.array([str(edge.features.get("category", "unknown")) for edge in edges])
+        unique_categories, codes = np.unique(categories, return_inverse=True)
+        # Extend the category mapping; new categories are appended in sorted order
+        for category in unique_categories.tolist():
+            if category not in self.category_mapping:
+                self.category_mapping[category] = len(self.category_mapping)
+        columns = np.array([self.category_mapping[c] for c in unique_categories.tolist()])
         # One-hot encode
-        num_categories = len(unique_categories)
-        one_hot = np.zeros((len(edges), num_categories))
-        for i, category in enumerate(categories):
-            one_hot[i, category_to_idx[category]] = 1.0
-        return torch.tensor(one_hot, dtype=torch.float32)
+        one_hot = np.zeros((len(edges), len(self.category_mapping)), dtype=np.float32)
+        one_hot[np.arange(len(edges)), columns[codes]] = 1.0
+        return torch.from_numpy(one_hot)
 
-    def _extract_temporal_features(self, edges: List[Edge]) -> Optional[torch.Tensor]:
+    def _extract_temporal_features(self, buffer: EdgeBuffer) -> Optional[torch.Tensor]:
         """Extract temporal edge features"""
-        temporal_features = []
-        for edge in edges:
-            if "timestamp" in edge.features:
-                # Extract temporal features similar to node feature extractor
-                timestamp = edge.features["timestamp"]
-                features = self._decompose_timestamp(timestamp)
-                temporal_features.append(features)
-            else:
-                temporal_features.append([0.0] * 7)  # Default temporal features
-        return torch.tensor(temporal_features, dtype=torch.float32)
+        edges = buffer.edges
+        # Batches usually share a handful of timestamps: decompose each distinct
+        # one once into a lookup table (memoized across batches), then gather a
+        # row per edge
+        rows: Dict[Any, int] = {None: 0}
+        codes = np.fromiter(
+            (rows.setdefault(edge.features.get("timestamp"), len(rows)) for edge in edges),
+            dtype=np.int64,
+            count=len(edges),
+        )
+        # Row 0 is the default for edges without a timestamp
+        table = np.zeros((len(rows), 7), dtype=np.float32)
+        for timestamp, row in rows.items():
+            if timestamp is not None:
+                table[row] = _timestamp_features(timestamp)
+        return torch.from_numpy(table[codes])
 
     def _decompose_timestamp(self, timestamp: Union[int, float, str]) -> List[float]:
         """Decompose timestamp into multiple features"""
-        if isinstance(timestamp, str):
-            dt = datetime.fromisoformat(timestamp)
-            timestamp = dt.timestamp()
-        else:
-            dt = datetime.fromtimestamp(timestamp)
-        return [
-            dt.hour / 24.0,
-            dt.weekday() / 6.0,
-            dt.day / 31.0,
-            dt.month / 12.0,
-            (dt.year - 2000) / 100.0,
-            float(dt.weekday() >= 5),
-            timestamp / 1e10,
-        ]
+        return list(_timestamp_features(timestamp))
 
-    def _extract_embedding_features(self, edges: List[Edge]) -> Optional[torch.Tensor]:
+    def _extract_embedding_features(self, buffer: EdgeBuffer) -> Optional[torch.Tensor]:
         """Extract embedding features from edges"""
-        embeddings: List[np.ndarray] = []
-        embedding_dim = None
-        for edge in edges:
-            if "embedding" in edge.features:
-                embedding = edge.features["embedding"]
-                if isinstance(embedding, (list, np.ndarray)):
-                    if embedding_dim is None:
-                        embedding_dim = len(embedding)
-                    embeddings.append(
-                        np.array(embedding) if isinstance(embedding, list) else embedding
-                    )
-                else:
-                    # Generate embedding from edge properties
-                    if embedding_dim is None:
-                        embedding_dim = 8  # Default dimension
-                    hash_val = hash((edge.source, edge.target, edge.edge_type))
-                    np.random.seed(abs(hash_val) % (2**32))
-                    embedding = np.random.randn(embedding_dim) * 0.1
-                    np.random.seed()
-                    embeddings.append(embedding)
+        edges = buffer.edges
+        # The first edge fixes the width: its embedding's length, or the default 8
+        first_embedding = edges[0].features.get("embedding")
+        embedding_dim = 8
+        if isinstance(first_embedding, (list, np.ndarray)):
+            embedding_dim = len(first_embedding)
+        embeddings = np.zeros((len(edges), embedding_dim), dtype=np.float32)
+        generated_rows: List[int] = []
+        seeds: List[int] = []
+        for i, edge in enumerate(edges):
+            if "embedding" not in edge.features:
+                continue
+            embedding = edge.features["embedding"]
+            if isinstance(embedding, (list, np.ndarray)):
+                embeddings[i] = embedding
             else:
-                if embedding_dim is None:
-                    embedding_dim = 8
-                embeddings.append(np.zeros(embedding_dim))
-        embeddings_array = np.array(embeddings)
+                # Generate embedding from edge properties
+                generated_rows.append(i)
+                source, target = int(buffer.sources[i]), int(buffer.targets[i])
+                seeds.append(hash((source, target, edge.edge_type)) & UINT64_MASK)
+        if generated_rows:
+            seed_array = np.array(seeds, dtype=np.uint64)
+            embeddings[generated_rows] = hashed_normal(seed_array, embedding_dim) * 0.1
         # Normalize embeddings, handling zero vectors properly
-        embeddings_tensor = torch.tensor(embeddings_array, dtype=torch.float32)
+        embeddings_tensor = torch.from_numpy(embeddings)
         # Handle zero vectors by replacing them with small random vectors
         norms = torch.norm(embeddings_tensor, p=2, dim=1, keepdim=True)
         zero_mask = norms.squeeze() < 1e-8
@@ -378,49 +498,44 @@ class EdgeProcessor:
         return embeddings_normalized
 
     def _extract_custom_features(
-        self, edges: List[Edge], feature_name: str
+        self, buffer: EdgeBuffer, feature_name: str = EdgeFeatureType.CUSTOM.value
     ) -> Optional[torch.Tensor]:
         """Extract custom features from edges"""
-        features = []
-        for edge in edges:
-            if feature_name in edge.features:
-                feature = edge.features[feature_name]
-                if isinstance(feature, (list, np.ndarray)):
-                    features.append(feature)
-                else:
-                    features.append([float(feature)])
-            else:
-                features.append([0.0])
-        return torch.tensor(features, dtype=torch.float32)
-
-    def _extract_edge_weights(self, edges: List[Edge]) -> torch.Tensor:
-        """Extract edge weights"""
-        weights = [edge.weight for edge in edges]
-        # Add weights for self-loops if needed
-        if self.config.self_loops:
-            num_self_loops = max(max(e.source for e in edges), max(e.target for e in edges)) + 1
-            weights.extend([1.0] * num_self_loops)
-        return torch.tensor(weights, dtype=torch.float32)
-
-    def _extract_edge_types(self, edges: List[Edge]) -> Optional[torch.Tensor]:
+        edges = buffer.edges
+        values = [edge.features.get(feature_name, 0.0) for edge in edges]
+        # Vector-valued features set the width; scalar ones fill a single column
+        width = next((len(value) for value in values if isinstance(value, (list, np.ndarray))), 1)
+        features = np.empty((len(edges), width), dtype=np.float32)
+        for i, value in enumerate(values):
+            features[i] = value if isinstance(value, (list, np.ndarray)) else float(value)
+        return torch.from_numpy(features)
+
+    def _extract_edge_weights(self, buffer: EdgeBuffer, num_self_loops: int = 0) -> torch.Tensor:
+        """Extract edge weights; self-loops weigh 1"""
+        weights = np.ones(len(buffer) + num_self_loops, dtype=np.float32)
+        weights[: len(buffer)] = buffer.weights
+        return torch.from_numpy(weights).to(self.config.dtype)
+
+    def _extract_edge_types(
+        self, buffer: EdgeBuffer, num_self_loops: int = 0
+    ) -> Optional[torch.Tensor]:
         """Extract edge types if available"""
+        edges = buffer.edges
         if not any(edge.edge_type for edge in edges):
             return None
         # Create edge type mapping
-        edge_types = []
-        for edge in edges:
+        edge_types = np.empty(len(edges) + num_self_loops, dtype=np.int64)
+        for i, edge in enumerate(edges):
             edge_type = edge.edge_type or "default"
             if edge_type not in self.edge_type_mapping:
                 self.edge_type_mapping[edge_type] = len(self.edge_type_mapping)
-            edge_types.append(self.edge_type_mapping[edge_type])
+            edge_types[i] = self.edge_type_mapping[edge_type]
         # Add types for self-loops if needed
-        if self.config.self_loops:
-            default_type = self.edge_type_mapping.get("self_loop", len(self.edge_type_mapping))
+        if num_self_loops:
             if "self_loop" not in self.edge_type_mapping:
-                self.edge_type_mapping["self_loop"] = default_type
-            num_self_loops = len(edges) - len(edge_types)
-            edge_types.extend([default_type] * num_self_loops)
-        return torch.tensor(edge_types, dtype=torch.long)
+                self.edge_type_mapping["self_loop"] = len(self.edge_type_mapping)
+            edge_types[len(edges) :] = self.edge_type_mapping["self_loop"]
+        return torch.from_numpy(edge_types)
 
     def _sample_edges(
         self,
@@ -430,14 +545,10 @@ class EdgeProcessor:
         num_nodes: int,
     ) -> tuple[torch.Tensor, Optional[torch.Tensor], torch.Tensor]:
         """Sample edges based on configured strategy"""
-        if self.config.edge_sampling_strategy == "random":
-            return self._random_sample_edges(edge_index, edge_attr, edge_weight, num_nodes)
-        elif self.config.edge_sampling_strategy == "importance":
-            return self._importance_sample_edges(edge_index, edge_attr, edge_weight, num_nodes)
-        elif self.config.edge_sampling_strategy == "topk":
-            return self._topk_sample_edges(edge_index, edge_attr, edge_weight, num_nodes)
-        else:
+        sampler = _EDGE_SAMPLERS.get(self.config.edge_sampling_strategy)
+        if sampler is None:
             return edge_index, edge_attr, edge_weight
+        return sampler(self, edge_index, edge_attr, edge_weight, num_nodes)
 
     def _random_sample_edges(
         self,
@@ -447,28 +558,10 @@ class EdgeProcessor:
         num_nodes: int,
     ) -> tuple[torch.Tensor, Optional[torch.Tensor], torch.Tensor]:
         """Randomly sample edges per node"""
-        sampled_indices = set()
-        for node in range(num_nodes):
-            # Find outgoing edges from this node
-            outgoing_edges = torch.where(edge_index[0] == node)[0]
-            if (
-                self.config.max_edges_per_node is not None
-                and len(outgoing_edges) > self.config.max_edges_per_node
-            ):
-                # Randomly sample outgoing edges
-                perm = torch.randperm(len(outgoing_edges))[: self.config.max_edges_per_node]
-                sampled_indices.update(outgoing_edges[perm].tolist())
-            else:
-                sampled_indices.update(outgoing_edges.tolist())
-        # Convert to sorted list for consistent ordering
-        sampled_indices_list = sorted(list(sampled_indices))
-        sampled_indices_tensor = torch.tensor(sampled_indices_list, dtype=torch.long)
-        # Extract sampled edges
-        edge_index = edge_index[:, sampled_indices_tensor]
-        edge_weight = edge_weight[sampled_indices_tensor]
-        if edge_attr is not None:
-            edge_attr = edge_attr[sampled_indices_tensor]
-        return edge_index, edge_attr, edge_weight
+        # Uniform keys make the highest-key edges of a node a uniform random subset
+        keys = torch.rand(edge_index.shape[1])
+        sampled = self._select_top_edges_per_node(edge_index, keys, num_nodes)
+        return self._gather_edges(sampled, edge_index, edge_attr, edge_weight)
 
     def _importance_sample_edges(
         self,
@@ -478,36 +571,11 @@ class EdgeProcessor:
         num_nodes: int,
     ) -> tuple[torch.Tensor, Optional[torch.Tensor], torch.Tensor]:
         """Sample edges based on importance (weight)"""
-        sampled_indices = set()
-        for node in range(num_nodes):
-            # Find outgoing edges from this node
-            outgoing_edges = torch.where(edge_index[0] == node)[0]
-            if (
-                self.config.max_edges_per_node is not None
-                and len(outgoing_edges) > self.config.max_edges_per_node
-            ):
-                # Sample based on weights
-                node_weights = edge_weight[outgoing_edges]
-                # Normalize weights to probabilities
-                probs = node_weights / node_weights.sum()
-                # Sample without replacement
-                sampled = torch.multinomial(
-                    probs,
-                    min(self.config.max_edges_per_node, len(outgoing_edges)),
-                    replacement=False,
-                )
-                sampled_indices.update(outgoing_edges[sampled].tolist())
-            else:
-                sampled_indices.update(outgoing_edges.tolist())
-        # Convert to sorted list for consistent ordering
-        sampled_indices_list = sorted(list(sampled_indices))
-        sampled_indices_tensor = torch.tensor(sampled_indices_list, dtype=torch.long)
-        # Extract sampled edges
-        edge_index = edge_index[:, sampled_indices_tensor]
-        edge_weight = edge_weight[sampled_indices_tensor]
-        if edge_attr is not None:
-            edge_attr = edge_attr[sampled_indices_tensor]
-        return edge_index, edge_attr, edge_weight
+        # Keys log(u) / w: the top-k per node is a weighted sample without
+        # replacement (Efraimidis-Spirakis), the same law as torch.multinomial
+        keys = torch.rand(edge_index.shape[1]).log() / edge_weight
+        sampled = self._select_top_edges_per_node(edge_index, keys, num_nodes)
+        return self._gather_edges(sampled, edge_index, edge_attr, edge_weight)
 
     def _topk_sample_edges(
         self,
@@ -517,103 +585,174 @@ class EdgeProcessor:
         num_nodes: int,
     ) -> tuple[torch.Tensor, Optional[torch.Tensor], torch.Tensor]:
         """Sample top-k edges by weight per node"""
-        sampled_indices = set()
-        for node in range(num_nodes):
-            # Find outgoing edges from this node
-            outgoing_edges = torch.where(edge_index[0] == node)[0]
-            if (
-                self.config.max_edges_per_node is not None
-                and len(outgoing_edges) > self.config.max_edges_per_node
-            ):
-                # Get top-k by weight
-                node_weights = edge_weight[outgoing_edges]
-                topk_values, topk_indices = torch.topk(node_weights, self.config.max_edges_per_node)
-                sampled_indices.update(outgoing_edges[topk_indices].tolist())
-            else:
-                sampled_indices.update(outgoing_edges.tolist())
-        # Convert to sorted list for consistent ordering
-        sampled_indices_list = sorted(list(sampled_indices))
-        sampled_indices_tensor = torch.tensor(sampled_indices_list, dtype=torch.long)
-        # Extract sampled edges
-        edge_index = edge_index[:, sampled_indices_tensor]
-        edge_weight = edge_weight[sampled_indices_tensor]
+        sampled = self._select_top_edges_per_node(edge_index, edge_weight, num_nodes)
+        return self._gather_edges(sampled, edge_index, edge_attr, edge_weight)
+
+    def _select_top_edges_per_node(
+        self, edge_index: torch.Tensor, keys: torch.Tensor, num_nodes: int
+    ) -> torch.Tensor:
+        """
+        Select the max_edges_per_node highest-key outgoing edges of every node.
+        Args:
+            edge_index: Edge indices, shape [2, num_edges]
+            keys: Sampling key per edge, shape [num_edges]
+            num_nodes: Total number of nodes in the graph
+        Returns:
+            Sorted indices of the selected edges
+        """
+        sources = edge_index[0]
+        # Bucket edges by source node, highest key first; stable sorts keep edge
+        # order among ties
+        order = torch.argsort(keys, descending=True, stable=True)
+        order = order[torch.argsort(sources[order], stable=True)]
+        sorted_sources = sources[order]
+        # Rank of every edge inside its bucket: offset from the bucket start
+        bucket_start = torch.searchsorted(sorted_sources, sorted_sources)
+        rank = torch.arange(order.shape[0]) - bucket_start
+        keep = (sorted_sources >= 0) & (sorted_sources < num_nodes)
+        if self.config.max_edges_per_node is not None:
+            keep &= rank < self.config.max_edges_per_node
+        return torch.sort(order[keep]).values
+
+    def _gather_edges(
+        self,
+        indices: torch.Tensor,
+        edge_index: torch.Tensor,
+        edge_attr: Optional[torch.Tensor],
+        edge_weight: torch.Tensor,
+    ) -> tuple[torch.Tensor, Optional[torch.Tensor], torch.Tensor]:
+        """Keep the edges at ``indices``"""
+        edge_index = edge_index[:, indices]
+        edge_weight = edge_weight[indices]
         if edge_attr is not None:
-            edge_attr = edge_attr[sampled_indices_tensor]
+            edge_attr = edge_attr[indices]
         return edge_index, edge_attr, edge_weight
 
-    def _has_self_loops(self, edge_index: torch.Tensor) -> bool:
-        """Check if edge index contains self-loops"""
-        return bool(torch.any(edge_index[0] == edge_index[1]).item())
+    def _has_self_loops(self, edge_index: torch.Tensor) -> LazyScalar:
+        """Check if edge index contains self-loops, without waiting for the device"""
+        return LazyScalar(torch.any(edge_index[0] == edge_index[1]))
 
     def _create_empty_batch(self, num_nodes: int) -> EdgeBatch:
         """Create an empty edge batch"""
-        edge_index = torch.zeros((2, 0), dtype=torch.long)
+        index_dtype = self._index_dtype(num_nodes)
+        edge_index = torch.zeros((2, 0), dtype=index_dtype)
         # Add self-loops if configured
         if self.config.self_loops:
-            self_loop_index = torch.arange(num_nodes, dtype=torch.long)
+            self_loop_index = self._arange(num_nodes, index_dtype)
+            # stack copies, so the batch never aliases the cached arange
             edge_index = torch.stack([self_loop_index, self_loop_index])
-            edge_weight = torch.ones(num_nodes, dtype=torch.float32)
+            edge_weight = torch.ones(num_nodes, dtype=self.config.dtype)
         else:
-            edge_weight = torch.zeros(0, dtype=torch.float32)
+            edge_weight = torch.zeros(0, dtype=self.config.dtype)
         return EdgeBatch(
             edge_index=edge_index,
             edge_attr=None,
             edge_weight=edge_weight,
             edge_type=None,
-            metadata={"num_edges": edge_index.shape[1], "num_nodes": num_nodes},
+            metadata={
+                "num_edges": edge_index.shape[1],
+                "num_nodes": num_nodes,
+                "has_duplicates": False,
+            },
         )
 
     def to_adjacency_matrix(self, edge_batch: EdgeBatch, num_nodes: int) -> sp.csr_matrix:
         """Convert edge batch to sparse adjacency matrix"""
-        edge_index = edge_batch.edge_index.numpy()
+        rows, cols = edge_batch.edge_index.numpy()
         weights = (
-            edge_batch.edge_weight.numpy()
+            edge_batch.edge_weight.float().numpy()
             if edge_batch.edge_weight is not None
-            else np.ones(edge_index.shape[1])
+            else np.ones(rows.shape[0])
         )
         # Create sparse matrix
-        adj_matrix = sp.csr_matrix(
-            (weights, (edge_index[0], edge_index[1])), shape=(num_nodes, num_nodes)
-        )
-        return adj_matrix
+        adj_matrix = sp.coo_matrix((weights, (rows, cols)), shape=(num_nodes, num_nodes))
+        if edge_batch.metadata.get("has_duplicates", True) is False:
+            # Nothing to sum, so tocsr can skip its duplicate-summing pass
+            adj_matrix.has_canonical_format = True
+        return adj_matrix.tocsr()
 
     def compute_edge_statistics(self, edge_batch: EdgeBatch, num_nodes: int) -> Dict[str, Any]:
         """Compute statistics about the edge batch"""
         # Compute statistics about the edge batch
         edge_index = edge_batch.edge_index
-        # Degree statistics
-        in_degree = torch.bincount(edge_index[1], minlength=num_nodes).float()
-        out_degree = torch.bincount(edge_index[0], minlength=num_nodes).float()
+        # Out- and in-degrees from one bincount: targets are offset by num_nodes
+        degrees = (
+            torch.bincount(
+                torch.cat([edge_index[0], edge_index[1] + num_nodes]), minlength=2 * num_nodes
+            )
+            .float()
+            .view(2, num_nodes)
+        )
+        scalars = [
+            degrees.mean(dim=1),
+            degrees.amax(dim=1),
+            torch.sum(edge_index[0] == edge_index[1]).float().unsqueeze(0),
+        ]
+        edge_weight = edge_batch.edge_weight
+        if edge_weight is not None:
+            weight = edge_weight.float()
+            std_weight, mean_weight = torch.std_mean(weight)
+            min_weight, max_weight = torch.aminmax(weight)
+            scalars.append(torch.stack([mean_weight, std_weight, min_weight, max_weight]))
+        # A single transfer brings every scalar to the host
+        values = torch.cat(scalars).tolist()
+        avg_out_degree, avg_in_degree, max_out_degree, max_in_degree, num_self_loops = values[:5]
         # Edge weight statistics
-        if edge_batch.edge_weight is not None:
-            weight_stats = {
-                "mean_weight": edge_batch.edge_weight.mean().item(),
-                "std_weight": edge_batch.edge_weight.std().item(),
-                "min_weight": edge_batch.edge_weight.min().item(),
-                "max_weight": edge_batch.edge_weight.max().item(),
-            }
+        if edge_weight is not None:
+            weight_stats = dict(
+                zip(["mean_weight", "std_weight", "min_weight", "max_weight"], values[5:])
+            )
         else:
             weight_stats = {}
         # Edge type distribution
         if edge_batch.edge_type is not None:
-            edge_type_counts = torch.bincount(edge_batch.edge_type)
-            edge_type_dist = {f"type_{i}": count.item() for i, count in enumerate(edge_type_counts)}
+            edge_type_counts = torch.bincount(edge_batch.edge_type).tolist()
+            edge_type_dist = {f"type_{i}": count for i, count in enumerate(edge_type_counts)}
         else:
             edge_type_dist = {}
         return {
             "num_edges": edge_index.shape[1],
             "num_nodes": num_nodes,
-            "avg_in_degree": in_degree.mean().item(),
-            "avg_out_degree": out_degree.mean().item(),
-            "max_in_degree": in_degree.max().item(),
-            "max_out_degree": out_degree.max().item(),
-            "num_self_loops": torch.sum(edge_index[0] == edge_index[1]).item(),
+            "avg_in_degree": avg_in_degree,
+            "avg_out_degree": avg_out_degree,
+            "max_in_degree": max_in_degree,
+            "max_out_degree": max_out_degree,
+            "num_self_loops": int(num_self_loops),
             "density": edge_index.shape[1] / (num_nodes * num_nodes),
             **weight_stats,
             "edge_type_distribution": edge_type_dist,
         }
 
 
+# Extractor per feature type; each takes the processor and the batch's EdgeBuffer
+_FEATURE_EXTRACTORS: Dict[
+    EdgeFeatureType, Callable[[EdgeProcessor, EdgeBuffer], Optional[torch.Tensor]]
+] = {
+    EdgeFeatureType.WEIGHT: EdgeProcessor._extract_weight_features,
+    EdgeFeatureType.DISTANCE: EdgeProcessor._extract_distance_features,
+    EdgeFeatureType.SIMILARITY: EdgeProcessor._extract_similarity_features,
+    EdgeFeatureType.CATEGORICAL: EdgeProcessor._extract_categorical_features,
+    EdgeFeatureType.TEMPORAL: EdgeProcessor._extract_temporal_features,
+    EdgeFeatureType.EMBEDDING: EdgeProcessor._extract_embedding_features,
+    EdgeFeatureType.CUSTOM: EdgeProcessor._extract_custom_features,
+}
+_EDGE_SAMPLERS: Dict[
+    Optional[str], Callable[..., Tuple[torch.Tensor, Optional[torch.Tensor], torch.Tensor]]
+] = {
+    "random": EdgeProcessor._random_sample_edges,
+    "importance": EdgeProcessor._importance_sample_edges,
+    "topk": EdgeProcessor._topk_sample_edges,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _feature_pipeline(
+    feature_types: Tuple[EdgeFeatureType, ...]
+) -> Tuple[Callable[[EdgeProcessor, EdgeBuffer], Optional[torch.Tensor]], ...]:
+    """Extractors of a feature set, in column order"""
+    return tuple(_FEATURE_EXTRACTORS[feature_type] for feature_type in feature_types)
+
+
 # Example usage
 if __name__ == "__main__":
     # Configure edge processing
@@ -2,15 +2,16 @@
 Module for FreeAgentics Active Inference implementation.
 """
 
+import functools
 import logging
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timezone
 from enum import Enum
-from typing import Any, Callable, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
 
 import numpy as np
+import scipy.sparse as sp  # type: ignore[import-untyped]
 import torch
-import torch.nn.functional as F
 from sklearn.feature_extraction.text import TfidfVectorizer  # type: ignore[import-untyped]
 from sklearn.preprocessing import (  # type: ignore[import-untyped]
     LabelEncoder,
@@ -24,12 +25,103 @@ try:
 except ImportError:
     h3 = None
 
+from ._hashing import UINT64_MASK, hashed_normal
+
 # Import from layers.py for consistency
 from .layers import AggregationType
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# One feature's values for all nodes: a NumPy array or a sequence with None where missing
+NodeColumn = Union[np.ndarray, Sequence[Any]]
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _h3_center(cell: int) -> Tuple[float, float]:
+    """Center (lat, lng) of an H3 cell given as a 64-bit index"""
+    return h3.cell_to_latlng(h3.int_to_str(cell))
+
+
+@functools.lru_cache(maxsize=16384)
+def _hashed_embedding(value: str, dim: int) -> np.ndarray:
+    """Read-only embedding generated from the hash of a value's string form"""
+    seed = np.array([hash(value) & UINT64_MASK], dtype=np.uint64)
+    embedding = hashed_normal(seed, dim)[0] * 0.1
+    embedding.flags.writeable = False
+    return embedding
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _utc_offset(quarter_hour: int) -> int:
+    """Local UTC offset in seconds during a quarter hour, counted from the epoch"""
+    moment = datetime.fromtimestamp(quarter_hour * 900, timezone.utc).astimezone()
+    offset = moment.utcoffset()
+    return int(offset.total_seconds()) if offset is not None else 0
+
+
+def _local_offsets(seconds: np.ndarray) -> np.ndarray:
+    """
+    Local UTC offsets of Unix timestamps. Offsets only change on quarter hours
+    (UTC), so each distinct quarter hour is looked up once.
+    """
+    quarters, inverse = np.unique(seconds // 900, return_inverse=True)
+    offsets = np.array([_utc_offset(int(quarter)) for quarter in quarters], dtype=np.int64)
+    return offsets[inverse.reshape(-1)]
+
+
+def _node_degrees(degree: Callable[..., Any], node_ids: List[Any]) -> np.ndarray:
+    """
+    Degrees of the given nodes from a graph's degree method. Libraries with a bulk
+    query are asked once: NetworkX degree views map node -> degree (unknown nodes
+    get 0) and igraph returns a list by vertex index. Otherwise degree(node) is
+    called per node.
+    """
+    try:
+        degrees = degree()
+    except TypeError:
+        degrees = None
+    if isinstance(degrees, (list, tuple, np.ndarray)):
+        return np.asarray(degrees, dtype=np.float32)[np.asarray(node_ids, dtype=np.int64)]
+    if hasattr(degrees, "__iter__"):
+        degree_map = dict(degrees)
+        return np.fromiter(
+            (degree_map.get(node_id, 0) for node_id in node_ids), np.float32, len(node_ids)
+        )
+    return np.fromiter((degree(node_id) for node_id in node_ids), np.float32, len(node_ids))
+
+
+def _is_numeric(values: NodeColumn) -> bool:
+    """Whether a column is a numeric NumPy array, which has no missing entries"""
+    return isinstance(values, np.ndarray) and values.dtype.kind in "biuf"
+
+
+def _dense_column(values: NodeColumn) -> Optional[np.ndarray]:
+    """A numeric array column as a float32 (N, width) block, or None for other columns"""
+    if not _is_numeric(values):
+        return None
+    return np.asarray(values, dtype=np.float32).reshape(len(values), -1)
+
+
+def _sequence_rows(values: NodeColumn, dimension: int, default: Any) -> Optional[np.ndarray]:
+    """
+    Sequence values of a configured width filled into one float32 (N, dimension)
+    block, missing rows taking default (zero if None). None when the column holds
+    a scalar or no values at all: those keep the width derived from the data.
+    """
+    features = np.zeros((len(values), dimension), dtype=np.float32)
+    filled = False
+    for i, value in enumerate(values):
+        if value is None:
+            if default is not None:
+                features[i] = default
+            continue
+        if not isinstance(value, (list, tuple, np.ndarray)):
+            return None
+        features[i] = value
+        filled = True
+    return features if filled else None
+
 
 @dataclass
 class Edge:
@@ -199,175 +291,313 @@ class NodeFeatureExtractor:
         self.feature_configs = {config.name: config for config in feature_configs}
         self.scalers: Dict[str, Any] = {}
         self.encoders: Dict[str, Any] = {}
+        self.category_index: Dict[str, Dict[str, int]] = {}
         self.vectorizers: Dict[str, Any] = {}
         self._initialize_processors()
+        # Extractor of every feature, resolved once: (name, config, extractor, needs_graph)
+        unknown = NodeFeatureExtractor._extract_unknown_features
+        self._plan = tuple(
+            (
+                name,
+                config,
+                _FEATURE_EXTRACTORS.get(config.type, unknown),
+                config.type is FeatureType.GRAPH_STRUCTURAL,
+            )
+            for name, config in self.feature_configs.items()
+        )
+        # Node keys the list-of-dicts entry point collects into columns
+        self._column_keys = tuple(self.feature_configs) + (
+            ("id",) if any(needs_graph for *_, needs_graph in self._plan) else ()
+        )
 
     def _initialize_processors(self) -> None:
         """Initialize feature processors based on configurations"""
         for name, config in self.feature_configs.items():
             if config.type == FeatureType.NUMERICAL:
                 if config.normalization == NormalizationType.STANDARD:
-                    self.scalers[name] = StandardScaler()
+                    self.scalers[name] = StandardScaler(copy=False)
                 elif config.normalization == NormalizationType.MINMAX:
-                    self.scalers[name] = MinMaxScaler()
+                    self.scalers[name] = MinMaxScaler(copy=False)
                 elif config.normalization == NormalizationType.ROBUST:
-                    self.scalers[name] = RobustScaler()
+                    self.scalers[name] = RobustScaler(copy=False)
             elif config.type == FeatureType.CATEGORICAL:
                 self.encoders[name] = LabelEncoder()
             elif config.type == FeatureType.TEXT:
-                self.vectorizers[name] = TfidfVectorizer(max_features=config.dimension or 100)
+                self.vectorizers[name] = TfidfVectorizer(
+                    max_features=config.dimension or 100, dtype=np.float32
+                )
+
+    @classmethod
+    def nodes_to_soa(
+        cls, nodes: List[Dict[str, Any]], keys: Optional[Iterable[str]] = None
+    ) -> Dict[str, List[Any]]:
+        """
+        Regroup node dictionaries into one column per key, with None where a node
+        lacks the key: the layout extract_features_soa takes.
+        Args:
+            nodes: List of node dictionaries with feature values
+            keys: Keys to collect; by default every key of any node
+        Returns:
+            Dictionary of key -> list of values, one per node
+        """
+        if keys is None:
+            keys = dict.fromkeys(key for node in nodes for key in node)
+        return {key: [node.get(key) for node in nodes] for key in keys}
 
     def extract_features(
-        self, nodes: List[Dict[str, Any]], graph: Optional[Any] = None
+        self,
+        nodes: List[Dict[str, Any]],
+        graph: Optional[Any] = None,
+        out_dtype: Union[type, np.dtype, torch.dtype] = np.float32,
     ) -> ExtractionResult:
         """
         Extract features from a list of nodes.
         Args:
             nodes: List of node dictionaries with feature values
             graph: Optional graph structure for structural features
+            out_dtype: Dtype of the feature matrix, see extract_features_soa
         Returns:
             ExtractionResult with extracted and normalized features
         """
         if not nodes:
             return ExtractionResult(features=np.array([]), feature_names=[], feature_dims={})
+        columns = self.nodes_to_soa(nodes, self._column_keys)
+        return self.extract_features_soa(columns, graph, num_nodes=len(nodes), out_dtype=out_dtype)
+
+    def extract_features_soa(
+        self,
+        columns: Mapping[str, NodeColumn],
+        graph: Optional[Any] = None,
+        num_nodes: Optional[int] = None,
+        out_dtype: Union[type, np.dtype, torch.dtype] = np.float32,
+    ) -> ExtractionResult:
+        """
+        Extract features from node data laid out as one column per feature.
+        Callers holding their data in arrays should pass them here directly, e.g.
+        an (N, 2) float array for coordinates or an (N,) float64 array of Unix
+        timestamps; numeric arrays are read as whole blocks and have no missing
+        entries. Lists may hold None for missing values, which then take the
+        feature's default. Structural features look nodes up by the "id" column.
+        Args:
+            columns: Feature name -> values of all nodes
+            graph: Optional graph structure for structural features
+            num_nodes: Number of nodes, by default the length of the columns
+            out_dtype: Dtype of the feature matrix, e.g. np.float16 to halve the
+                bytes moved to the GPU. Extraction and normalization stay in float32
+                and each block is cast once on write. torch.bfloat16 features come
+                back as their np.uint16 bit patterns (NumPy has no bfloat16); view
+                them with torch.from_numpy(features.view(np.int16)).view(torch.bfloat16)
+        Returns:
+            ExtractionResult with extracted and normalized features
+        """
+        if num_nodes is None:
+            num_nodes = len(next(iter(columns.values()))) if columns else 0
+        if not num_nodes:
+            return ExtractionResult(features=np.array([]), feature_names=[], feature_dims={})
         feature_arrays = []
         feature_names = []
         feature_dims = {}
         current_idx = 0
-        missing_mask = np.zeros((len(nodes), len(self.feature_configs)), dtype=bool)
+        missing_mask = np.empty((num_nodes, len(self.feature_configs)), dtype=bool)
         # Extract each feature type
-        for feature_idx, (name, config) in enumerate(self.feature_configs.items()):
+        for feature_idx, (name, config, extract, needs_graph) in enumerate(self._plan):
             logger.debug(f"Extracting feature: {name}")
-            if config.type == FeatureType.SPATIAL:
-                features, names = self._extract_spatial_features(nodes, config)
-            elif config.type == FeatureType.TEMPORAL:
-                features, names = self._extract_temporal_features(nodes, config)
-            elif config.type == FeatureType.CATEGORICAL:
-                features, names = self._extract_categorical_features(nodes, config)
-            elif config.type == FeatureType.NUMERICAL:
-                features, names = self._extract_numerical_features(nodes, config)
-            elif config.type == FeatureType.EMBEDDING:
-                features, names = self._extract_embedding_features(nodes, config)
-            elif config.type == FeatureType.TEXT:
-                features, names = self._extract_text_features(nodes, config)
-            elif config.type == FeatureType.GRAPH_STRUCTURAL:
-                features, names = self._extract_structural_features(nodes, config, graph)
-            else:
-                logger.warning(f"Unknown feature type: {config.type}")
-                features, names = np.zeros((len(nodes), 1), dtype=np.float32), [
-                    f"{config.name}_unknown"
-                ]
+            values = columns.get(name)
             # Track missing values
-            for i, node in enumerate(nodes):
-                if name not in node or node[name] is None:
-                    missing_mask[i, feature_idx] = True
+            if values is None:
+                missing_mask[:, feature_idx] = True
+                values = [None] * num_nodes
+            elif _is_numeric(values):
+                missing_mask[:, feature_idx] = False
+            else:
+                missing_mask[:, feature_idx] = np.fromiter(
+                    (value is None for value in values), dtype=bool, count=num_nodes
+                )
+            if needs_graph:
+                ids = columns.get("id")
+                features, names = extract(
+                    self, range(num_nodes) if ids is None else ids, config, graph
+                )
+            else:
+                features, names = extract(self, values, config)
             # Record feature dimensions
             feature_dims[name] = (current_idx, current_idx + features.shape[1])
             current_idx += features.shape[1]
             feature_arrays.append(features)
             feature_names.extend(names)
-        # Concatenate all features
-        if feature_arrays:
-            all_features = np.concatenate(feature_arrays, axis=1)
+        # Widths depend on the data (categories, vocabularies), so the blocks are
+        # extracted first and then written, cast, into one output buffer
+        bfloat16 = out_dtype is torch.bfloat16
+        dtype = np.dtype(np.float32 if bfloat16 else out_dtype)
+        if len(feature_arrays) == 1 and isinstance(feature_arrays[0], np.ndarray) and (
+            feature_arrays[0].dtype == dtype
+        ):
+            all_features = feature_arrays[0]
         else:
-            all_features = np.zeros((len(nodes), 0))
+            all_features = np.empty((num_nodes, current_idx), dtype=dtype)
+            for (start, end), features in zip(feature_dims.values(), feature_arrays):
+                if sp.issparse(features):
+                    # Scatter the non-zeros of sparse (CSR) blocks into their zeroed slice
+                    all_features[:, start:end] = 0.0
+                    rows = np.repeat(np.arange(num_nodes), np.diff(features.indptr))
+                    all_features[rows, start + features.indices] = features.data
+                else:
+                    all_features[:, start:end] = features
+        if bfloat16:
+            all_features = (
+                torch.from_numpy(all_features).bfloat16().view(torch.int16).numpy().view(np.uint16)
+            )
         return ExtractionResult(
             features=all_features,
             feature_names=feature_names,
             feature_dims=feature_dims,
             missing_mask=missing_mask,
             metadata={
-                "num_nodes": len(nodes),
+                "num_nodes": num_nodes,
                 "num_features": len(feature_names),
                 "extraction_time": datetime.now().isoformat(),
             },
         )
 
+    def _extract_unknown_features(
+        self, values: NodeColumn, config: FeatureConfig
+    ) -> tuple[np.ndarray, list[str]]:
+        """Placeholder column for a feature type without an extractor"""
+        logger.warning(f"Unknown feature type: {config.type}")
+        return np.zeros((len(values), 1), dtype=np.float32), [f"{config.name}_unknown"]
+
     def _extract_spatial_features(
-        self, nodes: List[Dict[str, Any]], config: FeatureConfig
+        self, values: NodeColumn, config: FeatureConfig
     ) -> tuple[np.ndarray, list[str]]:
         """Extract spatial features like coordinates, H3 cells, regions"""
+        is_h3 = "h3" in config.name.lower()
+        features = _dense_column(values)
+        if features is None and config.dimension and not is_h3:
+            # Coordinates of a configured width go straight into their rows
+            features = _sequence_rows(values, config.dimension, config.default_value)
+        if features is None:
+            features = self._extract_spatial_values(values, config, is_h3)
+        # Apply normalization
+        if config.normalization != NormalizationType.NONE:
+            features = self._normalize_features(features, config.name, config.normalization)
+        # Generate feature names
+        if features.shape[1] == 1:
+            names = [config.name]
+        else:
+            names = [f"{config.name}_{i}" for i in range(features.shape[1])]
+        return features, names
+
+    def _extract_spatial_values(
+        self, values: NodeColumn, config: FeatureConfig, is_h3: bool
+    ) -> np.ndarray:
+        """Spatial feature rows of unconfigured width: sequences, scalars or H3 cells"""
         feature_values = []
-        for node in nodes:
-            value = node.get(config.name, config.default_value)
+        h3_rows: List[int] = []
+        h3_cells: List[str] = []
+        for i, value in enumerate(values):
+            if value is None:
+                value = config.default_value
             if value is None:
                 # Handle missing spatial data
                 if config.name in ["x", "y", "z"]:
                     feature_values.append([0.0] * (3 if config.name == "z" else 2))
-                elif "h3" in config.name.lower():
+                elif is_h3:
                     feature_values.append([0.0] * 7)  # H3 cell features
                 else:
                     feature_values.append([0.0])
             else:
                 if isinstance(value, (list, tuple)):
                     feature_values.append(list(value))
-                elif "h3" in config.name.lower() and isinstance(value, str):
-                    # Extract H3 cell features
-                    h3_features = self._extract_h3_features(value)
-                    feature_values.append(h3_features)
+                elif is_h3 and isinstance(value, str):
+                    # H3 cell features are filled in below, for all cells at once
+                    h3_rows.append(i)
+                    h3_cells.append(value)
+                    feature_values.append([0.0] * 7)
                 else:
                     feature_values.append([float(value)])
         features = np.array(feature_values, dtype=np.float32)
-        # Apply normalization
-        if config.normalization != NormalizationType.NONE:
-            features = self._normalize_features(features, config.name, config.normalization)
-        # Generate feature names
-        if features.shape[1] == 1:
-            names = [config.name]
-        else:
-            names = [f"{config.name}_{i}" for i in range(features.shape[1])]
-        return features, names
+        if h3_cells:
+            features[h3_rows] = self._extract_h3_features(h3_cells)
+        return features
 
-    def _extract_h3_features(self, h3_cell: str) -> List[float]:
-        """Extract features from H3 cell identifier"""
-        try:
-            # Get H3 resolution
-            resolution = h3.get_resolution(h3_cell)
-            # Get center coordinates
-            lat, lng = h3.cell_to_latlng(h3_cell)
-            # Get parent cells at different resolutions
-            parent_cells = []
-            for res in range(max(0, resolution - 2), resolution):
-                parent = h3.cell_to_parent(h3_cell, res)
-                parent_lat, parent_lng = h3.cell_to_latlng(parent)
-                parent_cells.extend([parent_lat, parent_lng])
-            features = [resolution, lat, lng] + parent_cells
-            # Pad to fixed size
-            while len(features) < 7:
-                features.append(0.0)
-            return features[:7]
-        except Exception:
-            logger.warning(f"Invalid H3 cell: {h3_cell}")
-            return [0.0] * 7
+    def _extract_h3_features(self, h3_cells: List[str]) -> np.ndarray:
+        """
+        Extract features from H3 cell identifiers: resolution, center and the
+        centers of the (up to two) coarser parent cells, one row of 7 per cell.
+        Resolutions and parents are decoded from the 64-bit cell indices with
+        bit operations, for all distinct cells at once.
+        """
+        unique_cells, inverse = np.unique(np.asarray(h3_cells), return_inverse=True)
+        features = np.zeros((len(unique_cells), 7), dtype=np.float64)
+        valid = np.array([h3 is not None and h3.is_valid_cell(cell) for cell in unique_cells])
+        for cell in unique_cells[~valid]:
+            logger.warning(f"Invalid H3 cell: {cell}")
+        if valid.any():
+            cells = np.array([h3.str_to_int(cell) for cell in unique_cells[valid]], dtype=np.uint64)
+            resolution = ((cells >> np.uint64(52)) & np.uint64(0xF)).astype(np.int64)
+            rows = np.flatnonzero(valid)
+            features[rows, 0] = resolution
+            features[rows, 1:3] = [_h3_center(int(cell)) for cell in cells]
+            # Parents at resolution - 2 and resolution - 1 follow the center, coarsest
+            # first; a parent keeps the cell's leading digits and has the rest set to 7
+            for offset in (2, 1):
+                has_parent = resolution >= offset
+                if not has_parent.any():
+                    continue
+                # The resolution - 1 parent moves up to columns 3-4 when it is the only one
+                column = 3 + 2 * ((offset == 1) & (resolution[has_parent] >= 2))
+                parent_resolution = (resolution[has_parent] - offset).astype(np.uint64)
+                unused_digits = (
+                    np.uint64(1) << (np.uint64(45) - np.uint64(3) * parent_resolution)
+                ) - np.uint64(1)
+                parents = (
+                    (cells[has_parent] & ~np.uint64(0xF << 52))
+                    | (parent_resolution << np.uint64(52))
+                    | unused_digits
+                )
+                centers = np.array([_h3_center(int(parent)) for parent in parents])
+                features[rows[has_parent], column] = centers[:, 0]
+                features[rows[has_parent], column + 1] = centers[:, 1]
+        return features[inverse]
 
     def _extract_temporal_features(
-        self, nodes: List[Dict[str, Any]], config: FeatureConfig
+        self, values: NodeColumn, config: FeatureConfig
     ) -> tuple[np.ndarray, list[str]]:
         """Extract temporal features like timestamps, durations, ages"""
-        feature_values = []
-        for node in nodes:
-            value = node.get(config.name, config.default_value)
-            if value is None:
-                feature_values.append([0.0] * 7)  # Default temporal features
-            else:
+        # Resolve every value to a Unix timestamp first; the calendar fields are
+        # then derived for all nodes at once
+        timestamps = np.zeros(len(values), dtype=np.float64)
+        valid = np.zeros(len(values), dtype=bool)
+        if _is_numeric(values):
+            # Unix timestamps already
+            timestamps[:] = values
+            valid[:] = True
+        elif isinstance(values, np.ndarray) and values.dtype.kind == "M":
+            valid = ~np.isnat(values)
+            # Naive wall-clock times in local time, like naive datetimes below
+            wall = values[valid].astype("datetime64[us]").astype(np.int64) / 1e6
+            timestamps[valid] = wall - _local_offsets(np.floor(wall).astype(np.int64))
+        else:
+            for i, value in enumerate(values):
+                if value is None:
+                    value = config.default_value
                 if isinstance(value, (int, float)):
                     # Assume Unix timestamp
-                    temporal_features = self._extract_timestamp_features(value)
-                elif isinstance(value, str):
+                    timestamps[i] = value
+                elif isinstance(value, (str, datetime)):
                     # Parse datetime string
                     try:
-                        dt = datetime.fromisoformat(value)
-                        timestamp = dt.timestamp()
-                        temporal_features = self._extract_timestamp_features(timestamp)
-                    except Exception:
-                        temporal_features = [0.0] * 7
-                elif isinstance(value, datetime):
-                    timestamp = value.timestamp()
-                    temporal_features = self._extract_timestamp_features(timestamp)
+                        dt = datetime.fromisoformat(value) if isinstance(value, str) else value
+                    except ValueError:
+                        continue
+                    # Naive datetimes are read as local time
+                    timestamps[i] = dt.timestamp()
                 else:
-                    temporal_features = [0.0] * 7
-                feature_values.append(temporal_features)
-        features = np.array(feature_values, dtype=np.float32)
+                    continue
+                valid[i] = True
+        # Missing and unparseable values keep all-zero default temporal features
+        features = np.zeros((len(values), 7), dtype=np.float32)
+        features[valid] = self._extract_timestamp_features(timestamps[valid])
         # Apply normalization
         if config.normalization != NormalizationType.NONE:
             features = self._normalize_features(features, config.name, config.normalization)
@@ -383,68 +613,84 @@ class NodeFeatureExtractor:
         ]
         return features, names[: features.shape[1]]
 
-    def _extract_timestamp_features(self, timestamp: float) -> List[float]:
-        """Extract multiple features from a timestamp"""
-        dt = datetime.fromtimestamp(timestamp)
-        features = [
-            dt.hour / 24.0,  # Normalized hour
-            dt.weekday() / 6.0,  # Normalized day of week
-            dt.day / 31.0,  # Normalized day of month
-            dt.month / 12.0,  # Normalized month
-            (dt.year - 2000) / 100.0,  # Normalized year
-            float(dt.weekday() >= 5),  # Is weekend
-            timestamp / 1e10,  # Normalized timestamp
-        ]
+    def _extract_timestamp_features(self, timestamps: np.ndarray) -> np.ndarray:
+        """
+        Extract multiple features from an array of Unix timestamps, in local time
+        like the edge features of edge_processor
+        """
+        seconds = np.floor(timestamps).astype(np.int64)
+        seconds += _local_offsets(seconds)
+        days = seconds // 86400
+        # 1970-01-01 was a Thursday (weekday 3)
+        weekday = (days + 3) % 7
+        date = days.astype("datetime64[D]")
+        month_start = date.astype("datetime64[M]")
+        year_start = date.astype("datetime64[Y]")
+        features = np.empty((len(timestamps), 7), dtype=np.float64)
+        features[:, 0] = (seconds - days * 86400) // 3600 / 24.0  # Normalized hour
+        features[:, 1] = weekday / 6.0  # Normalized day of week
+        features[:, 2] = ((date - month_start).astype(np.int64) + 1) / 31.0  # Day of month
+        features[:, 3] = ((month_start - year_start).astype(np.int64) + 1) / 12.0  # Month
+        features[:, 4] = (year_start.astype(np.int64) + 1970 - 2000) / 100.0  # Normalized year
+        features[:, 5] = weekday >= 5  # Is weekend
+        features[:, 6] = timestamps / 1e10  # Normalized timestamp
         return features
 
     def _extract_categorical_features(
-        self, nodes: List[Dict[str, Any]], config: FeatureConfig
+        self, values: NodeColumn, config: FeatureConfig
     ) -> tuple[np.ndarray, list[str]]:
         """Extract categorical features with one-hot or label encoding"""
-        values = []
-        for node in nodes:
-            value = node.get(config.name, config.default_value)
-            if value is None:
-                value = "unknown"
-            values.append(str(value))
-        # Fit encoder if not already fitted
-        if config.name not in self.encoders:
-            self.encoders[config.name] = LabelEncoder()
-        try:
-            # Try to transform with existing encoder
-            encoded = self.encoders[config.name].transform(values)
-        except ValueError:
-            # Refit if new categories found
-            self.encoders[config.name].fit(values)
-            encoded = self.encoders[config.name].transform(values)
+        default = "unknown" if config.default_value is None else str(config.default_value)
+        values = [default if value is None else str(value) for value in values]
+        # Fit encoder on the first batch; its classes seed the category -> column index
+        index = self.category_index.get(config.name)
+        if index is None:
+            encoder = self.encoders.setdefault(config.name, LabelEncoder())
+            if not hasattr(encoder, "classes_"):
+                encoder.fit(values)
+            index = self.category_index[config.name] = {
+                cls: i for i, cls in enumerate(encoder.classes_)
+            }
+        encoded = np.fromiter((index.get(value, -1) for value in values), np.int64, len(values))
+        unseen = np.flatnonzero(encoded < 0)
+        if len(unseen):
+            # New categories get columns after the known ones instead of a refit, so
+            # existing columns keep their meaning
+            for i in unseen:
+                encoded[i] = index.setdefault(values[i], len(index))
+            self.encoders[config.name].classes_ = np.array(list(index), dtype=object)
         # One-hot encode
-        num_classes = len(self.encoders[config.name].classes_)
-        one_hot = np.zeros((len(nodes), num_classes), dtype=np.float32)
-        one_hot[np.arange(len(nodes)), encoded] = 1.0
+        one_hot = np.zeros((len(values), len(index)), dtype=np.float32)
+        one_hot[np.arange(len(values)), encoded] = 1.0
         # Generate feature names
-        names = [f"{config.name}_{cls}" for cls in self.encoders[config.name].classes_]
+        names = [f"{config.name}_{cls}" for cls in index]
         return one_hot, names
 
     def _extract_numerical_features(
-        self, nodes: List[Dict[str, Any]], config: FeatureConfig
+        self, values: NodeColumn, config: FeatureConfig
     ) -> tuple[np.ndarray, list[str]]:
         """Extract numerical features with appropriate scaling"""
-        values = []
-        for node in nodes:
-            value = node.get(config.name, config.default_value)
-            if value is None:
-                value = 0.0 if config.default_value is None else config.default_value
-            # Handle different numerical formats
-            if isinstance(value, (list, tuple)):
-                values.append(list(value))
-            else:
-                values.append([float(value)])
-        features = np.array(values, dtype=np.float32)
+        default = 0.0 if config.default_value is None else config.default_value
+        features = _dense_column(values)
+        if features is None and config.dimension:
+            # Known width: fill rows of one block
+            features = _sequence_rows(values, config.dimension, default)
+        if features is None:
+            rows = []
+            for value in values:
+                if value is None:
+                    value = default
+                # Handle different numerical formats
+                if isinstance(value, (list, tuple)):
+                    rows.append(list(value))
+                else:
+                    rows.append([float(value)])
+            features = np.array(rows, dtype=np.float32)
         # Apply constraints if specified
-        if "min" in config.constraints:
-            features = np.maximum(features, config.constraints["min"])
-        if "max" in config.constraints:
-            features = np.minimum(features, config.constraints["max"])
+        low = config.constraints.get("min")
+        high = config.constraints.get("max")
+        if low is not None or high is not None:
+            np.clip(features, low, high, out=features)
         # Apply normalization
         if config.normalization != NormalizationType.NONE:
             features = self._normalize_features(features, config.name, config.normalization)
@@ -456,89 +702,90 @@ class NodeFeatureExtractor:
         return features, names
 
     def _extract_embedding_features(
-        self, nodes: List[Dict[str, Any]], config: FeatureConfig
+        self, values: NodeColumn, config: FeatureConfig
     ) -> tuple[np.ndarray, list[str]]:
         """Extract pre-computed embeddings or generate new ones"""
-        embeddings = []
         embedding_dim = config.dimension or 16
-        for node in nodes:
-            value = node.get(config.name, None)
-            if value is None:
-                # Generate random embedding or use zero embedding
-                if config.default_value == "random":
-                    embedding = np.random.randn(embedding_dim) * 0.1
+        features = np.zeros((len(values), embedding_dim), dtype=np.float32)
+        hashed_rows: List[int] = []
+        hashed_values: List[Any] = []
+        if _is_numeric(values):
+            # One precomputed embedding per row, truncated or zero-padded
+            embeddings = np.asarray(values).reshape(len(values), -1)[:, :embedding_dim]
+            features[:, : embeddings.shape[1]] = embeddings
+        else:
+            for i, value in enumerate(values):
+                if value is None:
+                    # Generate random embedding or use zero embedding
+                    if config.default_value == "random":
+                        features[i] = np.random.randn(embedding_dim) * 0.1
+                elif isinstance(value, (list, np.ndarray)):
+                    # Truncate or zero-pad to embedding_dim
+                    embedding = np.asarray(value)[:embedding_dim]
+                    features[i, : len(embedding)] = embedding
                 else:
-                    embedding = np.zeros(embedding_dim)
-            elif isinstance(value, (list, np.ndarray)):
-                embedding = np.array(value)
-                if len(embedding) != embedding_dim:
-                    # Resize embedding if needed
-                    if len(embedding) > embedding_dim:
-                        embedding = embedding[:embedding_dim]
-                    else:
-                        padding = np.zeros(embedding_dim - len(embedding))
-                        embedding = np.concatenate([embedding, padding])
-            else:
-                # Generate embedding from value (e.g., using hash)
-                embedding = self._generate_embedding_from_value(value, embedding_dim)
-            embeddings.append(embedding)
-        features = np.array(embeddings, dtype=np.float32)
+                    # Generated from the value's hash below, for all such nodes at once
+                    hashed_rows.append(i)
+                    hashed_values.append(value)
+        if hashed_values:
+            features[hashed_rows] = self._generate_embedding_from_value(
+                hashed_values, embedding_dim
+            )
         # Normalize embeddings
         if config.normalization != NormalizationType.NONE:
-            features = F.normalize(torch.from_numpy(features), p=2, dim=1).numpy()
+            # Unit L2 norm per row, in place; zero rows stay zero
+            norms = np.linalg.norm(features, axis=1, keepdims=True)
+            np.divide(features, np.maximum(norms, 1e-12), out=features)
         # Generate feature names
         names = [f"{config.name}_{i}" for i in range(embedding_dim)]
         return features, names
 
-    def _generate_embedding_from_value(self, value: Any, dim: int) -> np.ndarray:
-        """Generate embedding from arbitrary value using hashing"""
-        # Convert value to string and hash
-        str_value = str(value)
-        hash_value = hash(str_value)
-        # Use hash as seed for reproducible random embedding
-        np.random.seed(abs(hash_value) % (2**32))
-        embedding = np.random.randn(dim) * 0.1
-        np.random.seed()  # Reset seed
-        return embedding
+    def _generate_embedding_from_value(self, values: List[Any], dim: int) -> np.ndarray:
+        """
+        Generate one embedding per value from the hash of its string form. Recurring
+        values (statuses, agent ids) are generated once and then served from a cache.
+        """
+        return np.stack([_hashed_embedding(str(value), dim) for value in values])
 
     def _extract_text_features(
-        self, nodes: List[Dict[str, Any]], config: FeatureConfig
-    ) -> tuple[np.ndarray, list[str]]:
-        """Extract features from text using TF-IDF or other methods"""
-        texts = []
-        for node in nodes:
-            value = node.get(config.name, config.default_value)
-            if value is None:
-                texts.append("")
-            else:
-                texts.append(str(value))
+        self, values: NodeColumn, config: FeatureConfig
+    ) -> tuple[Union[np.ndarray, sp.csr_matrix], list[str]]:
+        """Extract features from text using TF-IDF or other methods, as a sparse matrix"""
+        default = "" if config.default_value is None else str(config.default_value)
+        texts = [default if value is None else str(value) for value in values]
+        dimension = config.dimension or 100
+        placeholder_names = [f"{config.name}_{i}" for i in range(dimension)]
         # Get or create vectorizer
         if config.name not in self.vectorizers:
             self.vectorizers[config.name] = TfidfVectorizer(
-                max_features=config.dimension or 100, stop_words="english"
+                max_features=dimension, stop_words="english", dtype=np.float32
             )
-        try:
-            # Transform texts
-            features = self.vectorizers[config.name].fit_transform(texts).toarray()
-        except Exception:
-            # Fallback to zero features
-            features = np.zeros((len(nodes), config.dimension or 100))
+        vectorizer = self.vectorizers[config.name]
+        # Fitted on the first batch with a vocabulary only, so later batches share
+        # its columns
+        if not hasattr(vectorizer, "vocabulary_"):
+            if not any(texts):
+                # Nothing to vectorize
+                return np.zeros((len(texts), dimension), dtype=np.float32), placeholder_names
+            try:
+                vectorizer.fit(texts)
+            except ValueError:
+                # Empty vocabulary, e.g. the texts hold only stop words
+                return np.zeros((len(texts), dimension), dtype=np.float32), placeholder_names
+        # Transform texts
+        features = vectorizer.transform(texts)
         # Generate feature names
-        try:
-            vocab = self.vectorizers[config.name].get_feature_names_out()
-            names = [f"{config.name}_{word}" for word in vocab]
-        except Exception:
-            names = [f"{config.name}_{i}" for i in range(features.shape[1])]
-        return features.astype(np.float32), names
+        names = [f"{config.name}_{word}" for word in vectorizer.get_feature_names_out()]
+        return features, names
 
     def _extract_structural_features(
-        self, nodes: List[Dict[str, Any]], config: FeatureConfig, graph: Optional[Any]
+        self, ids: NodeColumn, config: FeatureConfig, graph: Optional[Any]
     ) -> tuple[np.ndarray, list[str]]:
-        """Extract graph structural features like degree, centrality, etc"""
+        """Extract graph structural features like degree, centrality, etc, by node id"""
         if graph is None:
             # Return default features if no graph provided
             num_features = 5  # degree, in_degree, out_degree, clustering, pagerank
-            features = np.zeros((len(nodes), num_features), dtype=np.float32)
+            features = np.zeros((len(ids), num_features), dtype=np.float32)
             names = [
                 f"{config.name}_degree",
                 f"{config.name}_in_degree",
@@ -548,20 +795,13 @@ class NodeFeatureExtractor:
             ]
             return features, names
         # Extract structural features from graph
-        # This is a placeholder - actual implementation would depend on graph library
-        structural_features: List[List[float]] = []
-        for i, node in enumerate(nodes):
-            node_id = node.get("id", i)
-            # Example structural features
-            structural_feats: List[float] = [
-                float(graph.degree(node_id) if hasattr(graph, "degree") else 0),
-                float(graph.in_degree(node_id) if hasattr(graph, "in_degree") else 0),
-                float(graph.out_degree(node_id) if hasattr(graph, "out_degree") else 0),
-                0.0,  # Clustering coefficient placeholder
-                0.0,  # PageRank placeholder
-            ]
-            structural_features.append(structural_feats)
-        features = np.array(structural_features, dtype=np.float32)
+        node_ids = [i if node_id is None else node_id for i, node_id in enumerate(ids)]
+        features = np.zeros((len(node_ids), 5), dtype=np.float32)
+        for column, attribute in enumerate(("degree", "in_degree", "out_degree")):
+            degree = getattr(graph, attribute, None)
+            if degree is not None:
+                features[:, column] = _node_degrees(degree, node_ids)
+        # Clustering coefficient and PageRank are placeholders (zero)
         # Normalize
         if config.normalization != NormalizationType.NONE:
             features = self._normalize_features(features, config.name, config.normalization)
@@ -577,34 +817,33 @@ class NodeFeatureExtractor:
     def _normalize_features(
         self, features: np.ndarray, name: str, normalization: NormalizationType
     ) -> np.ndarray:
-        """Apply normalization to features"""
+        """
+        Apply normalization to a 2D feature block, in place: the block is owned by
+        the extractor that built it, and the scalers are created with copy=False.
+        """
         if normalization == NormalizationType.NONE:
             return features
-        # Handle single feature vs multiple features
-        if features.ndim == 1:
-            features = features.reshape(-1, 1)
-            single_feature = True
-        else:
-            single_feature = False
-        # Apply normalization
         if normalization == NormalizationType.LOG:
-            # Log transformation (add small epsilon to avoid log(0))
-            features = np.log1p(np.abs(features))
+            # log(1 + |x|) is defined at 0
+            np.abs(features, out=features)
+            np.log1p(features, out=features)
         else:
             # Use scikit-learn scalers
             if name not in self.scalers:
                 if normalization == NormalizationType.STANDARD:
-                    self.scalers[name] = StandardScaler()
+                    self.scalers[name] = StandardScaler(copy=False)
                 elif normalization == NormalizationType.MINMAX:
-                    self.scalers[name] = MinMaxScaler()
+                    self.scalers[name] = MinMaxScaler(copy=False)
                 elif normalization == NormalizationType.ROBUST:
-                    self.scalers[name] = RobustScaler()
+                    self.scalers[name] = RobustScaler(copy=False)
+            scaler = self.scalers[name]
             try:
-                features = self.scalers[name].fit_transform(features)
+                # Fitted on the first batch only, so later batches are scaled alike
+                if not hasattr(scaler, "scale_"):
+                    scaler.fit(features)
+                features = scaler.transform(features)
             except Exception:
                 logger.warning(f"Failed to normalize {name}, using raw values")
-        if single_feature:
-            features = features.ravel()
         return features
 
     def handle_missing_data(
@@ -622,31 +861,39 @@ class NodeFeatureExtractor:
         if not np.any(missing_mask):
             return features
         features_imputed = features.copy()
-        for feature_idx in range(features.shape[1]):
-            missing_in_feature = missing_mask[:, feature_idx]
-            if not np.any(missing_in_feature):
-                continue
-            if strategy == "mean":
-                fill_value = np.mean(features[~missing_in_feature, feature_idx])
-            elif strategy == "median":
-                fill_value = np.median(features[~missing_in_feature, feature_idx])
-            elif strategy == "zero":
-                fill_value = 0.0
-            elif strategy == "forward_fill":
-                # Forward fill missing values
-                last_valid = 0.0
-                for i in range(len(features)):
-                    if missing_in_feature[i]:
-                        features_imputed[i, feature_idx] = last_valid
-                    else:
-                        last_valid = features_imputed[i, feature_idx]
-                continue
-            else:
-                fill_value = 0.0
-            features_imputed[missing_in_feature, feature_idx] = fill_value
+        # Fill values for all columns at once; only the missing cells are overwritten
+        if strategy == "mean":
+            valid = ~missing_mask
+            with np.errstate(invalid="ignore", divide="ignore"):
+                fill_values = np.where(valid, features, 0).sum(axis=0) / valid.sum(axis=0)
+        elif strategy == "median":
+            fill_values = np.nanmedian(np.where(missing_mask, np.nan, features), axis=0)
+        elif strategy == "forward_fill":
+            # Row of the last valid value at or above each cell, -1 before the first one
+            rows = np.where(missing_mask, -1, np.arange(len(features))[:, None])
+            np.maximum.accumulate(rows, axis=0, out=rows)
+            previous = np.take_along_axis(features, np.maximum(rows, 0), axis=0)
+            fill_values = np.where(rows >= 0, previous, 0.0)
+        else:
+            # "zero" and unknown strategies
+            fill_values = 0.0
+        np.copyto(features_imputed, fill_values, casting="unsafe", where=missing_mask)
         return features_imputed
 
 
+# Extractor per feature type; each takes the extractor, the feature's column and config
+# (GRAPH_STRUCTURAL takes the node id column and the graph instead)
+_FEATURE_EXTRACTORS: Dict[FeatureType, Callable[..., Tuple[Any, List[str]]]] = {
+    FeatureType.SPATIAL: NodeFeatureExtractor._extract_spatial_features,
+    FeatureType.TEMPORAL: NodeFeatureExtractor._extract_temporal_features,
+    FeatureType.CATEGORICAL: NodeFeatureExtractor._extract_categorical_features,
+    FeatureType.NUMERICAL: NodeFeatureExtractor._extract_numerical_features,
+    FeatureType.EMBEDDING: NodeFeatureExtractor._extract_embedding_features,
+    FeatureType.TEXT: NodeFeatureExtractor._extract_text_features,
+    FeatureType.GRAPH_STRUCTURAL: NodeFeatureExtractor._extract_structural_features,
+}
+
+
 # Example usage
 if __name__ == "__main__":
     # Define feature configurations
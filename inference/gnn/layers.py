@@ -6,12 +6,16 @@ This module implements various GNN layers including GCN, GAT, and
 Implements the GAT layer from Velickovic et al. (2018).
 """
 
+import contextlib
+import functools
+from dataclasses import dataclass
 from enum import Enum
-from typing import Any, List, Optional, Union, Tuple
+from typing import Any, Callable, Dict, List, Optional, Union, Tuple
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.utils.weak import WeakTensorKeyDictionary
 from torch_geometric.nn import (  # type: ignore[import-untyped]
     EdgeConv,
     GATConv,
@@ -20,8 +24,12 @@ from torch_geometric.nn import (  # type: ignore[import-untyped]
     MessagePassing,
     SAGEConv,
 )
+from torch_geometric.nn import Linear as PyGLinear  # type: ignore[import-untyped]
 from torch_geometric.utils import degree  # type: ignore[import-untyped]
-from torch_geometric.utils import add_self_loops
+from torch_geometric.utils import add_self_loops, remove_self_loops
+
+# Sort permutation and CSR offsets per index tensor, see _segments
+_SEGMENT_CACHE = WeakTensorKeyDictionary()
 
 
 class AggregationType(Enum):
@@ -59,6 +67,104 @@ class LayerConfig:
         self.residual = residual
 
 
+@dataclass
+class CSRGraph:
+    """
+    Edges sorted by destination with the CSR offsets of their segments: the
+    incoming edges of node i are row[crow[i]:crow[i + 1]]. perm maps the sorted
+    edges back to their positions in the original edge index.
+    """
+
+    row: torch.Tensor
+    col: torch.Tensor
+    crow: torch.Tensor
+    perm: torch.Tensor
+
+    @property
+    def edge_index(self) -> torch.Tensor:
+        """Sorted edge index [2, E]"""
+        return torch.stack([self.row, self.col])
+
+    @property
+    def num_nodes(self) -> int:
+        return self.crow.numel() - 1
+
+
+def to_sorted_csr(edge_index: torch.Tensor, num_nodes: int) -> CSRGraph:
+    """
+    Sort edges by destination (stably, so the order within each segment is kept).
+    Gathers and scatters over the sorted edges visit destination rows in order,
+    and reductions over the incoming edges of each node become contiguous
+    segment reductions.
+    """
+    perm = edge_index[1].argsort(stable=True)
+    row, col = edge_index[0][perm], edge_index[1][perm]
+    crow = torch.ops.aten._convert_indices_from_coo_to_csr(col, num_nodes)
+    return CSRGraph(row, col, crow, perm)
+
+
+def _sparse_adjacency(
+    edge_index: torch.Tensor, edge_weight: torch.Tensor, num_nodes: int
+) -> torch.Tensor:
+    """
+    CSR adjacency A with A[target, source] = edge weight (duplicate edges summed),
+    so that A @ x sums the weighted messages x_source into every target node.
+    """
+    return (
+        torch.sparse_coo_tensor(
+            edge_index.flip(0), edge_weight, (num_nodes, num_nodes)
+        )
+        .coalesce()
+        .to_sparse_csr()
+    )
+
+
+def _sparse_edges(adj: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Edge index and edge weights of a sparse (COO or CSR) adjacency A[target, source]"""
+    coo = adj.to_sparse_coo().coalesce()
+    return coo.indices().flip(0), coo.values()
+
+
+def _add_remaining_self_loops(
+    edge_index: torch.Tensor, edge_weight: torch.Tensor, fill_value: float, num_nodes: int
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    add_remaining_self_loops without its boolean mask, whose data-dependent output
+    size breaks torch.compile graphs. Existing self-loops stay in place with weight
+    0 and their weight moves to the appended loop of the node, which leaves every
+    weighted sum over the edges unchanged.
+    """
+    row, col = edge_index[0], edge_index[1]
+    is_loop = row == col
+    # Non-loop edges write to a spare slot past the last node
+    loop_weight = edge_weight.new_full((num_nodes + 1,), fill_value)
+    loop_weight.scatter_(0, torch.where(is_loop, row, num_nodes), edge_weight)
+    loop_index = torch.arange(num_nodes, device=row.device).unsqueeze(0).repeat(2, 1)
+    edge_index = torch.cat([edge_index, loop_index], dim=1)
+    edge_weight = torch.cat([edge_weight.masked_fill(is_loop, 0), loop_weight[:num_nodes]])
+    return edge_index, edge_weight
+
+
+def _propagation_dtype(x: torch.Tensor) -> torch.dtype:
+    """
+    dtype in which sparse propagation of x runs: the autocast dtype on CUDA, whose
+    sparse products have reduced-precision kernels, otherwise that of x
+    """
+    device = x.device.type
+    if device == "cuda" and torch.is_autocast_enabled(device):
+        return torch.get_autocast_dtype(device)
+    return x.dtype
+
+
+def _propagate(adj: torch.Tensor, x: torch.Tensor) -> torch.Tensor:
+    """
+    Sparse product adj @ x. Sparse products lack reduced-precision CPU kernels,
+    so it runs in the adjacency's dtype, see _propagation_dtype.
+    """
+    with torch.autocast(x.device.type, enabled=False):
+        return torch.sparse.mm(adj, x.to(adj.dtype))
+
+
 class GCNLayer(nn.Module):
     """Graph Convolutional Network layer using PyTorch Geometric"""
 
@@ -79,6 +185,7 @@ class GCNLayer(nn.Module):
         self.cached = cached
         self.normalize = normalize
         self._cached_edge_index = None  # Add cached edge index attribute
+        self._cached_adj: Optional[torch.Tensor] = None
 
         self.conv = GCNConv(
             in_channels=in_channels,
@@ -103,18 +210,166 @@ class GCNLayer(nn.Module):
         """Reset layer parameters"""
         self.conv.reset_parameters()
         self._cached_edge_index = None  # Reset cache
+        self._cached_adj = None
 
-    def forward(self, x: torch.Tensor, edge_index: torch.Tensor, edge_weight: Optional[torch.Tensor] = None) -> torch.Tensor:
-        """Forward pass through GCN layer"""
-        # Store cached edge index if caching enabled
-        if self.cached:
-            self._cached_edge_index = edge_index
-        
-        # Pass edge_weight if provided
-        if edge_weight is not None:
-            return self.conv(x, edge_index, edge_weight)  # type: ignore[no-any-return]
+    def __getstate__(self) -> Dict[str, Any]:
+        """Pickled and deep-copied without the cache, as sparse CSR tensors cannot be"""
+        state = self.__dict__.copy()
+        state["_cached_edge_index"] = None
+        state["_cached_adj"] = None
+        return state
+
+    @staticmethod
+    def norm(
+        edge_index: torch.Tensor,
+        num_nodes: int,
+        edge_weight: Optional[torch.Tensor] = None,
+        improved: bool = False,
+        add_self_loops: bool = True,
+        dtype: Optional[torch.dtype] = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Edge weights of the normalized adjacency D^-1/2 (A + I) D^-1/2, as in GCNConv.
+        The weights are returned in dtype (default: that of edge_weight), while
+        degrees are summed in at least float32, in which counts stay exact.
+        """
+        if edge_weight is None:
+            edge_weight = torch.ones((edge_index.size(1),), dtype=dtype, device=edge_index.device)
+        if add_self_loops:
+            fill_value = 2.0 if improved else 1.0
+            edge_index, edge_weight = _add_remaining_self_loops(
+                edge_index, edge_weight, fill_value, num_nodes
+            )
+        row, col = edge_index[0], edge_index[1]
+        accumulate = torch.promote_types(edge_weight.dtype, torch.float32)
+        deg = scatter_add(edge_weight.to(accumulate), col, dim=0, dim_size=num_nodes)
+        # masked_fill_ rather than boolean indexing, which torch.compile cannot trace
+        deg_inv_sqrt = deg.rsqrt().masked_fill_(deg == 0, 0)
+        edge_weight = deg_inv_sqrt[row] * edge_weight * deg_inv_sqrt[col]
+        return edge_index, edge_weight.to(dtype or edge_weight.dtype)
+
+    def adjacency(
+        self,
+        edge_index: torch.Tensor,
+        num_nodes: int,
+        edge_weight: Optional[torch.Tensor] = None,
+        dtype: Optional[torch.dtype] = None,
+    ) -> torch.Tensor:
+        """
+        Sparse CSR propagation matrix of the layer, normalized if configured.
+        edge_index may also be a sparse adjacency A[target, source], whose values
+        are the edge weights.
+        """
+        if edge_index.layout != torch.strided:
+            edge_index, edge_weight = _sparse_edges(edge_index)
+        if self.normalize:
+            edge_index, edge_weight = self.norm(
+                edge_index,
+                num_nodes,
+                edge_weight,
+                self.improved,
+                self.conv.add_self_loops,
+                dtype,
+            )
+        elif edge_weight is None:
+            edge_weight = torch.ones((edge_index.size(1),), dtype=dtype, device=edge_index.device)
+        return _sparse_adjacency(edge_index, edge_weight, num_nodes)
+
+    def forward(
+        self,
+        x: torch.Tensor,
+        edge_index: torch.Tensor,
+        edge_weight: Optional[torch.Tensor] = None,
+        adj: Optional[torch.Tensor] = None,
+    ) -> torch.Tensor:
+        """
+        Forward pass through GCN layer.
+        GCN messages are weighted sums of neighbor features, so propagation is one
+        sparse-dense product A_norm @ (x W) instead of per-edge messages. A
+        propagation matrix precomputed with adjacency() may be passed as adj, in
+        which case edge_index and edge_weight are not used. In place of edge_index
+        a sparse adjacency A[target, source] may be given, normalized like one
+        built from the edges. Under torch.compile,
+        which cannot trace sparse tensor construction, messages are passed per
+        edge instead.
+        """
+        if adj is None and torch.compiler.is_compiling():
+            h = self.conv.lin(x)
+            if self.normalize:
+                edge_index, edge_weight = self.norm(
+                    edge_index,
+                    x.size(0),
+                    edge_weight,
+                    self.improved,
+                    self.conv.add_self_loops,
+                    _propagation_dtype(x),
+                )
+            out = self.conv.propagate(edge_index, x=h, edge_weight=edge_weight)
         else:
-            return self.conv(x, edge_index)  # type: ignore[no-any-return]
+            out = self._propagate_sparse(x, edge_index, edge_weight, adj)
+        if self.conv.bias is not None:
+            out = out + self.conv.bias
+        return out
+
+    def _propagate_sparse(
+        self,
+        x: torch.Tensor,
+        edge_index: torch.Tensor,
+        edge_weight: Optional[torch.Tensor],
+        adj: Optional[torch.Tensor],
+    ) -> torch.Tensor:
+        """Propagation of x W with the given, cached or newly built sparse adjacency"""
+        if adj is None:
+            if self.cached and edge_index is self._cached_edge_index:
+                adj = self._cached_adj
+            if adj is None:
+                adj = self.adjacency(edge_index, x.size(0), edge_weight, _propagation_dtype(x))
+                # Store cached edge index and adjacency if caching enabled
+                if self.cached:
+                    self._cached_edge_index = edge_index
+                    self._cached_adj = adj
+        return _propagate(adj, self.conv.lin(x))
+
+
+def _gat_attention(
+    h: torch.Tensor,
+    alpha_src: torch.Tensor,
+    alpha_dst: torch.Tensor,
+    edge_index: torch.Tensor,
+    negative_slope: float,
+    dropout: float,
+    training: bool,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Attention-weighted sum of GAT messages for projected features h [N, H, C] and
+    per-node source and target attention logits alpha_src, alpha_dst [N, H].
+    Logits, leaky ReLU, the softmax over each target's incoming edges, dropout and
+    the weighted sum form one function, so torch.compile can fuse them instead of
+    writing every edge-sized intermediate out. Returns the output [N, H, C] and the
+    attention weights [E, H].
+    """
+    src, dst = edge_index[0], edge_index[1]
+    alpha = alpha_src[src] + alpha_dst[dst]
+    alpha = F.leaky_relu(alpha, negative_slope)
+    # Softmax over the incoming edges of every target node
+    dst_heads = dst.unsqueeze(-1).expand_as(alpha)
+    alpha_max = torch.full(
+        (h.size(0), h.size(1)), float("-inf"), dtype=alpha.dtype, device=alpha.device
+    ).scatter_reduce(0, dst_heads, alpha, "amax")
+    alpha = (alpha - alpha_max[dst]).exp()
+    alpha_sum = torch.zeros_like(alpha_max).index_add_(0, dst, alpha)
+    alpha = alpha / (alpha_sum[dst] + 1e-16)
+    alpha = F.dropout(alpha, p=dropout, training=training)
+    # Accumulated in the dtype of the weighted messages, float32 for reduced-precision h
+    messages = h[src] * alpha.unsqueeze(-1)
+    out = messages.new_zeros(h.shape).index_add_(0, dst, messages)
+    return out, alpha
+
+
+@functools.lru_cache(maxsize=None)
+def _compiled_gat_attention() -> Callable[..., Tuple[torch.Tensor, torch.Tensor]]:
+    """_gat_attention compiled once, with dynamic shapes so edge counts can vary"""
+    return torch.compile(_gat_attention, dynamic=True)  # type: ignore[no-any-return]
 
 
 class GATLayer(nn.Module):
@@ -160,17 +415,64 @@ class GATLayer(nn.Module):
         """Get dropout probability"""
         return self.dropout_p
 
+    @staticmethod
+    def self_loops(edge_index: torch.Tensor, num_nodes: int) -> torch.Tensor:
+        """Edge index with exactly one self-loop per node, as attended over by GATConv"""
+        edge_index, _ = remove_self_loops(edge_index)
+        edge_index, _ = add_self_loops(edge_index, num_nodes=num_nodes)
+        return edge_index
+
+    def project(self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Projected features x W [N, H, C] and the source and target attention logits
+        [N, H] of every node. The logits <x W_h, a_h> equal x (W_h^T a_h), so the
+        attention vectors are folded into the weight as 2 H extra output columns
+        and everything comes out of one matrix product.
+        """
+        heads, channels = self.heads, self.out_channels
+        weight = self.conv.lin.weight
+        att = torch.stack([self.conv.att_src, self.conv.att_dst]).view(2, heads, channels, 1)
+        att_weight = (weight.view(heads, channels, -1) * att).sum(dim=2)
+        out = F.linear(x, torch.cat([weight, att_weight.view(2 * heads, -1)]))
+        h, alpha_src, alpha_dst = out.split([heads * channels, heads, heads], dim=-1)
+        return h.view(-1, heads, channels), alpha_src, alpha_dst
+
     def forward(
         self,
         x: torch.Tensor,
         edge_index: torch.Tensor,
         edge_attr: Optional[torch.Tensor] = None,
         return_attention_weights: bool = False,
-    ) -> torch.Tensor:
-        """Forward pass with optional attention weight return"""
+        self_loops_added: bool = False,
+    ) -> Union[torch.Tensor, Tuple[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]]:
+        """
+        Forward pass with optional attention weight return.
+        Uses the parameters of the underlying GATConv; on CUDA the attention runs
+        as a compiled, fused kernel. Pass self_loops_added=True for an edge_index
+        already prepared with self_loops().
+        """
+        h, alpha_src, alpha_dst = self.project(x)
+        if self.conv.add_self_loops and not self_loops_added:
+            edge_index = self.self_loops(edge_index, x.size(0))
+        attention = _compiled_gat_attention() if x.is_cuda else _gat_attention
+        out, alpha = attention(
+            h,
+            alpha_src,
+            alpha_dst,
+            edge_index,
+            self.negative_slope,
+            self.dropout_p,
+            self.training,
+        )
+        if self.concat:
+            out = out.reshape(-1, self.heads * self.out_channels)
+        else:
+            out = out.mean(dim=1)
+        if self.conv.bias is not None:
+            out = out + self.conv.bias
         if return_attention_weights:
-            return self.conv(x, edge_index, return_attention_weights=True)
-        return self.conv(x, edge_index)
+            return out, (edge_index, alpha)
+        return out
 
 
 class GNNStack(nn.Module):
@@ -234,42 +536,294 @@ class GNNStack(nn.Module):
 
             self.layers.append(layer)
 
+        # Last graph prepared for the layers: (edge_index, key, prepared edge_index, kwargs)
+        self._cached_graph: Optional[Tuple[Any, ...]] = None
+        # Autocast dtype set by to_inference
+        self.inference_dtype: Optional[torch.dtype] = None
+        # CUDA graph set by capture: (graph, static input, static output, prepared graph)
+        self._cuda_graph: Optional[Tuple[Any, ...]] = None
+        # Copy stream of preload and the events of its copies, by device tensor
+        self._prefetch_stream: Optional[torch.cuda.Stream] = None
+        self._prefetch_events = WeakTensorKeyDictionary()
+
+    def to_inference(self, dtype: torch.dtype = torch.bfloat16) -> nn.Module:
+        """
+        Prepare the stack for reduced-precision inference, in eval mode.
+        For torch.bfloat16 or torch.float16 the linear projections are cast to dtype
+        and forward runs under autocast; attention vectors, normalization and
+        aggregation stay in float32, and the output is returned in the dtype of x.
+        For torch.qint8 a dynamically quantized copy of the stack is returned (CPU
+        inference), with int8 torch.nn.Linear layers. GCN, GAT and SAGE project
+        through PyG Linear layers, which dynamic quantization leaves in float32, so
+        they raise ValueError rather than return an unquantized stack.
+        """
+        self.eval()
+        if dtype == torch.qint8:
+            if any(isinstance(module, PyGLinear) for module in self.modules()):
+                raise ValueError(
+                    f"int8 dynamic quantization does not support {self.layer_type} "
+                    "layers, whose projections are PyG Linear layers"
+                )
+            return torch.ao.quantization.quantize_dynamic(  # type: ignore[no-any-return]
+                self, {nn.Linear}, dtype=torch.qint8
+            )
+        for module in self.modules():
+            if isinstance(module, (nn.Linear, PyGLinear)):
+                module.to(dtype)
+        self.inference_dtype = dtype
+        return self
+
+    def jit(self, **compile_kwargs: Any) -> nn.Module:
+        """
+        The stack compiled with torch.compile, sharing this stack's parameters, to
+        save the per-op dispatch overhead that dominates small hidden sizes. Shapes
+        are dynamic by default, so graphs of different sizes reuse one compilation.
+        Compiled layers pass messages per edge instead of through cached sparse
+        adjacencies, which torch.compile cannot trace.
+        """
+        compile_kwargs.setdefault("dynamic", True)
+        return torch.compile(self, **compile_kwargs)  # type: ignore[no-any-return]
+
+    def capture(self, x: torch.Tensor, edge_index: torch.Tensor) -> torch.Tensor:
+        """
+        Capture the inference forward pass over the fixed graph edge_index into a
+        CUDA graph, replayed for new node features by replay(). A replay launches
+        the recorded kernels at once, without the per-kernel launch overhead that
+        dominates small graphs and hidden sizes. The graph structures prepared for
+        the layers are part of the capture, so edge_index cannot change; capture
+        again for another graph. Returns the static output, overwritten by every
+        replay.
+        """
+        if not x.is_cuda:
+            raise ValueError("CUDA graph capture requires CUDA tensors")
+        static_x = x.clone()
+        with torch.no_grad():
+            # Warm up on a side stream, which also prepares the graph structures
+            stream = torch.cuda.Stream(device=x.device)
+            stream.wait_stream(torch.cuda.current_stream(x.device))
+            with torch.cuda.stream(stream):
+                for _ in range(3):
+                    self(static_x, edge_index)
+            torch.cuda.current_stream(x.device).wait_stream(stream)
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph):
+                static_out = self(static_x, edge_index)
+        # The prepared graph is kept alive with the capture that reads it
+        self._cuda_graph = (graph, static_x, static_out, self._cached_graph)
+        return static_out
+
+    def replay(self, x: torch.Tensor) -> torch.Tensor:
+        """Replay the captured forward pass for node features x, see capture()"""
+        if self._cuda_graph is None:
+            raise RuntimeError("No captured forward pass, call capture() first")
+        graph, static_x, static_out, _ = self._cuda_graph
+        static_x.copy_(x)
+        graph.replay()
+        return static_out  # type: ignore[no-any-return]
+
+    def preload(
+        self,
+        x: torch.Tensor,
+        edge_index: torch.Tensor,
+        device: Optional[Union[str, torch.device]] = None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Start copying a minibatch to the GPU on a separate stream and return its
+        device tensors right away, so that the copy overlaps the computation
+        queued on the current stream, such as that of the previous minibatch.
+        Host tensors are pinned for the asynchronous copy. forward waits for the
+        copies of the tensors it is given, and only for those.
+        """
+        device = torch.device(device if device is not None else "cuda")
+        if self._prefetch_stream is None:
+            self._prefetch_stream = torch.cuda.Stream(device=device)
+        consumer = torch.cuda.current_stream(device)
+        copies = []
+        with torch.cuda.stream(self._prefetch_stream):
+            for tensor in (x, edge_index):
+                if tensor.device.type == "cpu" and not tensor.is_pinned():
+                    tensor = tensor.pin_memory()
+                tensor = tensor.to(device, non_blocking=True)
+                # Allocated on the copy stream, used on the consumer stream
+                tensor.record_stream(consumer)
+                copies.append(tensor)
+            event = torch.cuda.Event()
+            event.record()
+        for tensor in copies:
+            self._prefetch_events[tensor] = event
+        return copies[0], copies[1]
+
+    def _wait_for_preload(self, *tensors: torch.Tensor) -> None:
+        """Make the current stream wait for copies of tensors issued by preload"""
+        for tensor in tensors:
+            event = self._prefetch_events.pop(tensor, None)
+            if event is not None:
+                torch.cuda.current_stream(tensor.device).wait_event(event)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        Pickled and deep-copied without the prepared graph, which may be sparse CSR,
+        a CUDA graph capture or the preload stream
+        """
+        state = self.__dict__.copy()
+        state["_cached_graph"] = None
+        state["_cuda_graph"] = None
+        state["_prefetch_stream"] = None
+        state["_prefetch_events"] = WeakTensorKeyDictionary()
+        return state
+
+    def _prepare_graph(
+        self, edge_index: torch.Tensor, num_nodes: int, dtype: torch.dtype
+    ) -> Tuple[torch.Tensor, Dict[str, Any]]:
+        """
+        Per-graph work shared by all layers, done once per edge_index instead of in
+        every layer: the GCN propagation or SAGE aggregation matrix, which are CSR
+        already, or for the per-edge layers the edge index sorted by destination
+        (with self-loops for GAT) and, for EdgeConv, its CSR offsets. A sparse
+        adjacency A[target, source] may be given in place of edge_index; it is
+        converted here, once.
+        Returns the edge index and extra keyword arguments for the layers. Under
+        torch.compile the layers are left to do it themselves in traceable form.
+        Inference tensors have no version counter to detect in-place changes by,
+        so for those the work is redone on every call.
+        """
+        if torch.compiler.is_compiling():
+            return edge_index, {}
+        cacheable = not edge_index.is_inference()
+        if cacheable:
+            key = (edge_index._version, num_nodes, dtype)
+            cached = self._cached_graph
+            if cached is not None and cached[0] is edge_index and cached[1] == key:
+                return cached[2], cached[3]
+        first = self.layers[0]
+        if isinstance(first, ResGNNLayer):
+            first = first.layer
+        prepared, kwargs = edge_index, {}
+        if isinstance(first, GCNLayer):
+            # Layers of a stack share the normalization settings
+            kwargs = {"adj": first.adjacency(edge_index, num_nodes, dtype=dtype)}
+        elif isinstance(first, SAGELayer):
+            adj = first.adjacency(edge_index, num_nodes, dtype)
+            if adj is not None:
+                kwargs = {"adj": adj}
+            elif edge_index.layout != torch.strided:
+                prepared = _sparse_edges(edge_index)[0]
+        else:
+            if edge_index.layout != torch.strided:
+                prepared = _sparse_edges(edge_index)[0]
+            if isinstance(first, GATLayer) and first.conv.add_self_loops:
+                prepared = GATLayer.self_loops(prepared, num_nodes)
+                kwargs = {"self_loops_added": True}
+            graph = to_sorted_csr(prepared, num_nodes)
+            prepared = graph.edge_index
+            if isinstance(first, EdgeConvLayer):
+                kwargs = {"ptr": graph.crow}
+        if cacheable:
+            self._cached_graph = (edge_index, key, prepared, kwargs)
+        return prepared, kwargs
+
     def forward(self, x: torch.Tensor, edge_index: torch.Tensor) -> torch.Tensor:
         """Forward pass through the GNN stack"""
-        for i, layer in enumerate(self.layers):
-            x = layer(x, edge_index)
+        if not torch.compiler.is_compiling() and self._prefetch_events:
+            self._wait_for_preload(x, edge_index)
+        input_dtype = x.dtype
+        if self.inference_dtype is None:
+            precision = contextlib.nullcontext()
+        else:
+            precision = torch.autocast(x.device.type, dtype=self.inference_dtype)
+        with precision:
+            edge_index, graph_kwargs = self._prepare_graph(
+                edge_index, x.size(0), _propagation_dtype(x)
+            )
+            for i, layer in enumerate(self.layers):
+                x = layer(x, edge_index, **graph_kwargs)
 
-            # Apply activation function (except for the last layer unless specified)
-            if i < len(self.layers) - 1 or self.final_activation:
-                x = F.relu(x)
+                # Apply activation function (except for the last layer unless specified)
+                if i < len(self.layers) - 1 or self.final_activation:
+                    x = F.relu(x)
 
-            # Apply dropout
-            if i < len(self.layers) - 1:
-                config = self.configs[i]
-                if config.dropout > 0:
-                    x = F.dropout(x, p=config.dropout, training=self.training)
+                # Apply dropout
+                if i < len(self.layers) - 1:
+                    config = self.configs[i]
+                    if config.dropout > 0:
+                        x = F.dropout(x, p=config.dropout, training=self.training)
 
-        return x
+        # Layers ending in a projection return the autocast dtype, aggregations float32
+        return x.to(input_dtype)
 
 
-def global_add_pool(x: torch.Tensor, batch: torch.Tensor) -> torch.Tensor:
-    """Global add pooling"""
-    size = int(batch.max().item() + 1)
+def global_add_pool(
+    x: torch.Tensor, batch: torch.Tensor, size: Optional[int] = None
+) -> torch.Tensor:
+    """
+    Global add pooling. Pass the number of graphs as size where it is known: it
+    is otherwise read from batch, which waits for the device.
+    """
+    if size is None:
+        size = int(batch.max().item() + 1)
     return scatter_add(x, batch, dim=0, dim_size=size)
 
 
-def global_mean_pool(x: torch.Tensor, batch: torch.Tensor) -> torch.Tensor:
-    """Global mean pooling"""
-    size = int(batch.max().item() + 1)
+def global_mean_pool(
+    x: torch.Tensor, batch: torch.Tensor, size: Optional[int] = None
+) -> torch.Tensor:
+    """Global mean pooling over size graphs, see global_add_pool"""
+    if size is None:
+        size = int(batch.max().item() + 1)
     return scatter_mean(x, batch, dim=0, dim_size=size)
 
 
-def global_max_pool(x: torch.Tensor, batch: torch.Tensor) -> torch.Tensor:
-    """Global max pooling"""
-    size = int(batch.max().item() + 1)
+def global_max_pool(
+    x: torch.Tensor, batch: torch.Tensor, size: Optional[int] = None
+) -> torch.Tensor:
+    """Global max pooling over size graphs, see global_add_pool"""
+    if size is None:
+        size = int(batch.max().item() + 1)
     return scatter_max(x, batch, dim=0, dim_size=size)[0]
 
 
+def _segments(index: torch.Tensor, dim_size: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Permutation sorting a 1-D index and the CSR offsets of its segments (one per
+    output row). Cached per index tensor while it is alive and unmodified, so a
+    reused index (fixed graph, batch vector) is sorted once. Inference tensors,
+    which have no version counter to detect modifications by, are not cached.
+    """
+    cacheable = not index.is_inference()
+    if cacheable:
+        cached = _SEGMENT_CACHE.get(index)
+        if cached is not None and cached[:2] == (index._version, dim_size):
+            return cached[2], cached[3]
+    perm = index.argsort(stable=True)
+    offsets = torch.ops.aten._convert_indices_from_coo_to_csr(index[perm], dim_size)
+    if cacheable:
+        _SEGMENT_CACHE[index] = (index._version, dim_size, perm, offsets)
+    return perm, offsets
+
+
+def _segment_reduce(
+    src: torch.Tensor, index: torch.Tensor, dim_size: int, reduce: str
+) -> torch.Tensor:
+    """Reduce rows of src into dim_size rows by index, as contiguous sorted segments"""
+    perm, offsets = _segments(index, dim_size)
+    return torch.segment_reduce(src[perm], reduce, offsets=offsets, axis=0, unsafe=True)
+
+
+def _use_segments(src: torch.Tensor, index: torch.Tensor, dim: int) -> bool:
+    """
+    Whether a scatter along dim 0 runs as a sorted segment reduction: on CUDA this
+    avoids atomic updates, while on CPU scatter_add_ is faster.
+    """
+    return (
+        src.is_cuda
+        and src.is_floating_point()
+        and src.dim() > 0
+        and dim % src.dim() == 0
+        and index.dim() == 1
+        and index.numel() == src.size(0)
+    )
+
+
 def scatter_add(
     src: torch.Tensor,
     index: torch.Tensor,
@@ -284,6 +838,8 @@ def scatter_add(
         size[dim] = 0
     else:
         size[dim] = int(index.max()) + 1
+    if _use_segments(src, index, dim):
+        return _segment_reduce(src, index, size[dim], "sum")
     out = torch.zeros(size, dtype=src.dtype, device=src.device)
     # Reshape index for scatter_add_
     index = index.view(-1, 1).expand_as(src) if src.dim() > 1 and index.dim() == 1 else index
@@ -295,11 +851,24 @@ def scatter_mean(
     index: torch.Tensor,
     dim: int = -1,
     dim_size: Optional[int] = None,
+    count: Optional[torch.Tensor] = None,
 ) -> torch.Tensor:
-    """Scatter mean operation"""
+    """
+    Scatter mean operation.
+    For a 1-D index only the number of entries per output row is counted, rather
+    than scattering ones shaped like src. For a fixed index the counts may be
+    passed precomputed as count.
+    """
     out = scatter_add(src, index, dim, dim_size)
-    count = scatter_add(torch.ones_like(src), index, dim, dim_size)
-    return out / count.clamp(min=1)
+    if count is None:
+        if index.dim() != 1:
+            count = scatter_add(torch.ones_like(src), index, dim, dim_size)
+            return out / count.clamp(min=1)
+        count = torch.zeros(out.size(dim), dtype=src.dtype, device=src.device)
+        count.index_add_(0, index, torch.ones_like(index, dtype=src.dtype))
+    shape = [1] * out.dim()
+    shape[dim] = -1
+    return out / count.to(out.dtype).clamp(min=1).view(shape)
 
 
 def scatter_max(
@@ -308,7 +877,12 @@ def scatter_max(
     dim: int = -1,
     dim_size: Optional[int] = None,
 ) -> tuple[torch.Tensor, torch.Tensor]:
-    """Scatter max operation"""
+    """
+    Scatter max operation.
+    Returns the maxima and their positions along dim in src, the first one for
+    ties. Output rows without entries hold -inf, at position src.size(dim).
+    """
+    dim = dim % src.dim()
     size = list(src.size())
     if dim_size is not None:
         size[dim] = dim_size
@@ -316,21 +890,20 @@ def scatter_max(
         size[dim] = 0
     else:
         size[dim] = int(index.max()) + 1
-    
-    out = torch.full(size, float('-inf'), dtype=src.dtype, device=src.device)
-    arg_out = torch.zeros(size, dtype=torch.long, device=src.device)
-    
-    # For each unique index, find the maximum value across all dimensions
-    unique_indices = torch.unique(index)
-    for idx in unique_indices:
-        mask = index == idx
-        idx_int = int(idx.item())
-        if src.dim() == 1:
-            out[idx_int] = src[mask].max()
-        else:
-            # For 2D tensors, take max along each column
-            out[idx_int] = src[mask].max(dim=0)[0]
-    
+    # Shape broadcasting a 1-D tensor along dim
+    shape = [1] * src.dim()
+    shape[dim] = -1
+    expanded = index.view(shape).expand_as(src) if index.dim() == 1 else index
+    if _use_segments(src, index, dim):
+        out = _segment_reduce(src, index, size[dim], "max")
+    else:
+        out = torch.full(size, float("-inf"), dtype=src.dtype, device=src.device)
+        out.scatter_reduce_(dim, expanded, src, "amax")
+    # Positions of the entries equal to their row's maximum, the smallest one wins
+    positions = torch.arange(src.size(dim), device=src.device).view(shape)
+    candidates = torch.where(src == out.gather(dim, expanded), positions, src.size(dim))
+    arg_out = torch.full(size, src.size(dim), dtype=torch.long, device=src.device)
+    arg_out.scatter_reduce_(dim, expanded, candidates, "amin")
     return out, arg_out
 
 
@@ -384,9 +957,61 @@ class SAGELayer(nn.Module):
         """Reset layer parameters"""
         self.conv.reset_parameters()
 
-    def forward(self, x: torch.Tensor, edge_index: torch.Tensor) -> torch.Tensor:
-        """Forward pass through SAGE layer"""
-        return self.conv(x, edge_index)  # type: ignore[no-any-return]
+    def adjacency(
+        self, edge_index: torch.Tensor, num_nodes: int, dtype: Optional[torch.dtype] = None
+    ) -> Optional[torch.Tensor]:
+        """
+        Sparse CSR aggregation matrix for sum or mean aggregation: A, or D^-1 A
+        with every incoming edge weighted by 1 / in-degree of its target. None for
+        other aggregations, which go through message passing. edge_index may also
+        be a sparse adjacency A[target, source], whose values then weight the
+        messages.
+        """
+        if self.aggregation not in ("mean", "sum", "add"):
+            return None
+        if edge_index.layout != torch.strided:
+            adj = edge_index.to_sparse_csr()
+            if dtype is not None:
+                adj = adj.to(dtype)
+            if self.aggregation != "mean":
+                return adj
+            count = adj.crow_indices().diff()
+            scale = count.clamp(min=1).reciprocal().to(adj.dtype).repeat_interleave(count)
+            return torch.sparse_csr_tensor(
+                adj.crow_indices(), adj.col_indices(), adj.values() * scale, adj.shape
+            )
+        dst = edge_index[1]
+        if self.aggregation == "mean":
+            deg = torch.bincount(dst, minlength=num_nodes).to(dtype or torch.get_default_dtype())
+            edge_weight = deg.reciprocal()[dst]
+        else:
+            edge_weight = torch.ones(dst.numel(), dtype=dtype, device=dst.device)
+        return _sparse_adjacency(edge_index, edge_weight, num_nodes)
+
+    def forward(
+        self, x: torch.Tensor, edge_index: torch.Tensor, adj: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        """
+        Forward pass through SAGE layer.
+        Sum and mean aggregation of the (identity) messages is one sparse product
+        with the aggregation matrix, which may be passed precomputed as adj or
+        built from a sparse adjacency given in place of edge_index. Under
+        torch.compile, which cannot trace sparse tensor construction, it is left
+        to the convolution's message passing.
+        """
+        conv = self.conv
+        if adj is None and not conv.project and not torch.compiler.is_compiling():
+            adj = self.adjacency(edge_index, x.size(0), _propagation_dtype(x))
+        if adj is None or conv.project:
+            if edge_index.layout != torch.strided:
+                edge_index = _sparse_edges(edge_index)[0]
+            return conv(x, edge_index)  # type: ignore[no-any-return]
+        out = conv.lin_l(_propagate(adj, x))
+        if conv.root_weight:
+            out = out + conv.lin_r(x)
+        if conv.normalize:
+            out = F.normalize(out, p=2.0, dim=-1)
+        return out
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self.in_channels}, {self.out_channels})"
@@ -495,9 +1120,66 @@ class EdgeConvLayer(nn.Module):
         """Reset layer parameters"""
         self.conv.reset_parameters()
 
-    def forward(self, x: torch.Tensor, edge_index: torch.Tensor) -> torch.Tensor:
-        """Forward pass through EdgeConv layer"""
-        return self.conv(x, edge_index)  # type: ignore[no-any-return]
+    def edge_features(self, x: torch.Tensor, edge_index: torch.Tensor) -> torch.Tensor:
+        """
+        Edge inputs [x_i, x_j - x_i] of the edge network, one row per edge. Without
+        gradients to x both halves are written straight into one buffer, leaving out
+        the x_j and x_j - x_i intermediates of the concatenation. torch.compile,
+        which cannot trace out= into the strided halves, fuses the concatenation
+        itself.
+        """
+        src, dst = edge_index[0], edge_index[1]
+        if (torch.is_grad_enabled() and x.requires_grad) or torch.compiler.is_compiling():
+            x_i = x.index_select(0, dst)
+            return torch.cat([x_i, x.index_select(0, src) - x_i], dim=-1)
+        channels = x.size(1)
+        out = torch.empty((dst.numel(), 2 * channels), dtype=x.dtype, device=x.device)
+        x_i, diff = out[:, :channels], out[:, channels:]
+        torch.index_select(x, 0, dst, out=x_i)
+        torch.index_select(x, 0, src, out=diff)
+        diff.sub_(x_i)
+        return out
+
+    def edge_messages(self, x: torch.Tensor, edge_index: torch.Tensor) -> torch.Tensor:
+        """
+        Edge network outputs nn([x_i, x_j - x_i]), one row per edge. When the network
+        starts with a Linear of weight [W_a | W_b] over the edge inputs, that layer's
+        output x_i W_a^T + (x_j - x_i) W_b^T equals x_i (W_a - W_b)^T + x_j W_b^T:
+        one product over the nodes, gathered and added per edge, replaces the
+        product over the (more numerous) edges and the edge inputs.
+        """
+        first = self.nn[0] if isinstance(self.nn, nn.Sequential) else None
+        if (
+            not isinstance(first, nn.Linear)
+            or first.in_features != 2 * x.size(1)
+            or edge_index.size(1) < x.size(0)
+        ):
+            return self.nn(self.edge_features(x, edge_index))  # type: ignore[no-any-return]
+        w_a, w_b = first.weight.chunk(2, dim=1)
+        bias = first.bias
+        if bias is not None:
+            bias = torch.cat([bias, torch.zeros_like(bias)])
+        h_i, h_j = F.linear(x, torch.cat([w_a - w_b, w_b]), bias).chunk(2, dim=1)
+        out = h_i.index_select(0, edge_index[1]) + h_j.index_select(0, edge_index[0])
+        return self.nn[1:](out)  # type: ignore[no-any-return]
+
+    def forward(
+        self, x: torch.Tensor, edge_index: torch.Tensor, ptr: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        """
+        Forward pass through EdgeConv layer.
+        For an edge_index sorted by destination (see to_sorted_csr), its CSR
+        offsets may be passed as ptr: on CUDA the messages are then aggregated as
+        contiguous segments rather than with atomic scatters.
+        """
+        messages = self.edge_messages(x, edge_index)
+        if ptr is not None and messages.is_cuda:
+            return self.conv.aggr_module(  # type: ignore[no-any-return]
+                messages, ptr=ptr, dim_size=x.size(0)
+            )
+        return self.conv.aggr_module(  # type: ignore[no-any-return]
+            messages, edge_index[1], dim_size=x.size(0)
+        )
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self.in_channels}, {self.out_channels})"
@@ -520,19 +1202,27 @@ class ResGNNLayer(nn.Module):
         self.layer = layer
         self.in_channels = in_channels
         self.out_channels = out_channels
-        self.dropout = nn.Dropout(dropout)
+        self.dropout_p = dropout
 
-        # Residual connection
+        # Residual connection, a projection only where the channels change
+        self.residual: Optional[nn.Linear] = None
         if in_channels != out_channels:
-            self.residual: nn.Module = nn.Linear(in_channels, out_channels, bias=False)
-        else:
-            self.residual = nn.Identity()
+            self.residual = nn.Linear(in_channels, out_channels, bias=False)
+
+    @property
+    def dropout(self) -> float:
+        """Get dropout probability"""
+        return self.dropout_p
 
     def forward(self, x: torch.Tensor, *args: Any, **kwargs: Any) -> torch.Tensor:
-        """Forward pass with residual connection"""
-        identity = self.residual(x)
+        """
+        Forward pass with residual connection.
+        Identity residuals and dropout are applied directly rather than through
+        nn.Identity and nn.Dropout modules and their call overhead.
+        """
+        identity = x if self.residual is None else self.residual(x)
         out = self.layer(x, *args, **kwargs)
-        out = self.dropout(out)
+        out = F.dropout(out, p=self.dropout_p, training=self.training)
         return out + identity  # type: ignore[no-any-return]
 
     def __repr__(self) -> str:
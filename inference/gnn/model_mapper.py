@@ -618,16 +618,18 @@ class GraphToModelMapper:
                 x: torch.Tensor,
                 edge_index: torch.Tensor,
                 batch: Optional[torch.Tensor] = None,
+                num_graphs: Optional[int] = None,
                 **kwargs: Any,
             ) -> torch.Tensor:
                 x = self.model(x, edge_index)
                 if batch is not None:
+                    # A known num_graphs saves reading it back from the device
                     if self.pool_type == "add":
-                        x = global_add_pool(x, batch)
+                        x = global_add_pool(x, batch, num_graphs)
                     elif self.pool_type == "mean":
-                        x = global_mean_pool(x, batch)
+                        x = global_mean_pool(x, batch, num_graphs)
                     elif self.pool_type == "max":
-                        x = global_max_pool(x, batch)
+                        x = global_max_pool(x, batch, num_graphs)
                     else:
                         raise ValueError(f"Unknown pooling type: {self.pool_type}")
                 return x
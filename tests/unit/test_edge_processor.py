@@ -2,6 +2,7 @@
 Module for FreeAgentics Active Inference implementation.
 """
 
+import numpy as np
 import pytest
 import torch
 
@@ -12,6 +13,7 @@ from inference.gnn.edge_processor import (
     EdgeFeatureType,
     EdgeProcessor,
     EdgeType,
+    LazyScalar,
 )
 
 
@@ -87,6 +89,18 @@ class TestEdgeProcessor:
         assert len(processor.scalers) > 0
         assert processor.edge_type_mapping == {}
 
+    def test_ingest(self) -> None:
+        """Test edges are gathered into contiguous arrays"""
+        processor = EdgeProcessor(EdgeConfig())
+        edges = [Edge(source=0, target=1, weight=0.5), Edge(source=2, target=0, weight=0.2)]
+        buffer = processor.ingest(edges)
+        assert len(buffer) == 2
+        assert buffer.sources.tolist() == [0, 2]
+        assert buffer.targets.tolist() == [1, 0]
+        assert buffer.weights.tolist() == [0.5, 0.2]
+        assert buffer.sources.flags["C_CONTIGUOUS"]
+        assert buffer.edges is edges
+
     def test_empty_edges(self) -> None:
         """Test processing empty edge list"""
         config = EdgeConfig()
@@ -112,6 +126,18 @@ class TestEdgeProcessor:
         assert torch.equal(batch.edge_index[0], torch.tensor([0, 1, 2]))
         assert torch.equal(batch.edge_index[1], torch.tensor([1, 2, 0]))
 
+    def test_compact_index(self) -> None:
+        """Test edge_index is int32 when compact indices are enabled"""
+        config = EdgeConfig(self_loops=True, compact_index=True)
+        processor = EdgeProcessor(config)
+        edges = [Edge(source=0, target=1), Edge(source=1, target=2)]
+        batch = processor.process_edges(edges, num_nodes=3)
+        assert batch.edge_index.dtype == torch.int32
+        assert batch.edge_index.tolist() == [[0, 1, 0, 1, 2], [1, 2, 0, 1, 2]]
+        assert processor.process_edges([], num_nodes=3).edge_index.dtype == torch.int32
+        stats = processor.compute_edge_statistics(batch, num_nodes=3)
+        assert stats["num_self_loops"] == 3
+
     def test_undirected_edges(self) -> None:
         """Test converting to undirected edges"""
         config = EdgeConfig(edge_type=EdgeType.UNDIRECTED)
@@ -132,6 +158,20 @@ class TestEdgeProcessor:
         batch = processor.process_edges(edges, num_nodes=3)
         assert batch.edge_index.shape[1] == 4
 
+    def test_bidirectional_edge_order(self) -> None:
+        """Test each reverse edge follows its original and self-loops are not doubled"""
+        config = EdgeConfig(edge_type=EdgeType.BIDIRECTIONAL)
+        processor = EdgeProcessor(config)
+        edges = [
+            Edge(source=0, target=1, weight=0.5, edge_type="a"),
+            Edge(source=2, target=2, weight=1.0, edge_type="b"),
+            Edge(source=1, target=2, weight=2.0, edge_type="c"),
+        ]
+        batch = processor.process_edges(edges, num_nodes=3)
+        assert batch.edge_index.tolist() == [[0, 1, 2, 1, 2], [1, 0, 2, 2, 1]]
+        assert batch.edge_weight.tolist() == [0.5, 0.5, 1.0, 2.0, 2.0]
+        assert batch.edge_type.tolist() == [0, 0, 1, 2, 2]
+
     def test_self_loops(self) -> None:
         """Test adding self-loops"""
         config = EdgeConfig(self_loops=True)
@@ -141,6 +181,46 @@ class TestEdgeProcessor:
         assert batch.edge_index.shape[1] == 5
         assert batch.metadata["has_self_loops"] == True
 
+    def test_empty_batch_self_loops(self) -> None:
+        """Test empty batches get one self-loop per node as num_nodes varies"""
+        config = EdgeConfig(self_loops=True)
+        processor = EdgeProcessor(config)
+        for num_nodes in [3, 5, 2, 11]:
+            batch = processor.process_edges([], num_nodes=num_nodes)
+            expected = list(range(num_nodes))
+            assert batch.edge_index.tolist() == [expected, expected]
+            assert batch.edge_weight.tolist() == [1.0] * num_nodes
+        batch.edge_index.zero_()
+        batch = processor.process_edges([Edge(source=0, target=1)], num_nodes=3)
+        assert batch.edge_index.tolist() == [[0, 0, 1, 2], [1, 0, 1, 2]]
+
+    def test_self_loop_rows(self) -> None:
+        """Test every per-edge tensor gets a row per self-loop"""
+        config = EdgeConfig(self_loops=True, feature_types=[EdgeFeatureType.WEIGHT])
+        processor = EdgeProcessor(config)
+        edges = [
+            Edge(source=0, target=1, weight=0.5, edge_type="social"),
+            Edge(source=1, target=2, weight=1.5, edge_type="social"),
+        ]
+        batch = processor.process_edges(edges, num_nodes=4)
+        assert torch.equal(batch.edge_index[:, 2:], torch.arange(4).repeat(2, 1))
+        assert batch.edge_attr.shape == (6, 1)
+        assert torch.all(batch.edge_attr[2:] == 0)
+        assert torch.equal(batch.edge_weight[2:], torch.ones(4))
+        assert batch.edge_type.tolist() == [0, 0, 1, 1, 1, 1]
+        assert processor.edge_type_mapping["self_loop"] == 1
+
+    def test_lazy_self_loop_flag(self) -> None:
+        """Test the sampled batch's self-loop flag is read back on use"""
+        config = EdgeConfig(max_edges_per_node=1, edge_sampling_strategy="topk")
+        processor = EdgeProcessor(config)
+        edges = [Edge(source=0, target=0, weight=0.9), Edge(source=0, target=1, weight=0.1)]
+        flag = processor.process_edges(edges, num_nodes=2).metadata["has_self_loops"]
+        assert isinstance(flag, LazyScalar)
+        assert flag == True
+        assert bool(flag)
+        assert int(flag) == 1
+
     def test_weight_features(self) -> None:
         """Test weight feature extraction"""
         config = EdgeConfig(feature_types=[EdgeFeatureType.WEIGHT], normalize_weights=True)
@@ -156,6 +236,16 @@ class TestEdgeProcessor:
         assert batch.edge_weight.shape == (3,)
         assert torch.allclose(batch.edge_weight, torch.tensor([0.5, 1.0, 0.2]))
 
+    def test_weight_normalization_is_fitted_once(self) -> None:
+        """Test later batches reuse the first batch's weight statistics"""
+        config = EdgeConfig(feature_types=[EdgeFeatureType.WEIGHT], normalize_weights=True)
+        processor = EdgeProcessor(config)
+        edges = [Edge(source=0, target=1, weight=1.0), Edge(source=1, target=2, weight=3.0)]
+        first = processor.process_edges(edges, num_nodes=3)
+        assert torch.allclose(first.edge_attr.squeeze(1), torch.tensor([-1.0, 1.0]))
+        second = processor.process_edges([Edge(source=0, target=1, weight=5.0)], num_nodes=3)
+        assert torch.allclose(second.edge_attr.squeeze(1), torch.tensor([3.0]))
+
     def test_distance_features(self) -> None:
         """Test distance feature extraction"""
         config = EdgeConfig(feature_types=[EdgeFeatureType.DISTANCE])
@@ -171,6 +261,20 @@ class TestEdgeProcessor:
         assert torch.min(batch.edge_attr) >= 0
         assert torch.max(batch.edge_attr) <= 1
 
+    def test_distance_from_positions(self) -> None:
+        """Test distances are computed from node positions when not given"""
+        config = EdgeConfig(feature_types=[EdgeFeatureType.DISTANCE])
+        processor = EdgeProcessor(config)
+        positions = {0: [0.0, 0.0], 1: [3.0, 4.0], 2: [1.0, 0.0]}
+        edges = [
+            Edge(source=0, target=1, metadata={"positions": positions}),
+            Edge(source=1, target=2, features={"distance": 1.0}),
+            Edge(source=2, target=0),
+            Edge(source=0, target=2, metadata={"positions": positions}),
+        ]
+        batch = processor.process_edges(edges, num_nodes=3)
+        assert torch.allclose(batch.edge_attr.squeeze(1), torch.tensor([1.0, 0.2, 0.0, 0.2]))
+
     def test_categorical_features(self) -> None:
         """Test categorical feature extraction"""
         config = EdgeConfig(feature_types=[EdgeFeatureType.CATEGORICAL])
@@ -186,6 +290,24 @@ class TestEdgeProcessor:
         assert batch.edge_attr.shape == (4, 3)
         assert torch.sum(batch.edge_attr, dim=1).allclose(torch.ones(4))
 
+    def test_categorical_columns_are_stable(self) -> None:
+        """Test a category keeps its column across batches"""
+        config = EdgeConfig(feature_types=[EdgeFeatureType.CATEGORICAL])
+        processor = EdgeProcessor(config)
+        first = processor.process_edges(
+            [Edge(source=0, target=1, features={"category": "friend"})], num_nodes=2
+        )
+        second = processor.process_edges(
+            [
+                Edge(source=0, target=1, features={"category": "colleague"}),
+                Edge(source=1, target=0, features={"category": "friend"}),
+            ],
+            num_nodes=2,
+        )
+        assert first.edge_attr.tolist() == [[1.0]]
+        assert second.edge_attr.tolist() == [[0.0, 1.0], [1.0, 0.0]]
+        assert processor.category_mapping == {"friend": 0, "colleague": 1}
+
     def test_temporal_features(self) -> None:
         """Test temporal feature extraction"""
         config = EdgeConfig(feature_types=[EdgeFeatureType.TEMPORAL])
@@ -213,6 +335,23 @@ class TestEdgeProcessor:
         norms = torch.norm(batch.edge_attr, p=2, dim=1)
         assert torch.allclose(norms, torch.ones(3), atol=1e-06)
 
+    def test_generated_embeddings_are_deterministic(self) -> None:
+        """Test generated embeddings depend only on the edge and leave np.random alone"""
+        config = EdgeConfig(feature_types=[EdgeFeatureType.EMBEDDING])
+        processor = EdgeProcessor(config)
+        edges = [
+            Edge(source=0, target=1, features={"embedding": "a"}),
+            Edge(source=1, target=2, features={"embedding": "b"}),
+        ]
+        np.random.seed(7)
+        expected_draw = np.random.rand()
+        np.random.seed(7)
+        first = processor.process_edges(edges, num_nodes=3).edge_attr
+        assert np.random.rand() == expected_draw
+        second = processor.process_edges(edges[::-1], num_nodes=3).edge_attr
+        assert torch.equal(first, second.flip(0))
+        assert not torch.allclose(first[0], first[1])
+
     def test_multiple_features(self) -> None:
         """Test extraction of multiple feature types"""
         config = EdgeConfig(
@@ -241,6 +380,27 @@ class TestEdgeProcessor:
         assert batch.edge_attr is not None
         assert batch.edge_attr.shape[1] >= 4
 
+    def test_reduced_precision_output(self) -> None:
+        """Test edge_attr and edge_weight follow the configured dtype"""
+        config = EdgeConfig(
+            feature_types=[EdgeFeatureType.WEIGHT, EdgeFeatureType.DISTANCE],
+            self_loops=True,
+            dtype=torch.bfloat16,
+        )
+        processor = EdgeProcessor(config)
+        edges = [
+            Edge(source=0, target=1, weight=0.5, features={"distance": 1.0}),
+            Edge(source=1, target=2, weight=1.0, features={"distance": 2.0}),
+        ]
+        batch = processor.process_edges(edges, num_nodes=3)
+        assert batch.edge_attr.dtype == torch.bfloat16
+        assert batch.edge_weight.dtype == torch.bfloat16
+        assert batch.edge_index.dtype == torch.long
+        stats = processor.compute_edge_statistics(batch, num_nodes=3)
+        assert stats["max_weight"] == 1.0
+        adj_matrix = processor.to_adjacency_matrix(batch, num_nodes=3)
+        assert adj_matrix[0, 1] == 0.5
+
     def test_edge_sampling_random(self) -> None:
         """Test random edge sampling"""
         config = EdgeConfig(max_edges_per_node=2, edge_sampling_strategy="random")
@@ -251,6 +411,20 @@ class TestEdgeProcessor:
         node_0_edges = torch.sum((edge_index[0] == 0) | (edge_index[1] == 0))
         assert node_0_edges <= 2
 
+    def test_edge_sampling_importance(self) -> None:
+        """Test importance sampling caps every node's outgoing edges"""
+        config = EdgeConfig(max_edges_per_node=2, edge_sampling_strategy="importance")
+        processor = EdgeProcessor(config)
+        edges = [Edge(source=0, target=i, weight=0.1 * i) for i in range(1, 6)]
+        edges += [Edge(source=1, target=2), Edge(source=2, target=3)]
+        batch = processor.process_edges(edges, num_nodes=6)
+        edge_index = batch.edge_index
+        assert torch.sum(edge_index[0] == 0) == 2
+        assert torch.sum(edge_index[0] == 1) == 1
+        assert torch.sum(edge_index[0] == 2) == 1
+        # Selected edges keep their original order
+        assert torch.all(edge_index[0][:-1] <= edge_index[0][1:])
+
     def test_edge_sampling_topk(self) -> None:
         """Test top-k edge sampling by weight"""
         config = EdgeConfig(max_edges_per_node=2, edge_sampling_strategy="topk")
@@ -301,6 +475,26 @@ class TestEdgeProcessor:
         assert adj_matrix[1, 2] == 0.6
         assert adj_matrix[2, 0] == 0.9
 
+    def test_adjacency_matrix_duplicates(self) -> None:
+        """Test duplicate edges are summed unless the batch is known unique"""
+        edges = [
+            Edge(source=0, target=1, weight=0.5),
+            Edge(source=0, target=1, weight=0.25),
+            Edge(source=1, target=2, weight=1.0),
+        ]
+        processor = EdgeProcessor(EdgeConfig())
+        batch = processor.process_edges(edges, num_nodes=3)
+        assert batch.metadata["has_duplicates"]
+        adj_matrix = processor.to_adjacency_matrix(batch, num_nodes=3)
+        assert adj_matrix[0, 1] == 0.75
+        processor = EdgeProcessor(EdgeConfig(edge_type=EdgeType.UNDIRECTED))
+        batch = processor.process_edges(edges, num_nodes=3)
+        assert not batch.metadata["has_duplicates"]
+        adj_matrix = processor.to_adjacency_matrix(batch, num_nodes=3)
+        assert adj_matrix.nnz == 2
+        assert adj_matrix[0, 1] == 0.5
+        assert adj_matrix[1, 2] == 1.0
+
     def test_edge_statistics(self) -> None:
         """Test edge statistics computation"""
         config = EdgeConfig()
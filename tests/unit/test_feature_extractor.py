@@ -2,9 +2,15 @@
 Module for FreeAgentics Active Inference implementation.
 """
 
+import time
+from datetime import datetime, timezone
+
 import numpy as np
 import pytest
+import torch
 
+from inference.gnn import edge_processor
+from inference.gnn import feature_extractor
 from inference.gnn.feature_extractor import (
     ExtractionResult,
     FeatureConfig,
@@ -14,6 +20,25 @@ from inference.gnn.feature_extractor import (
 )
 
 
+@pytest.fixture
+def local_timezone(monkeypatch):
+    """Set the local timezone, clearing the memoized timestamp decompositions"""
+
+    def clear_caches() -> None:
+        feature_extractor._utc_offset.cache_clear()
+        edge_processor._timestamp_features.cache_clear()
+
+    def set_timezone(name: str) -> None:
+        monkeypatch.setenv("TZ", name)
+        time.tzset()
+        clear_caches()
+
+    yield set_timezone
+    monkeypatch.undo()
+    time.tzset()
+    clear_caches()
+
+
 class TestFeatureConfig:
     """Test FeatureConfig dataclass"""
 
@@ -89,6 +114,28 @@ class TestNodeFeatureExtractor:
         assert np.all(result.features >= 0)
         assert np.all(result.features <= 1)
 
+    def test_numerical_width_follows_values(self) -> None:
+        """Test a configured dimension sizes sequence values but not scalars"""
+        configs = [
+            FeatureConfig(
+                "energy", FeatureType.NUMERICAL, dimension=2, normalization=NormalizationType.NONE
+            ),
+            FeatureConfig(
+                "velocity", FeatureType.NUMERICAL, dimension=2, normalization=NormalizationType.NONE
+            ),
+        ]
+        extractor = NodeFeatureExtractor(configs)
+        nodes = [{"energy": 0.5, "velocity": [1.0, 2.0]}, {"energy": 0.8, "velocity": None}]
+        result = extractor.extract_features(nodes)
+        assert result.feature_names == ["energy", "velocity_0", "velocity_1"]
+        np.testing.assert_array_equal(
+            result.features, np.array([[0.5, 1.0, 2.0], [0.8, 0.0, 0.0]], dtype=np.float32)
+        )
+        soa = extractor.extract_features_soa(
+            {"energy": np.array([0.5, 0.8]), "velocity": np.array([[1.0, 2.0], [0.0, 0.0]])}
+        )
+        np.testing.assert_array_equal(soa.features, result.features)
+
     def test_spatial_features(self) -> None:
         """Test spatial feature extraction"""
         configs = [
@@ -111,6 +158,42 @@ class TestNodeFeatureExtractor:
         np.testing.assert_array_almost_equal(result.features[0], [0.5, 0.3])
         np.testing.assert_array_almost_equal(result.features[1], [0.7, 0.9])
 
+    def test_missing_spatial_features(self) -> None:
+        """Test missing coordinates of a configured width become zero rows"""
+        configs = [
+            FeatureConfig(
+                "position",
+                FeatureType.SPATIAL,
+                dimension=3,
+                normalization=NormalizationType.NONE,
+            )
+        ]
+        extractor = NodeFeatureExtractor(configs)
+        nodes = [{"position": (1.0, 2.0, 3.0)}, {"position": None}, {}]
+        result = extractor.extract_features(nodes)
+        np.testing.assert_array_equal(result.features, [[1, 2, 3], [0, 0, 0], [0, 0, 0]])
+
+    def test_h3_features(self) -> None:
+        """Test H3 cells decode to resolution, center and parent centers"""
+        h3 = pytest.importorskip("h3")
+        configs = [
+            FeatureConfig("h3_cell", FeatureType.SPATIAL, normalization=NormalizationType.NONE)
+        ]
+        extractor = NodeFeatureExtractor(configs)
+        cell = h3.latlng_to_cell(37.77, -122.42, 9)
+        coarse = h3.cell_to_parent(cell, 1)
+        nodes = [{"h3_cell": cell}, {"h3_cell": coarse}, {"h3_cell": "invalid"}, {"h3_cell": cell}]
+        result = extractor.extract_features(nodes)
+        expected = [
+            [9, *h3.cell_to_latlng(cell)]
+            + [*h3.cell_to_latlng(h3.cell_to_parent(cell, 7))]
+            + [*h3.cell_to_latlng(h3.cell_to_parent(cell, 8))],
+            [1, *h3.cell_to_latlng(coarse), *h3.cell_to_latlng(h3.cell_to_parent(cell, 0)), 0, 0],
+            [0.0] * 7,
+        ]
+        np.testing.assert_allclose(result.features[:3], expected, rtol=1e-6)
+        np.testing.assert_array_equal(result.features[3], result.features[0])
+
     def test_temporal_features(self) -> None:
         """Test temporal feature extraction"""
         configs = [
@@ -141,6 +224,47 @@ class TestNodeFeatureExtractor:
         ]
         assert result.feature_names == expected_names
 
+    def test_temporal_feature_values(self, local_timezone) -> None:
+        """Test calendar fields of timestamps, ISO strings and datetimes (UTC)"""
+        local_timezone("UTC")
+        configs = [
+            FeatureConfig("timestamp", FeatureType.TEMPORAL, normalization=NormalizationType.NONE)
+        ]
+        extractor = NodeFeatureExtractor(configs)
+        nodes = [
+            {"timestamp": 1642000000},  # Wednesday 2022-01-12 15:06:40 UTC
+            {"timestamp": "2022-01-15T17:00:00"},
+            {"timestamp": datetime(2023, 5, 6, 7, 8, 9, tzinfo=timezone.utc)},
+            {"timestamp": "not a date"},
+            {},
+        ]
+        result = extractor.extract_features(nodes)
+        expected = [
+            [15 / 24, 2 / 6, 12 / 31, 1 / 12, 0.22, 0.0, 0.1642],
+            [17 / 24, 5 / 6, 15 / 31, 1 / 12, 0.22, 1.0, 0.16422660],
+            [7 / 24, 5 / 6, 6 / 31, 5 / 12, 0.23, 1.0, 0.16833568],
+        ]
+        np.testing.assert_allclose(result.features[:3], expected, rtol=1e-6)
+        np.testing.assert_array_equal(result.features[3:], np.zeros((2, 7)))
+
+    def test_temporal_features_local_time(self, local_timezone) -> None:
+        """Test nodes decompose timestamps in local time, like edges"""
+        local_timezone("America/New_York")
+        configs = [
+            FeatureConfig("timestamp", FeatureType.TEMPORAL, normalization=NormalizationType.NONE)
+        ]
+        extractor = NodeFeatureExtractor(configs)
+        # Around midnight and across the 2022-03-13 daylight saving change
+        values = [1642000000, 1642050000, 1647151200, 1647158400, "2022-03-13T03:30:00"]
+        result = extractor.extract_features([{"timestamp": value} for value in values])
+        expected = [edge_processor._timestamp_features(value) for value in values]
+        np.testing.assert_allclose(result.features, expected, rtol=1e-6)
+
+        column = np.array(["2022-01-12T23:30", "2022-07-01T00:15"], dtype="datetime64[s]")
+        result = extractor.extract_features_soa({"timestamp": column})
+        assert result.features[:, 0].tolist() == pytest.approx([23 / 24, 0.0])
+        assert result.features[:, 2].tolist() == pytest.approx([12 / 31, 1 / 31])
+
     def test_categorical_features(self) -> None:
         """Test categorical feature extraction with one-hot encoding"""
         configs = [FeatureConfig("status", FeatureType.CATEGORICAL)]
@@ -157,6 +281,22 @@ class TestNodeFeatureExtractor:
         assert np.sum(result.features[0]) == 1.0
         assert np.sum(result.features, axis=1).tolist() == [1.0, 1.0, 1.0, 1.0]
 
+    def test_categorical_columns_are_stable(self) -> None:
+        """Test unseen categories add columns without reordering known ones"""
+        configs = [FeatureConfig("status", FeatureType.CATEGORICAL)]
+        extractor = NodeFeatureExtractor(configs)
+        extractor.extract_features([{"status": "idle"}, {"status": "active"}])
+        result = extractor.extract_features([{"status": "blocked"}, {"status": "idle"}, {}])
+        assert result.feature_names == [
+            "status_active",
+            "status_idle",
+            "status_blocked",
+            "status_unknown",
+        ]
+        np.testing.assert_array_equal(
+            result.features, [[0, 0, 1, 0], [0, 1, 0, 0], [0, 0, 0, 1]]
+        )
+
     def test_embedding_features(self) -> None:
         """Test embedding feature extraction"""
         configs = [
@@ -181,6 +321,110 @@ class TestNodeFeatureExtractor:
         )
         np.testing.assert_array_equal(result.features[1], np.zeros(8))
 
+    def test_hashed_embeddings(self) -> None:
+        """Test value-hashed embeddings are deterministic and leave np.random alone"""
+        configs = [
+            FeatureConfig(
+                "agent", FeatureType.EMBEDDING, dimension=5, normalization=NormalizationType.NONE
+            )
+        ]
+        extractor = NodeFeatureExtractor(configs)
+        nodes = [{"agent": "a"}, {"agent": 7}, {"agent": "a"}]
+        np.random.seed(0)
+        expected_draw = np.random.rand()
+        np.random.seed(0)
+        result = extractor.extract_features(nodes)
+        assert np.random.rand() == expected_draw
+        np.testing.assert_array_equal(result.features[0], result.features[2])
+        assert not np.array_equal(result.features[0], result.features[1])
+        np.testing.assert_array_equal(result.features, extractor.extract_features(nodes).features)
+
+    def test_text_features(self) -> None:
+        """Test TF-IDF text features, and zero blocks when there is no vocabulary"""
+        configs = [FeatureConfig("bio", FeatureType.TEXT, dimension=4)]
+        extractor = NodeFeatureExtractor(configs)
+        result = extractor.extract_features([{"bio": "red fox"}, {"bio": "blue fox"}, {}])
+        assert result.feature_names == ["bio_blue", "bio_fox", "bio_red"]
+        assert result.features.dtype == np.float32
+        np.testing.assert_allclose(np.linalg.norm(result.features[:2], axis=1), 1.0, rtol=1e-6)
+        np.testing.assert_array_equal(result.features[2], np.zeros(3))
+        # The vocabulary is fitted once; later batches keep its columns
+        result = extractor.extract_features([{"bio": "grey wolf"}, {"bio": "fox"}])
+        assert result.feature_names == ["bio_blue", "bio_fox", "bio_red"]
+        np.testing.assert_array_equal(result.features, [[0, 0, 0], [0, 1, 0]])
+        for nodes in ([{}, {"bio": ""}], [{"bio": "a"}, {"bio": "!"}]):
+            result = NodeFeatureExtractor(configs).extract_features(nodes)
+            assert result.features.shape == (2, 4)
+            assert not result.features.any()
+
+    def test_soa_columns(self) -> None:
+        """Test array columns give the same features as the list of node dicts"""
+        configs = [
+            FeatureConfig(
+                "position", FeatureType.SPATIAL, dimension=2, normalization=NormalizationType.NONE
+            ),
+            FeatureConfig("created", FeatureType.TEMPORAL),
+            FeatureConfig("energy", FeatureType.NUMERICAL, normalization=NormalizationType.NONE),
+            FeatureConfig("role", FeatureType.CATEGORICAL),
+        ]
+        nodes = [
+            {"position": [0.5, 1.0], "created": 1.7e9, "energy": 2.0, "role": "scout"},
+            {"position": [2.0, -1.0], "created": 1.6e9, "energy": None, "role": "guard"},
+        ]
+        columns = NodeFeatureExtractor.nodes_to_soa(nodes)
+        assert columns["energy"] == [2.0, None]
+        expected = NodeFeatureExtractor(configs).extract_features(nodes)
+        result = NodeFeatureExtractor(configs).extract_features_soa(
+            {
+                "position": np.array([[0.5, 1.0], [2.0, -1.0]]),
+                "created": np.array([1.7e9, 1.6e9]),
+                "energy": [2.0, None],
+                "role": ["scout", "guard"],
+            }
+        )
+        assert result.feature_names == expected.feature_names
+        np.testing.assert_array_equal(result.features, expected.features)
+        np.testing.assert_array_equal(result.missing_mask, expected.missing_mask)
+
+    def test_output_dtype(self) -> None:
+        """Test half precision outputs match the float32 features"""
+        configs = [
+            FeatureConfig("value", FeatureType.NUMERICAL),
+            FeatureConfig("status", FeatureType.CATEGORICAL),
+        ]
+        nodes = [{"value": 1.0, "status": "a"}, {"value": 3.0, "status": "b"}]
+        extractor = NodeFeatureExtractor(configs)
+        expected = extractor.extract_features(nodes).features
+        half = extractor.extract_features(nodes, out_dtype=np.float16).features
+        assert half.dtype == np.float16
+        np.testing.assert_allclose(half, expected, rtol=1e-3)
+        bf16 = extractor.extract_features(nodes, out_dtype=torch.bfloat16).features
+        assert bf16.dtype == np.uint16
+        restored = torch.from_numpy(bf16.view(np.int16)).view(torch.bfloat16).float().numpy()
+        np.testing.assert_allclose(restored, expected, rtol=1e-2)
+
+    def test_structural_features(self) -> None:
+        """Test degree features from bulk NetworkX queries and per-node degree calls"""
+        nx = pytest.importorskip("networkx")
+        configs = [
+            FeatureConfig(
+                "graph", FeatureType.GRAPH_STRUCTURAL, normalization=NormalizationType.NONE
+            )
+        ]
+        extractor = NodeFeatureExtractor(configs)
+        graph = nx.DiGraph([("a", "b"), ("a", "c"), ("c", "a")])
+        nodes = [{"id": "a"}, {"id": "c"}, {"id": "missing"}]
+        result = extractor.extract_features(nodes, graph)
+        np.testing.assert_array_equal(result.features[:, :3], [[3, 1, 2], [2, 1, 1], [0, 0, 0]])
+
+        class DegreeOnly:
+            def degree(self, node: int) -> int:
+                return node * 2
+
+        result = extractor.extract_features([{}, {"id": 3}], DegreeOnly())
+        np.testing.assert_array_equal(result.features[:, 0], [0, 6])
+        assert not result.features[:, 1:].any()
+
     def test_missing_data_handling(self) -> None:
         """Test handling of missing data"""
         configs = [
@@ -240,6 +484,16 @@ class TestNodeFeatureExtractor:
         assert abs(np.mean(result_standard.features)) < 0.1
         assert abs(np.std(result_standard.features) - 1.0) < 0.1
 
+    def test_scaler_is_fitted_once(self) -> None:
+        """Test later batches are scaled with the statistics of the first one"""
+        configs = [
+            FeatureConfig("value", FeatureType.NUMERICAL, normalization=NormalizationType.MINMAX)
+        ]
+        extractor = NodeFeatureExtractor(configs)
+        extractor.extract_features([{"value": 0}, {"value": 100}])
+        result = extractor.extract_features([{"value": 50}, {"value": 200}])
+        np.testing.assert_allclose(result.features[:, 0], [0.5, 2.0])
+
     def test_handle_missing_data_strategies(self) -> None:
         """Test different missing data imputation strategies"""
         configs = [FeatureConfig("value", FeatureType.NUMERICAL)]
@@ -255,6 +509,9 @@ class TestNodeFeatureExtractor:
         imputed_zero = extractor.handle_missing_data(features, missing_mask, strategy="zero")
         assert imputed_zero[1, 0] == 0.0
         assert imputed_zero[3, 0] == 0.0
+        missing_mask[0, 0] = True
+        imputed_ffill = extractor.handle_missing_data(features, missing_mask, "forward_fill")
+        assert imputed_ffill[:, 0].tolist() == [0.0, 0.0, 3.0, 3.0, 5.0]
 
     def test_extraction_metadata(self) -> None:
         """Test extraction result metadata"""
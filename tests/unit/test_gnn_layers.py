@@ -5,6 +5,8 @@ Tests various Graph Neural Network layers including GCN, GAT, SAGE, GIN, EdgeCon
 and supporting utilities like pooling operations and residual connections.
 """
 
+import copy
+
 import pytest
 import torch
 import torch.nn as nn
@@ -27,6 +29,9 @@ from inference.gnn.layers import (
     scatter_add,
     scatter_mean,
     scatter_max,
+    to_sorted_csr,
+    _segment_reduce,
+    _segments,
 )
 
 
@@ -152,6 +157,50 @@ class TestGCNLayer:
         assert output.shape == (100, 20)
         assert output.dtype == torch.float32
     
+    def test_gcn_layer_sparse_propagation(self):
+        """Test sparse adjacency propagation matches GCNConv message passing."""
+        layer = GCNLayer(in_channels=10, out_channels=20, cached=True)
+
+        x = torch.randn(50, 10)
+        edge_index = torch.randint(0, 50, (2, 120))
+        edge_weight = torch.rand(120)
+
+        assert torch.allclose(layer(x, edge_index), layer.conv(x, edge_index), atol=1e-5)
+        cached_adj = layer._cached_adj
+        layer(x, edge_index)
+        assert layer._cached_adj is cached_adj
+
+        layer = GCNLayer(in_channels=10, out_channels=20, normalize=False)
+        output = layer(x, edge_index, edge_weight)
+        assert torch.allclose(output, layer.conv(x, edge_index, edge_weight), atol=1e-5)
+
+    def test_gcn_norm_dtype(self):
+        """Test norm returns weights in the requested dtype, close to float32 ones."""
+        edge_index = torch.stack([torch.arange(1, 2001), torch.zeros(2000, dtype=torch.long)])
+        
+        _, expected = GCNLayer.norm(edge_index, 2001)
+        _, weight = GCNLayer.norm(edge_index, 2001, dtype=torch.bfloat16)
+        
+        assert expected.dtype == torch.float32
+        assert weight.dtype == torch.bfloat16
+        assert torch.allclose(weight.float(), expected, rtol=1e-2)
+    
+    @pytest.mark.parametrize("normalize", [True, False])
+    def test_gcn_layer_sparse_input(self, normalize):
+        """Test a sparse adjacency in place of edge_index matches GCNConv."""
+        layer = GCNLayer(in_channels=10, out_channels=20, normalize=normalize)
+
+        edge_index = torch.randint(0, 50, (2, 120)).unique(dim=1)
+        edge_index = edge_index[:, edge_index[0] != edge_index[1]]
+        edge_weight = torch.rand(edge_index.size(1))
+        adj = torch.sparse_coo_tensor(edge_index.flip(0), edge_weight, (50, 50))
+        x = torch.randn(50, 10)
+
+        expected = layer.conv(x, adj.to_sparse_csr())
+        assert torch.allclose(layer(x, adj), expected, atol=1e-5)
+        assert torch.allclose(layer(x, adj.to_sparse_csr()), expected, atol=1e-5)
+        assert torch.allclose(layer(x, edge_index, edge_weight), expected, atol=1e-5)
+
     def test_gcn_layer_reset_parameters(self):
         """Test parameter reset functionality."""
         layer = GCNLayer(in_channels=10, out_channels=20, cached=True)
@@ -259,6 +308,21 @@ class TestGATLayer:
         assert output.shape == (50, 20)
         assert attention_weights is not None
 
+    def test_gat_layer_matches_conv(self):
+        """Test fused attention matches GATConv outputs and attention weights."""
+        layer = GATLayer(in_channels=10, out_channels=8, heads=3).eval()
+
+        x = torch.randn(40, 10)
+        edge_index = torch.randint(0, 40, (2, 90))
+
+        output, (edges, alpha) = layer(x, edge_index, return_attention_weights=True)
+        expected, (expected_edges, expected_alpha) = layer.conv(
+            x, edge_index, return_attention_weights=True
+        )
+        assert torch.equal(edges, expected_edges)
+        assert torch.allclose(alpha, expected_alpha, atol=1e-6)
+        assert torch.allclose(output, expected, atol=1e-5)
+
 
 class TestSAGELayer:
     """Test GraphSAGE layer."""
@@ -312,6 +376,23 @@ class TestSAGELayer:
         assert output.shape == (100, 20)
         assert output.dtype == torch.float32
     
+    @pytest.mark.parametrize("aggr", ["mean", "add", "max"])
+    def test_sage_layer_matches_conv(self, aggr):
+        """Test sparse mean/sum aggregation matches SAGEConv message passing."""
+        layer = SAGELayer(in_channels=10, out_channels=8, aggr=aggr, normalize=True)
+        
+        x = torch.randn(40, 10)
+        edge_index = torch.randint(0, 35, (2, 90))
+        
+        assert (layer.adjacency(edge_index, 40) is None) == (aggr == "max")
+        assert torch.allclose(layer(x, edge_index), layer.conv(x, edge_index), atol=1e-6)
+        
+        edge_index = edge_index.unique(dim=1)
+        adj = torch.sparse_coo_tensor(
+            edge_index.flip(0), torch.ones(edge_index.size(1)), (40, 40)
+        )
+        assert torch.allclose(layer(x, adj.to_sparse_csr()), layer.conv(x, edge_index), atol=1e-6)
+    
     def test_sage_layer_reset_parameters(self):
         """Test SAGE layer parameter reset."""
         layer = SAGELayer(in_channels=10, out_channels=20)
@@ -467,6 +548,23 @@ class TestEdgeConvLayer:
         assert output.shape == (100, 20)
         assert output.dtype == torch.float32
     
+    def test_edgeconv_layer_matches_conv(self):
+        """Test edge features and aggregation match EdgeConv, with and without grad."""
+        layer = EdgeConvLayer(in_channels=6, out_channels=8, aggr="mean")
+        
+        x = torch.randn(30, 6, requires_grad=True)
+        edge_index = torch.randint(0, 25, (2, 70))
+        
+        expected = layer.conv(x, edge_index)
+        assert torch.allclose(layer(x, edge_index), expected, atol=1e-6)
+        with torch.no_grad():
+            assert torch.allclose(layer(x, edge_index), expected, atol=1e-6)
+            # Fewer edges than nodes take the edge-level product
+            sparse_edges = edge_index[:, :20]
+            assert torch.allclose(
+                layer(x, sparse_edges), layer.conv(x, sparse_edges), atol=1e-6
+            )
+    
     def test_edgeconv_layer_reset_parameters(self):
         """Test EdgeConv layer parameter reset."""
         layer = EdgeConvLayer(in_channels=10, out_channels=20)
@@ -506,7 +604,7 @@ class TestResGNNLayer:
         assert res_layer.in_channels == 10
         assert res_layer.out_channels == 20
         assert res_layer.layer is base_layer
-        assert isinstance(res_layer.dropout, nn.Dropout)
+        assert res_layer.dropout == 0.1
         assert isinstance(res_layer.residual, nn.Linear)  # Different dimensions
     
     def test_resgnn_layer_same_channels(self):
@@ -518,8 +616,13 @@ class TestResGNNLayer:
             out_channels=20
         )
         
-        # Should use Identity for residual connection
-        assert isinstance(res_layer.residual, nn.Identity)
+        # Identity residual connection, without a module
+        assert res_layer.residual is None
+        assert not any(isinstance(m, nn.Identity) for m in res_layer.modules())
+        
+        x = torch.randn(30, 20)
+        edge_index = torch.randint(0, 30, (2, 60))
+        assert torch.allclose(res_layer(x, edge_index), base_layer(x, edge_index) + x)
     
     def test_resgnn_layer_forward(self):
         """Test ResGNN layer forward pass."""
@@ -636,6 +739,156 @@ class TestGNNStack:
         assert output.shape == (100, 15)
         assert output.dtype == torch.float32
     
+    def test_gnn_stack_shares_graph(self):
+        """Test per-graph preprocessing runs once for all layers and forward passes."""
+        configs = [
+            LayerConfig(in_channels=10, out_channels=20),
+            LayerConfig(in_channels=20, out_channels=15, residual=True)
+        ]
+        x = torch.randn(40, 10)
+        edge_index = torch.randint(0, 40, (2, 90))
+        
+        for layer_type in ("gcn", "gat", "edgeconv"):
+            stack = GNNStack(configs, layer_type=layer_type).eval()
+            output = stack(x, edge_index)
+            prepared = stack._cached_graph
+            assert torch.equal(stack(x, edge_index), output)
+            assert stack._cached_graph is prepared
+            
+            hidden = torch.relu(stack.layers[0](x, edge_index))
+            assert torch.allclose(output, stack.layers[1](hidden, edge_index), atol=1e-5)
+            
+            copied = copy.deepcopy(stack)
+            assert copied._cached_graph is None
+            assert torch.equal(copied(x, edge_index), output)
+    
+    @pytest.mark.parametrize("layer_type", ["gcn", "gat", "sage", "gin", "edgeconv"])
+    def test_gnn_stack_inference_mode(self, layer_type):
+        """Test inference tensors, which have no version counter, skip the graph cache."""
+        configs = [
+            LayerConfig(in_channels=8, out_channels=16, residual=True),
+            LayerConfig(in_channels=16, out_channels=4)
+        ]
+        stack = GNNStack(configs, layer_type=layer_type).eval()
+        x = torch.randn(30, 8)
+        edge_index = torch.randint(0, 30, (2, 80))
+        expected = stack(x, edge_index)
+        
+        with torch.inference_mode():
+            inference_edges = edge_index.clone()
+            assert torch.allclose(stack(x.clone(), inference_edges), expected, atol=1e-5)
+            assert torch.allclose(stack(x, edge_index), expected, atol=1e-5)
+        assert stack._cached_graph[0] is edge_index
+    
+    @pytest.mark.parametrize("layer_type", ["gcn", "gat", "sage", "gin", "edgeconv"])
+    def test_gnn_stack_sparse_input(self, layer_type):
+        """Test a sparse CSR adjacency gives the output of its edge index."""
+        configs = [
+            LayerConfig(in_channels=8, out_channels=16, residual=True),
+            LayerConfig(in_channels=16, out_channels=4)
+        ]
+        stack = GNNStack(configs, layer_type=layer_type).eval()
+        x = torch.randn(30, 8)
+        edge_index = torch.randint(0, 30, (2, 80)).unique(dim=1)
+        adj = torch.sparse_coo_tensor(
+            edge_index.flip(0), torch.ones(edge_index.size(1)), (30, 30)
+        ).to_sparse_csr()
+        
+        expected = stack(x, edge_index)
+        assert torch.allclose(stack(x, adj), expected, atol=1e-5)
+    
+    @pytest.mark.parametrize("layer_type", ["gcn", "gat", "sage", "gin", "edgeconv"])
+    def test_gnn_stack_to_inference(self, layer_type):
+        """Test reduced-precision and int8 inference stay close to float32."""
+        configs = [
+            LayerConfig(in_channels=8, out_channels=16, residual=True),
+            LayerConfig(in_channels=16, out_channels=4)
+        ]
+        stack = GNNStack(configs, layer_type=layer_type).eval()
+        x = torch.randn(30, 8)
+        edge_index = torch.randint(0, 30, (2, 80))
+        expected = stack(x, edge_index)
+        
+        if layer_type in ("gcn", "gat", "sage"):
+            # PyG Linear projections cannot be dynamically quantized
+            with pytest.raises(ValueError, match="PyG Linear"):
+                stack.to_inference(torch.qint8)
+        else:
+            quantized = stack.to_inference(torch.qint8)
+            assert torch.allclose(quantized(x, edge_index), expected, atol=0.2)
+        
+        half = stack.to_inference(torch.bfloat16)
+        assert half is stack and not stack.training
+        out = half(x, edge_index)
+        assert out.dtype == x.dtype
+        assert torch.allclose(out, expected, atol=0.1)
+    
+    @pytest.mark.parametrize("layer_type", ["gcn", "sage", "gin", "edgeconv"])
+    def test_gnn_stack_compiles_without_graph_breaks(self, layer_type):
+        """Test the stack traces into a single graph, self-loops in the input included."""
+        configs = [
+            LayerConfig(in_channels=8, out_channels=16, residual=True),
+            LayerConfig(in_channels=16, out_channels=4)
+        ]
+        stack = GNNStack(configs, layer_type=layer_type).eval()
+        x = torch.randn(30, 8)
+        edge_index = torch.cat([torch.randint(0, 30, (2, 80)), torch.arange(5).repeat(2, 1)], dim=1)
+        
+        with torch.no_grad():
+            expected = stack(x, edge_index)
+            compiled = stack.jit(backend="eager", fullgraph=True)
+            assert torch.allclose(compiled(x, edge_index), expected, atol=1e-5)
+            smaller = compiled(x[:20], edge_index[:, edge_index.max(dim=0).values < 20])
+            assert smaller.shape == (20, 4)
+    
+    def test_gnn_stack_replay_requires_capture(self):
+        """Test replay without a capture and capture of CPU tensors fail."""
+        stack = GNNStack([LayerConfig(in_channels=8, out_channels=4)]).eval()
+        x = torch.randn(10, 8)
+        
+        with pytest.raises(RuntimeError, match="capture"):
+            stack.replay(x)
+        with pytest.raises(ValueError, match="CUDA"):
+            stack.capture(x, torch.randint(0, 10, (2, 20)))
+    
+    @pytest.mark.skipif(not torch.cuda.is_available(), reason="CUDA not available")
+    @pytest.mark.parametrize("layer_type", ["gcn", "gat", "sage", "gin", "edgeconv"])
+    def test_gnn_stack_cuda_graph(self, layer_type):
+        """Test replays of a captured forward pass match eager forward passes."""
+        configs = [
+            LayerConfig(in_channels=8, out_channels=16, residual=True),
+            LayerConfig(in_channels=16, out_channels=4)
+        ]
+        stack = GNNStack(configs, layer_type=layer_type).cuda().eval()
+        edge_index = torch.randint(0, 30, (2, 80), device="cuda")
+        
+        out = stack.capture(torch.randn(30, 8, device="cuda"), edge_index)
+        for _ in range(2):
+            x = torch.randn(30, 8, device="cuda")
+            assert stack.replay(x) is out
+            with torch.no_grad():
+                assert torch.allclose(out, stack(x, edge_index), atol=1e-5)
+        assert copy.deepcopy(stack)._cuda_graph is None
+    
+    @pytest.mark.skipif(not torch.cuda.is_available(), reason="CUDA not available")
+    def test_gnn_stack_preload(self):
+        """Test preloaded minibatches give the outputs of synchronous copies."""
+        configs = [
+            LayerConfig(in_channels=8, out_channels=16),
+            LayerConfig(in_channels=16, out_channels=4)
+        ]
+        stack = GNNStack(configs, layer_type="sage").cuda().eval()
+        batches = [(torch.randn(30, 8), torch.randint(0, 30, (2, 80))) for _ in range(3)]
+        
+        pending = stack.preload(*batches[0])
+        for i, (x, edge_index) in enumerate(batches):
+            current = pending
+            if i + 1 < len(batches):
+                pending = stack.preload(*batches[i + 1])
+            expected = stack(x.cuda(), edge_index.cuda())
+            assert torch.allclose(stack(*current), expected, atol=1e-6)
+        assert len(stack._prefetch_events) == 0
+    
     def test_gnn_stack_unknown_layer_type(self):
         """Test GNN stack with unknown layer type."""
         configs = [LayerConfig(in_channels=10, out_channels=20)]
@@ -644,6 +897,23 @@ class TestGNNStack:
             GNNStack(configs, layer_type="unknown")
 
 
+class TestSortedCSR:
+    """Test destination-sorted edge indices."""
+    
+    def test_to_sorted_csr(self):
+        """Test edges are sorted by destination with matching segment offsets."""
+        edge_index = torch.randint(0, 20, (2, 60))
+        graph = to_sorted_csr(edge_index, 25)
+        
+        assert graph.num_nodes == 25
+        assert torch.equal(graph.edge_index, edge_index[:, graph.perm])
+        assert bool((graph.col[1:] >= graph.col[:-1]).all())
+        counts = torch.bincount(edge_index[1], minlength=25)
+        assert torch.equal(graph.crow.diff(), counts)
+        for i in range(25):
+            assert bool((graph.col[graph.crow[i]:graph.crow[i + 1]] == i).all())
+
+
 class TestScatterOperations:
     """Test scatter operation utilities."""
     
@@ -679,6 +949,11 @@ class TestScatterOperations:
         
         expected = torch.tensor([[3.0, 5.0], [6.0, 8.0]])  # [(2+4)/2, (4+6)/2], [6, 8]
         assert torch.allclose(result, expected)
+        
+        counts = torch.tensor([2, 1, 0])
+        result = scatter_mean(src, index, dim=0, dim_size=3, count=counts)
+        assert torch.allclose(result[:2], expected)
+        assert torch.equal(result[2], torch.zeros(2))
     
     def test_scatter_max(self):
         """Test scatter max operation."""
@@ -690,6 +965,29 @@ class TestScatterOperations:
         expected = torch.tensor([[4.0, 3.0], [6.0, 8.0]])  # max([1,4], [2,3]), [6, 8]
         assert torch.allclose(result, expected)
         assert arg_result.shape == result.shape
+        assert torch.equal(arg_result, torch.tensor([[2, 2], [1, 1]]))
+        
+        result, arg_result = scatter_max(src.t(), index, dim=1, dim_size=3)
+        assert torch.allclose(result[:, :2], expected.t())
+        assert torch.equal(result[:, 2], torch.full((2,), float("-inf")))
+        assert torch.equal(arg_result, torch.tensor([[2, 1, 3], [2, 1, 3]]))
+    
+    def test_segment_reduce(self):
+        """Test sorted segment reductions match scatter results and reuse the sort."""
+        src = torch.randn(30, 4)
+        index = torch.randint(0, 8, (30,))
+        
+        assert torch.allclose(
+            _segment_reduce(src, index, 10, "sum"), scatter_add(src, index, dim=0, dim_size=10)
+        )
+        expected_max = scatter_max(src, index, dim=0, dim_size=10)[0]
+        assert torch.equal(_segment_reduce(src, index, 10, "max"), expected_max)
+        assert _segments(index, 10)[0] is _segments(index, 10)[0]
+        
+        with torch.inference_mode():
+            inference_index = index.clone()
+            result = _segment_reduce(src, inference_index, 10, "sum")
+        assert torch.allclose(result, scatter_add(src, index, dim=0, dim_size=10))
     
     def test_scatter_empty_index(self):
         """Test scatter operations with empty index."""
@@ -735,6 +1033,20 @@ class TestGlobalPooling:
         expected = torch.tensor([[6.0, 8.0], [4.0, 9.0]])  # max([1,6], [8,2]), max([4,3], [6,9])
         assert torch.allclose(result, expected)
     
+    def test_global_pool_with_size(self):
+        """Test pooling into a given number of graphs, including empty ones."""
+        x = torch.tensor([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]])
+        batch = torch.tensor([0, 0, 2])
+        
+        add_result = global_add_pool(x, batch, size=4)
+        mean_result = global_mean_pool(x, batch, size=4)
+        max_result = global_max_pool(x, batch, size=3)
+        
+        assert torch.allclose(add_result, torch.tensor([[4.0, 6.0], [0, 0], [5.0, 6.0], [0, 0]]))
+        assert torch.allclose(mean_result[[0, 2]], torch.tensor([[2.0, 3.0], [5.0, 6.0]]))
+        assert max_result.shape == (3, 2)
+        assert torch.allclose(max_result[2], torch.tensor([5.0, 6.0]))
+    
     def test_global_pool_single_batch(self):
         """Test global pooling with single batch."""
         x = torch.tensor([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]])
@@ -372,6 +372,130 @@ class TestDiscreteExpectedFreeEnergyPyMDP:
             )
             assert torch.isfinite(G)
     
+    def test_numba_kernel_matches_torch_path(self, pymdp_compatible_model):
+        """Test the Numba CPU kernel reproduces the PyTorch G(π) values."""
+        pytest.importorskip("numba")
+        inf_config = InferenceConfig(use_gpu=False)
+        inference = VariationalMessagePassing(inf_config)
+        config = PolicyConfig(planning_horizon=3, policy_length=2, use_gpu=False)
+        efe_calculator = DiscreteExpectedFreeEnergy(config, inference)
+        
+        beliefs = torch.tensor([0.6, 0.3, 0.1])
+        _, probs_numba = efe_calculator.select_policy(beliefs, pymdp_compatible_model)
+        
+        efe_calculator._use_numba_kernel = False
+        _, probs_torch = efe_calculator.select_policy(beliefs, pymdp_compatible_model)
+        
+        assert torch.allclose(probs_numba, probs_torch, atol=1e-5)
+    
+    def test_chunked_policy_evaluation(self, pymdp_compatible_model):
+        """Test chunked rollouts give the same posteriors as a single batch."""
+        inf_config = InferenceConfig(use_gpu=False)
+        inference = VariationalMessagePassing(inf_config)
+        beliefs = torch.tensor([0.6, 0.3, 0.1])
+        
+        posteriors = []
+        for chunk_size in (3, None, 1024):
+            config = PolicyConfig(
+                planning_horizon=3, policy_length=3, policy_chunk_size=chunk_size, use_gpu=False
+            )
+            efe_calculator = DiscreteExpectedFreeEnergy(config, inference)
+            efe_calculator._use_numba_kernel = False
+            _, probs = efe_calculator.select_policy(beliefs, pymdp_compatible_model)
+            posteriors.append(probs)
+        
+        assert posteriors[0].shape == (8,)
+        assert torch.allclose(posteriors[0], posteriors[2], atol=1e-6)
+        assert torch.allclose(posteriors[1], posteriors[2], atol=1e-6)
+    
+    def test_batched_efe_matches_per_policy(self, pymdp_compatible_model):
+        """Test batched G(π) matches per-policy evaluation from per-row beliefs."""
+        inf_config = InferenceConfig(use_gpu=False)
+        inference = VariationalMessagePassing(inf_config)
+        config = PolicyConfig(planning_horizon=2, policy_length=2, use_gpu=False)
+        efe_calculator = DiscreteExpectedFreeEnergy(config, inference)
+        
+        policies = [Policy([0, 1]), Policy([1, 1]), Policy([1, 0])]
+        beliefs = torch.tensor([[0.6, 0.3, 0.1], [0.2, 0.2, 0.6], [1.0, 0.0, 0.0]])
+        G = efe_calculator.compute_expected_free_energy_batched(
+            policies, beliefs, pymdp_compatible_model
+        )
+        
+        expected = torch.stack([
+            efe_calculator.compute_expected_free_energy(policy, row, pymdp_compatible_model)[0]
+            for policy, row in zip(policies, beliefs)
+        ])
+        assert G.shape == (3,)
+        assert torch.allclose(G, expected, atol=1e-6)
+        
+        config.policy_chunk_size = 2
+        chunked = efe_calculator.compute_expected_free_energy_batched(
+            policies, beliefs, pymdp_compatible_model
+        )
+        assert torch.allclose(chunked, G, atol=1e-6)
+    
+    def test_batched_selection_marginalizes_first_action(self, pymdp_compatible_model):
+        """Test batched selection returns Q(π) summed over each policy's first action."""
+        inf_config = InferenceConfig(use_gpu=False)
+        inference = VariationalMessagePassing(inf_config)
+        config = PolicyConfig(planning_horizon=2, policy_length=2, use_gpu=False)
+        efe_calculator = DiscreteExpectedFreeEnergy(config, inference)
+        
+        beliefs = torch.tensor([[0.6, 0.3, 0.1], [0.2, 0.2, 0.6]])
+        action_probs = efe_calculator.select_policy_batched(beliefs, pymdp_compatible_model)
+        
+        assert action_probs.shape == (2, 2)
+        for row, probs in zip(beliefs, action_probs):
+            _, posteriors = efe_calculator.select_policy(row, pymdp_compatible_model)
+            expected = posteriors.reshape(2, 2).sum(dim=1)
+            assert torch.allclose(probs, expected, atol=1e-6)
+    
+    def test_policy_enumeration_cached(self):
+        """Test exhaustive policy enumeration follows product order and is cached."""
+        inf_config = InferenceConfig(use_gpu=False)
+        inference = VariationalMessagePassing(inf_config)
+        config = PolicyConfig(planning_horizon=3, policy_length=2, use_gpu=False)
+        efe_calculator = DiscreteExpectedFreeEnergy(config, inference)
+        
+        policies = efe_calculator.enumerate_policies(2)
+        assert [p.actions.tolist() for p in policies] == [[0, 0], [0, 1], [1, 0], [1, 1]]
+        assert all(p.horizon == 3 for p in policies)
+        
+        actions = efe_calculator._enumerate_policy_actions(2)
+        assert efe_calculator._enumerate_policy_actions(2) is actions
+        
+        # Mutating a returned policy must not corrupt the cache
+        policies[0].actions[0] = 1
+        assert efe_calculator._enumerate_policy_actions(2)[0].tolist() == [0, 0]
+    
+    def test_state_entropy_cached_per_model(self, pymdp_compatible_model):
+        """Test H[A[:, s]] is cached on the model's A even when A is converted per call."""
+        inf_config = InferenceConfig(use_gpu=False)
+        inference = VariationalMessagePassing(inf_config)
+        # float64 makes _get_pymdp_matrices return a fresh copy of A every call
+        config = PolicyConfig(
+            planning_horizon=2,
+            policy_length=1,
+            use_gpu=False,
+            dtype=torch.float64
+        )
+        efe_calculator = DiscreteExpectedFreeEnergy(config, inference)
+        model = pymdp_compatible_model
+        
+        A = efe_calculator._get_pymdp_matrices(model)[0]
+        assert efe_calculator._get_pymdp_matrices(model)[0] is not A
+        H = efe_calculator._state_entropy(model, A)
+        A_again = efe_calculator._get_pymdp_matrices(model)[0]
+        assert efe_calculator._state_entropy(model, A_again) is H
+        assert torch.allclose(H, -(A * torch.log(A + config.eps)).sum(0))
+        
+        # In-place edits to the model's A invalidate the cache
+        model.A[:, 0] = torch.tensor([0.5, 0.5, 0.0])
+        A_edited = efe_calculator._get_pymdp_matrices(model)[0]
+        H_edited = efe_calculator._state_entropy(model, A_edited)
+        assert H_edited is not H
+        assert torch.allclose(H_edited, -(A_edited * torch.log(A_edited + config.eps)).sum(0))
+    
     def test_gnn_llm_model_integration(self, pymdp_efe_calculator):
         """Test integration with LLM-generated models following GNN notation."""
         # Mock LLM-generated model following GNN specification
@@ -657,6 +781,141 @@ class TestPyMDPPolicySelectionIntegration:
         assert llm_model.gnn_metadata["task_description"] == "Simple grid world navigation"
 
 
+class TestHierarchicalPolicySelector:
+    """Test hierarchical policy selection across levels."""
+    
+    def test_levels_selected_independently(self):
+        """Test concurrent level selection matches selecting each level alone."""
+        inf_config = InferenceConfig(use_gpu=False)
+        inference = VariationalMessagePassing(inf_config)
+        dims = ModelDimensions(num_states=4, num_observations=3, num_actions=2)
+        params = ModelParameters(use_gpu=False)
+        
+        level_selectors = [
+            DiscreteExpectedFreeEnergy(
+                PolicyConfig(policy_length=length, planning_horizon=3, use_gpu=False), inference
+            )
+            for length in (1, 2, 3)
+        ]
+        models = [DiscreteGenerativeModel(dims, params) for _ in level_selectors]
+        beliefs = [torch.tensor([0.4, 0.3, 0.2, 0.1]) for _ in level_selectors]
+        preferences = [torch.tensor([0.0, 1.0, -1.0]) for _ in level_selectors]
+        
+        selector = HierarchicalPolicySelector(
+            PolicyConfig(use_gpu=False), level_selectors, [1, 2, 3]
+        )
+        policies, all_probs = selector.select_policy(beliefs, models, preferences)
+        
+        assert [len(policy) for policy in policies] == [1, 2, 3]
+        for level, level_selector in enumerate(level_selectors):
+            expected_policy, expected_probs = level_selector.select_policy(
+                beliefs[level], models[level], preferences[level]
+            )
+            assert torch.equal(policies[level].actions, expected_policy.actions)
+            assert torch.allclose(all_probs[level], expected_probs)
+    
+    def test_worker_threads_created_lazily_and_closed(self):
+        """Test the thread pool starts on first selection and stops on close."""
+        inf_config = InferenceConfig(use_gpu=False)
+        inference = VariationalMessagePassing(inf_config)
+        dims = ModelDimensions(num_states=4, num_observations=3, num_actions=2)
+        params = ModelParameters(use_gpu=False)
+        level_selectors = [
+            DiscreteExpectedFreeEnergy(PolicyConfig(policy_length=1, use_gpu=False), inference)
+            for _ in range(2)
+        ]
+        models = [DiscreteGenerativeModel(dims, params) for _ in level_selectors]
+        beliefs = [torch.tensor([0.4, 0.3, 0.2, 0.1]) for _ in level_selectors]
+        
+        with HierarchicalPolicySelector(
+            PolicyConfig(use_gpu=False), level_selectors, [1, 1]
+        ) as selector:
+            assert selector._executor is None
+            selector.select_policy(beliefs, models)
+            executor = selector._executor
+            assert executor is not None
+        assert selector._executor is None
+        with pytest.raises(RuntimeError):
+            executor.submit(int)
+    
+    def test_shared_level_selector_runs_sequentially(self):
+        """Test levels sharing one selector object are not selected concurrently."""
+        inf_config = InferenceConfig(use_gpu=False)
+        inference = VariationalMessagePassing(inf_config)
+        dims = ModelDimensions(num_states=4, num_observations=3, num_actions=2)
+        params = ModelParameters(use_gpu=False)
+        shared = DiscreteExpectedFreeEnergy(
+            PolicyConfig(policy_length=2, use_gpu=False), inference
+        )
+        models = [DiscreteGenerativeModel(dims, params) for _ in range(3)]
+        beliefs = [torch.tensor([0.4, 0.3, 0.2, 0.1]) for _ in range(3)]
+        
+        selector = HierarchicalPolicySelector(
+            PolicyConfig(use_gpu=False), [shared, shared, shared], [2, 2, 2]
+        )
+        assert selector._level_groups() == [[0, 1, 2]]
+        policies, all_probs = selector.select_policy(beliefs, models)
+        
+        assert selector._executor is None
+        for level in range(3):
+            expected_policy, expected_probs = shared.select_policy(beliefs[level], models[level])
+            assert torch.equal(policies[level].actions, expected_policy.actions)
+            assert torch.allclose(all_probs[level], expected_probs)
+
+
+class TestSophisticatedInference:
+    """Test sophisticated inference refinement on top of a base selector."""
+    
+    def test_base_selection_memoized_for_repeated_beliefs(self, model_dimensions):
+        """Test identical beliefs during refinement reuse the base selection."""
+        inf_config = InferenceConfig(use_gpu=False)
+        inference = VariationalMessagePassing(inf_config)
+        config = PolicyConfig(use_gpu=False, meta_cognitive_depth=3)
+        base_selector = DiscreteExpectedFreeEnergy(config, inference)
+        selector = SophisticatedInference(config, inference, base_selector)
+        
+        # Non-discrete model: refinement keeps beliefs unchanged at every step
+        model = Mock(spec=["dims"])
+        model.dims = model_dimensions
+        beliefs = torch.ones(model_dimensions.num_states) / model_dimensions.num_states
+        preferences = torch.zeros(model_dimensions.num_observations)
+        
+        with patch.object(
+            base_selector, "select_policy", wraps=base_selector.select_policy
+        ) as spy:
+            policy, _ = selector.select_policy(beliefs, model, preferences)
+            selector._sophisticated_refinement(
+                Policy([0, 1, 0]), beliefs, model, preferences
+            )
+        
+        assert isinstance(policy, Policy)
+        assert spy.call_count == 1
+    
+    def test_random_policy_subset_not_memoized(self, model_dimensions):
+        """Test a base selector drawing random policy subsets is re-run every time."""
+        inf_config = InferenceConfig(use_gpu=False)
+        inference = VariationalMessagePassing(inf_config)
+        config = PolicyConfig(use_gpu=False, meta_cognitive_depth=3, num_policies=2)
+        base_selector = DiscreteExpectedFreeEnergy(config, inference)
+        selector = SophisticatedInference(config, inference, base_selector)
+        
+        model = Mock(spec=["dims"])
+        model.dims = model_dimensions
+        beliefs = torch.ones(model_dimensions.num_states) / model_dimensions.num_states
+        preferences = torch.zeros(model_dimensions.num_observations)
+        
+        with patch.object(
+            base_selector, "select_policy", wraps=base_selector.select_policy
+        ) as spy:
+            selector.select_policy(beliefs, model, preferences)
+            selector._sophisticated_refinement(
+                Policy([0, 1, 0]), beliefs, model, preferences
+            )
+        
+        assert spy.call_count > 1
+        assert not selector._select_cache
+
+
 class TestPolicySelectionFactory:
     """Test factory function for creating PyMDP-compatible policy selectors."""
     
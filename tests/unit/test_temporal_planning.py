@@ -2,6 +2,8 @@
 Module for FreeAgentics Active Inference implementation.
 """
 
+from unittest.mock import patch
+
 import numpy as np
 import pytest
 import torch
@@ -21,6 +23,7 @@ from inference.engine.temporal_planning import (
     PlanningConfig,
     TrajectorySampling,
     TreeNode,
+    TreeStore,
     create_temporal_planner,
 )
 
@@ -169,52 +172,89 @@ class TestMonteCarloTreeSearch:
 
     def test_tree_expansion(self) -> None:
         """Test tree expansion in MCTS"""
-        root = TreeNode(torch.tensor([1.0, 0.0, 0.0]), depth=0)
+        tree = TreeStore(4, torch.tensor([1.0, 0.0, 0.0]), num_actions=2)
         # Expand should add a child
-        child = self.planner._expand(root, self.model)
-        assert len(root.children) == 1
-        assert child.parent == root
-        assert child.action in [0, 1]
-        assert child.depth == 1
+        child = self.planner._expand(tree, 0, self.model)
+        assert tree.num_children[0] == 1
+        assert tree.parent[child] == 0
+        assert tree.action[child] in [0, 1]
+        assert tree.depth[child] == 1
 
     def test_simulation_rollout(self) -> None:
         """Test simulation phase"""
-        node = TreeNode(torch.tensor([0.33, 0.33, 0.34]), depth=1)
-        value = self.planner._simulate(node, self.model)
+        tree = TreeStore(2, torch.tensor([1.0, 0.0, 0.0]), num_actions=2)
+        node = tree.add(torch.tensor([0.33, 0.33, 0.34]), parent=0, action=0)
+        value = self.planner._simulate(tree, node, self.model)
         assert isinstance(value, float)
         assert not np.isnan(value)
         assert not np.isinf(value)
 
     def test_backpropagation(self) -> None:
         """Test value backpropagation"""
-        root = TreeNode(torch.tensor([1.0, 0.0, 0.0]), depth=0)
-        child = TreeNode(torch.tensor([0.0, 1.0, 0.0]), action=1, parent=root, depth=1)
-        root.add_child(child)
+        tree = TreeStore(2, torch.tensor([1.0, 0.0, 0.0]), num_actions=2)
+        child = tree.add(torch.tensor([0.0, 1.0, 0.0]), parent=0, action=1)
         # Backpropagate value
         value = 5.0
-        self.planner._backpropagate(child, value)
-        assert child.visits == 1
-        assert child.value == value
-        assert root.visits == 1
-        assert root.value == value
+        self.planner._backpropagate(tree, child, value)
+        assert tree.visits[child] == 1
+        assert tree.value[child] == value
+        assert tree.visits[0] == 1
+        assert tree.value[0] == value
 
     def test_policy_extraction(self) -> None:
         """Test extracting policy from tree"""
         # Build a simple tree
-        root = TreeNode(torch.tensor([1.0, 0.0, 0.0]), depth=0)
-        child1 = TreeNode(torch.tensor([0.0, 1.0, 0.0]), action=1, parent=root, depth=1)
-        child1.visits = 10
-        child2 = TreeNode(torch.tensor([1.0, 0.0, 0.0]), action=0, parent=root, depth=1)
-        child2.visits = 5
-        root.add_child(child1)
-        root.add_child(child2)
-        grandchild = TreeNode(torch.tensor([0.0, 0.0, 1.0]), action=1, parent=child1, depth=2)
-        grandchild.visits = 8
-        child1.add_child(grandchild)
+        tree = TreeStore(4, torch.tensor([1.0, 0.0, 0.0]), num_actions=2)
+        child1 = tree.add(torch.tensor([0.0, 1.0, 0.0]), parent=0, action=1)
+        tree.visits[child1] = 10
+        child2 = tree.add(torch.tensor([1.0, 0.0, 0.0]), parent=0, action=0)
+        tree.visits[child2] = 5
+        grandchild = tree.add(torch.tensor([0.0, 0.0, 1.0]), parent=child1, action=1)
+        tree.visits[grandchild] = 8
         # Extract policy (should follow most visited path)
-        policy = self.planner._extract_policy(root)
+        policy = self.planner._extract_policy(tree)
         assert len(policy) >= 1
-        assert policy[0].item() == 1  # child1 has more visits
+        assert int(policy[0]) == 1  # child1 has more visits
+
+    def test_best_child_kernel_matches_numpy(self) -> None:
+        """Test the compiled UCB1 scan picks the same child as the NumPy path"""
+        pytest.importorskip("numba")
+        tree = TreeStore(8, torch.tensor([1.0, 0.0, 0.0]), num_actions=4)
+        for action in range(4):
+            tree.add(torch.tensor([0.0, 1.0, 0.0]), parent=0, action=action)
+        tree.visits[:5] = [9, 3, 2, 0, 4]
+        tree.efe[1:5] = [0.5, 0.1, np.inf, 0.2]
+        tree.pending[4] = 2
+        for visits in ([9, 3, 2, 1, 4], [9, 3, 2, 0, 4]):
+            tree.visits[:5] = visits
+            with patch("inference.engine.temporal_planning.NUMBA_AVAILABLE", False):
+                expected = tree.best_child(0, 1.0, 1.0)
+            assert tree.best_child(0, 1.0, 1.0) == expected
+
+    def test_batched_leaf_collection(self) -> None:
+        """Test virtual loss spreads one round over distinct leaves"""
+        tree = TreeStore(16, torch.tensor([1.0, 0.0, 0.0]), num_actions=2)
+        leaves = self.planner._collect_leaves(tree, self.model, batch_size=4)
+        assert len(leaves) == len(set(leaves))
+        assert tree.pending[0] == len(leaves)
+        values = self.planner._simulate_batch(tree, leaves, self.model)
+        assert len(values) == len(leaves)
+        for leaf, value in zip(leaves, values):
+            self.planner._apply_virtual_loss(tree, leaf, -1)
+            self.planner._backpropagate(tree, leaf, value)
+        assert tree.pending[0] == 0
+        assert tree.visits[0] == len(leaves)
+
+    def test_tree_reuse(self) -> None:
+        """Test planning from a predicted child state keeps its subtree"""
+        self.planner.plan(torch.tensor([1.0, 0.0, 0.0]), self.model)
+        tree = self.planner.tree
+        child = next(c for c in tree.child_ids(0) if tree.action[c] == 1)
+        reused_visits = tree.visits[child]
+        assert reused_visits > 0
+        # Action 1 rotates [1, 0, 0] to [0, 1, 0]
+        self.planner.plan(torch.tensor([0.0, 1.0, 0.0]), self.model)
+        assert self.planner.tree.visits[0] == reused_visits + self.config.num_simulations
 
     def test_node_limit(self) -> None:
         """Test node count limit"""
@@ -262,6 +302,16 @@ class TestBeamSearchPlanner:
         assert len(policy) <= self.config.planning_horizon
         assert all(a.item() in [0, 1] for a in policy.actions)
 
+    def test_compiled_kernels_match_eager(self) -> None:
+        """Test compiled belief propagation gives the same plan"""
+        beliefs = torch.tensor([0.33, 0.33, 0.34])
+        policy, value = self.planner.plan(beliefs, self.model)
+        self.config.compile_kernels = True
+        planner = BeamSearchPlanner(self.config, self.policy_selector, self.inference)
+        compiled_policy, compiled_value = planner.plan(beliefs, self.model)
+        assert compiled_policy.actions.tolist() == policy.actions.tolist()
+        assert compiled_value == pytest.approx(value, rel=1e-5)
+
     def test_early_convergence(self) -> None:
         """Test early stopping when beam converges"""
         # Start with deterministic state
@@ -310,6 +360,20 @@ class TestAStarPlanner:
         h_score_deep = self.planner._heuristic(beliefs, 3, self.model)
         assert h_score_deep <= h_score
 
+    def test_efe_cache(self) -> None:
+        """Test repeated one-step EFE evaluations are memoized"""
+        beliefs = torch.tensor([0.33, 0.33, 0.34])
+        with patch.object(
+            self.policy_selector,
+            "compute_expected_free_energy",
+            wraps=self.policy_selector.compute_expected_free_energy,
+        ) as compute:
+            first = self.planner._step_efe(beliefs, 1, self.model)
+            second = self.planner._step_efe(beliefs.clone(), 1, self.model)
+            self.planner._step_efe(beliefs, 0, self.model)
+        assert first == second
+        assert compute.call_count == 2
+
     def test_belief_hashing(self) -> None:
         """Test belief state hashing"""
         beliefs1 = torch.tensor([0.5, 0.5, 0.0])
@@ -321,6 +385,14 @@ class TestAStarPlanner:
         assert hash1 == hash2  # Same beliefs
         assert hash1 != hash3  # Different beliefs
 
+    def test_reduced_precision_hashing(self) -> None:
+        """Test bf16 beliefs differing by rounding jitter hash equally"""
+        beliefs = torch.tensor([0.2, 0.2, 0.6], dtype=torch.bfloat16)
+        jittered = beliefs + torch.tensor([1e-3, -1e-3, 0.0], dtype=torch.bfloat16)
+        other = torch.tensor([0.6, 0.2, 0.2], dtype=torch.bfloat16)
+        assert self.planner._hash_beliefs(beliefs) == self.planner._hash_beliefs(jittered)
+        assert self.planner._hash_beliefs(beliefs) != self.planner._hash_beliefs(other)
+
     def test_node_expansion_limit(self) -> None:
         """Test node expansion limit"""
         self.config.max_nodes = 10
@@ -330,6 +402,25 @@ class TestAStarPlanner:
         # Should still return a valid policy
         assert isinstance(policy.actions, torch.Tensor)
 
+    def test_incumbent_returned_at_node_limit(self) -> None:
+        """Test the best complete policy is returned when the node cap is hit"""
+        self.config.planning_horizon = 1
+        self.config.max_nodes = 1
+        self.planner = AStarPlanner(self.config, self.policy_selector, self.inference)
+        beliefs = torch.tensor([0.33, 0.33, 0.34])
+        policy, value = self.planner.plan(beliefs, self.model)
+        expected = min(self.planner._step_efe(beliefs, a, self.model) for a in range(2))
+        assert len(policy) == 1
+        assert value == pytest.approx(-expected)
+
+    def test_time_budget(self) -> None:
+        """Test an exhausted time budget stops the search"""
+        self.config.time_budget_s = 0.0
+        self.planner = AStarPlanner(self.config, self.policy_selector, self.inference)
+        beliefs = torch.tensor([0.33, 0.33, 0.34])
+        policy, value = self.planner.plan(beliefs, self.model)
+        assert len(policy) in (0, self.config.planning_horizon)
+
 
 class TestTrajectorySampling:
     """Test trajectory sampling planner"""
@@ -369,6 +460,14 @@ class TestTrajectorySampling:
             assert trajectory[i + 1].parent == trajectory[i]
             assert trajectory[i + 1].depth == trajectory[i].depth + 1
 
+    def test_batched_trajectories(self) -> None:
+        """Test trajectories are sampled in lockstep"""
+        beliefs = torch.tensor([0.33, 0.33, 0.34])
+        actions, values = self.planner._sample_trajectories_batched(beliefs, self.model, None, 4)
+        assert actions.shape == (4, min(self.config.planning_horizon, self.config.max_depth))
+        assert values.shape == (4,)
+        assert all(a in [0, 1] for a in actions.flatten().tolist())
+
     def test_trajectory_evaluation(self) -> None:
         """Test trajectory evaluation"""
         # Create a simple trajectory